@@ -0,0 +1,206 @@
+# agendador.py
+# Agendador das sincronizações com a FUNCEME, executado fora do caminho das requisições.
+# Cada worker do gunicorn inicia o agendador no lifespan, mas só o líder (quem obtém o advisory lock
+# do Postgres, ou o lock de arquivo em outros bancos) cria e executa os jobs. A tabela execucao_job
+# funciona como fila: a API apenas enfileira e o líder consome.
+import asyncio
+import fcntl
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import select, update, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import engine, AsyncSessionLocal
+
+AGENDADOR_HABILITADO = os.getenv("AGENDADOR_HABILITADO", "1") == "1"
+AGENDADOR_INTERVALO_MINUTOS = float(os.getenv("AGENDADOR_INTERVALO_MINUTOS", "360"))
+AGENDADOR_POLL_SEGUNDOS = float(os.getenv("AGENDADOR_POLL_SEGUNDOS", "5"))
+AGENDADOR_LOCK_ID = int(os.getenv("AGENDADOR_LOCK_ID", "7320061"))
+AGENDADOR_LOCK_ARQUIVO = os.getenv("AGENDADOR_LOCK_ARQUIVO", "/tmp/dashboard-agendador.lock")
+
+JOB_FUNCEME = "funceme"
+PENDENTE, EXECUTANDO, SUCESSO, ERRO = "pendente", "executando", "sucesso", "erro"
+# Sincronização em que parte dos reservatórios falhou (todos falhando é ERRO)
+PARCIAL = "parcial"
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enfileirar(db: AsyncSession, origem: str, reservatorio_id: Optional[int] = None) -> models.ExecucaoJob:
+    """Cria um job pendente de sincronização e retorna imediatamente."""
+    job = models.ExecucaoJob(tipo=JOB_FUNCEME, origem=origem, reservatorio_id=reservatorio_id,
+                             status=PENDENTE, criado_em=_agora())
+    db.add(job)
+    await db.commit()
+    return job
+
+
+async def get_job(db: AsyncSession, job_id: int) -> Optional[models.ExecucaoJob]:
+    result = await db.execute(select(models.ExecucaoJob).where(models.ExecucaoJob.id == job_id))
+    return result.scalars().first()
+
+
+async def get_ultimas_execucoes(db: AsyncSession, limite: int = 20) -> List[models.ExecucaoJob]:
+    result = await db.execute(select(models.ExecucaoJob).order_by(models.ExecucaoJob.id.desc()).limit(limite))
+    return result.scalars().all()
+
+
+async def contar_pendentes(db: AsyncSession) -> int:
+    result = await db.execute(select(func.count(models.ExecucaoJob.id)).where(models.ExecucaoJob.status == PENDENTE))
+    return result.scalar() or 0
+
+
+class Agendador:
+    def __init__(self):
+        self.lider = False
+        self._tarefa: Optional[asyncio.Task] = None
+        self._conexao_lock = None
+        self._arquivo_lock = None
+
+    def iniciar(self) -> None:
+        if AGENDADOR_HABILITADO and self._tarefa is None:
+            self._tarefa = asyncio.create_task(self._loop())
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        await self._liberar_lideranca()
+
+    async def _tentar_liderar(self) -> bool:
+        """Eleição de líder: advisory lock de sessão no Postgres; lock exclusivo de arquivo nos demais bancos."""
+        if engine.dialect.name == "postgresql":
+            conexao = await engine.connect()
+            # Fora de transação, para a conexão que segura o lock não ficar "idle in transaction"
+            conexao = await conexao.execution_options(isolation_level="AUTOCOMMIT")
+            obtido = (await conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"),
+                                            {"chave": AGENDADOR_LOCK_ID})).scalar()
+            if obtido:
+                self._conexao_lock = conexao
+            else:
+                await conexao.close()
+            return bool(obtido)
+
+        arquivo = open(AGENDADOR_LOCK_ARQUIVO, "w")
+        try:
+            fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+        self._arquivo_lock = arquivo
+        return True
+
+    async def _lideranca_ativa(self) -> bool:
+        """Confere se a conexão que segura o advisory lock continua viva."""
+        if self._conexao_lock is None:
+            return self._arquivo_lock is not None
+        try:
+            await self._conexao_lock.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            await self._liberar_lideranca()
+            return False
+
+    async def _liberar_lideranca(self) -> None:
+        if self._conexao_lock is not None:
+            try:
+                await self._conexao_lock.close()
+            except Exception:
+                pass
+            self._conexao_lock = None
+        if self._arquivo_lock is not None:
+            self._arquivo_lock.close()
+            self._arquivo_lock = None
+        self.lider = False
+
+    async def _enfileirar_periodico(self, db: AsyncSession) -> None:
+        """Enfileira a sincronização de todos os reservatórios quando o intervalo configurado já passou."""
+        result = await db.execute(
+            select(func.max(models.ExecucaoJob.criado_em)).where(models.ExecucaoJob.origem == "agendador")
+        )
+        ultima = result.scalar()
+        if ultima is not None and ultima.tzinfo is None:
+            ultima = ultima.replace(tzinfo=timezone.utc)
+        if ultima is None or _agora() - ultima >= timedelta(minutes=AGENDADOR_INTERVALO_MINUTOS):
+            await enfileirar(db, origem="agendador")
+
+    async def _encerrar_interrompidos(self, db: AsyncSession) -> None:
+        """Jobs que ficaram em execução quando o líder anterior caiu são marcados como erro."""
+        await db.execute(
+            update(models.ExecucaoJob)
+            .where(models.ExecucaoJob.status == EXECUTANDO)
+            .values(status=ERRO, finalizado_em=_agora(), mensagem="Execução interrompida (troca de líder).")
+        )
+        await db.commit()
+
+    async def _executar_pendentes(self, db: AsyncSession) -> None:
+        result = await db.execute(
+            select(models.ExecucaoJob.id).where(models.ExecucaoJob.status == PENDENTE).order_by(models.ExecucaoJob.id)
+        )
+        for job_id in result.scalars().all():
+            await self._executar(db, job_id)
+
+    async def _executar(self, db: AsyncSession, job_id: int) -> None:
+        reservado = await db.execute(
+            update(models.ExecucaoJob)
+            .where(models.ExecucaoJob.id == job_id, models.ExecucaoJob.status == PENDENTE)
+            .values(status=EXECUTANDO, iniciado_em=_agora())
+        )
+        await db.commit()
+        if reservado.rowcount == 0:
+            return
+
+        job = await get_job(db, job_id)
+        inicio = time.monotonic()
+        try:
+            # Importado só aqui: o cliente HTTP da sincronização não pesa na inicialização dos workers
+            import funceme
+
+            ids = [job.reservatorio_id] if job.reservatorio_id else None
+            resultados = await funceme.sincronizar_todos(reservatorio_ids=ids)
+            falhas = sum(1 for r in resultados if r["erro"])
+            job.status = SUCESSO if not falhas else ERRO if falhas == len(resultados) else PARCIAL
+            job.registros_inseridos = sum(r["novos_registros"] for r in resultados)
+            job.mensagem = "\n".join(r["status"] for r in resultados)
+        except Exception as e:
+            job.status = ERRO
+            job.mensagem = f"{e.__class__.__name__}: {e}"
+        job.finalizado_em = _agora()
+        job.duracao_segundos = round(time.monotonic() - inicio, 3)
+        await db.commit()
+        print(f"🕒 Job {job.id} ({job.origem}) finalizado: {job.status}, "
+              f"{job.registros_inseridos or 0} registros em {job.duracao_segundos}s")
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if not self.lider:
+                    self.lider = await self._tentar_liderar()
+                    if self.lider:
+                        print(f"🕒 Agendador ativo neste worker (pid {os.getpid()}).")
+                        async with AsyncSessionLocal() as db:
+                            await self._encerrar_interrompidos(db)
+                elif not await self._lideranca_ativa():
+                    print("⚠️ Agendador perdeu a liderança.")
+                if self.lider:
+                    async with AsyncSessionLocal() as db:
+                        await self._enfileirar_periodico(db)
+                        await self._executar_pendentes(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ ERRO no agendador: {e}")
+            await asyncio.sleep(AGENDADOR_POLL_SEGUNDOS)
+
+
+agendador = Agendador()
@@ -0,0 +1,241 @@
+# benchmarks/bench_api.py
+# Benchmark de carga de todos os endpoints GET da API sobre um banco sintético (ver sintetico.py).
+# Para cada endpoint dispara N requisições com C requisições simultâneas e reporta latência p50/p95/p99,
+# vazão e memória (RSS atual e pico). Dois modos:
+#   asgi  cliente httpx em processo, direto na aplicação (sem rede; mede a aplicação e o banco)
+#   http  gerador de carga HTTP contra um servidor uvicorn iniciado pelo próprio script (ou --url externo)
+# O resultado pode ser salvo como baseline e comparado em execuções futuras; a comparação falha (código 1)
+# se o p95 de algum endpoint piorar além da tolerância. Os tempos são absolutos e só valem para a máquina
+# que os mediu: o baseline é gerado localmente (em .cache/, fora do repositório) antes da mudança avaliada.
+#
+# Uso:
+#   python benchmarks/bench_api.py --popular --salvar-baseline .cache/baseline.json
+#   python benchmarks/bench_api.py --comparar .cache/baseline.json
+#   python benchmarks/bench_api.py --modo http --requisicoes 500 --concorrencia 32
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.makedirs(os.path.join(RAIZ, ".cache"), exist_ok=True)
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(RAIZ, '.cache', 'bench.db')}")
+# O agendador não deve sincronizar com a FUNCEME durante o benchmark
+os.environ.setdefault("AGENDADOR_HABILITADO", "0")
+
+import httpx  # noqa: E402
+
+# Variações de consulta exercitadas além da chamada sem parâmetros
+VARIACOES = {
+    "/api/reservatorios/{reservatorio_id}/history": [
+        "", "?limit=365", "?format=columnar", "?resolution=monthly", "?max_points=500"],
+    "/api/reservatorios/{reservatorio_id}/chart/volume-data": [
+        "", "?format=columnar", "?resolution=weekly&aggregate=max", "?max_points=500"],
+    "/api/reservatorios/{reservatorio_id}/action-plans": ["", "?estado=SECA&situacao=Em%20andamento"],
+    "/api/reservatorios/{reservatorio_id}/action-plans/facets": ["", "?estado=SECA&estado=ALERTA"],
+    "/api/reservatorios/{reservatorio_id}/history/export": ["?format=ndjson", "?format=csv"],
+    "/api/dashboard/overview": ["", "?estado=SECA"],
+    "/api/action-plans/search": ["?q=acao", "?q=descricao%20problema&limit=50"],
+    "/api/map/reservatorios": ["", "?format=columnar", "?bbox=-40,-6,-38,-3", "?lat=-5&lon=-39.5&k=5"],
+}
+# Exportações transferem o histórico inteiro: medidas com uma fração das requisições
+FRACAO_EXPORTACAO = 0.1
+# Endpoints que não fazem sentido em carga (dependem de ids de jobs criados por POST)
+IGNORADOS = {"/api/jobs/{job_id}"}
+
+
+def _rotas_get() -> List[str]:
+    """Caminhos GET declarados em main.py (sem os arquivos estáticos e a documentação)."""
+    from fastapi.routing import APIRoute
+    from main import app
+
+    return [r.path for r in app.routes
+            if isinstance(r, APIRoute) and "GET" in r.methods and r.path not in IGNORADOS]
+
+
+def _casos(rotas: List[str]) -> List[str]:
+    casos = []
+    for rota in rotas:
+        for consulta in VARIACOES.get(rota, [""]):
+            casos.append(rota + consulta)
+    return casos
+
+
+def _url(caso: str, reservatorio_id: int) -> str:
+    return caso.replace("{reservatorio_id}", str(reservatorio_id))
+
+
+def _rss_kb(pid: Optional[int] = None) -> Dict[str, int]:
+    """RSS atual e pico (VmHWM) do processo, em KB."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as status:
+            campos = dict(linha.split(":", 1) for linha in status if ":" in linha)
+        return {"rss": int(campos["VmRSS"].split()[0]), "pico": int(campos["VmHWM"].split()[0])}
+    except OSError:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss": pico, "pico": pico}
+
+
+async def _carga(cliente: httpx.AsyncClient, caso: str, ids: List[int], requisicoes: int,
+                 concorrencia: int) -> dict:
+    """Dispara `requisicoes` chamadas do caso, alternando os reservatórios, com `concorrencia` em voo."""
+    latencias, erros = [], 0
+    fila = iter(range(requisicoes))
+
+    async def trabalhador():
+        nonlocal erros
+        for i in fila:
+            inicio = time.perf_counter()
+            resposta = await cliente.get(_url(caso, ids[i % len(ids)]))
+            await resposta.aread()
+            latencias.append(time.perf_counter() - inicio)
+            if resposta.status_code >= 400:
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[trabalhador() for _ in range(concorrencia)])
+    duracao = time.perf_counter() - inicio
+    ms = np.array(latencias) * 1000
+    return {
+        "requisicoes": requisicoes,
+        "erros": erros,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "req_s": round(requisicoes / duracao, 1),
+    }
+
+
+async def _ids_reservatorios(cliente: httpx.AsyncClient) -> List[int]:
+    resposta = await cliente.get("/api/reservatorios")
+    return [r["id"] for r in resposta.json()] or [1]
+
+
+async def _executar(cliente: httpx.AsyncClient, casos: List[str], requisicoes: int, concorrencia: int,
+                    pid: Optional[int], largura: int) -> Dict[str, dict]:
+    ids = await _ids_reservatorios(cliente)
+    resultados = {}
+    for caso in casos:
+        # Aquecimento: uma chamada por reservatório (conexões do pool, imports tardios)
+        for rid in ids:
+            await cliente.get(_url(caso, rid))
+        total = max(concorrencia, int(requisicoes * FRACAO_EXPORTACAO)) if "/export" in caso else requisicoes
+        resultado = await _carga(cliente, caso, ids, total, concorrencia)
+        resultado.update({f"{k}_kb": v for k, v in _rss_kb(pid).items()})
+        resultados[caso] = resultado
+        print(f"{caso:<{largura}} {resultado['p50_ms']:8.1f} {resultado['p95_ms']:8.1f} {resultado['p99_ms']:8.1f} "
+              f"{resultado['req_s']:8.1f} {resultado['rss_kb'] / 1024:8.1f} {resultado['pico_kb'] / 1024:8.1f}"
+              + (f"  ⚠️ {resultado['erros']} erro(s)" if resultado["erros"] else ""))
+    return resultados
+
+
+def _iniciar_servidor(porta: int) -> subprocess.Popen:
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(porta),
+         "--log-level", "warning"],
+        cwd=RAIZ, env=os.environ.copy(),
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{porta}/", timeout=1)
+            return processo
+        except httpx.TransportError:
+            time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError("O servidor uvicorn não respondeu a tempo.")
+
+
+def comparar(resultados: Dict[str, dict], baseline: Dict[str, dict], tolerancia: float) -> List[str]:
+    """Casos cujo p95 ficou mais de `tolerancia` (fração) acima do baseline, ignorando variações abaixo de 2 ms."""
+    regressoes = []
+    for caso, atual in resultados.items():
+        anterior = baseline.get(caso)
+        if not anterior:
+            continue
+        limite = max(anterior["p95_ms"] * (1 + tolerancia), anterior["p95_ms"] + 2)
+        if atual["p95_ms"] > limite:
+            regressoes.append(f"{caso}: p95 {anterior['p95_ms']} -> {atual['p95_ms']} ms")
+    return regressoes
+
+
+async def main(args) -> int:
+    if args.popular:
+        from benchmarks import sintetico
+        await sintetico.popular(args.reservatorios, args.anos)
+        print(f"✅ Banco sintético: {args.reservatorios} reservatórios x {args.anos} anos")
+
+    casos = _casos(_rotas_get())
+    if args.filtro:
+        casos = [c for c in casos if re.search(args.filtro, c)]
+
+    print(f"📊 modo={args.modo} requisições={args.requisicoes} concorrência={args.concorrencia} "
+          f"cache={'desligado' if args.sem_cache else 'ligado'}")
+    largura = max(len(c) for c in casos)
+    print(f"{'endpoint':<{largura}} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'RSS MB':>8} {'pico MB':>8}")
+
+    servidor = None
+    if args.modo == "asgi":
+        from main import app
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as cliente:
+                resultados = await _executar(cliente, casos, args.requisicoes, args.concorrencia, None,
+                                             largura)
+    else:
+        url, pid = args.url, None
+        if not url:
+            servidor = _iniciar_servidor(args.porta)
+            url, pid = f"http://127.0.0.1:{args.porta}", servidor.pid
+        limites = httpx.Limits(max_connections=args.concorrencia, max_keepalive_connections=args.concorrencia)
+        try:
+            async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+                resultados = await _executar(cliente, casos, args.requisicoes, args.concorrencia, pid, largura)
+        finally:
+            if servidor is not None:
+                servidor.terminate()
+                servidor.wait()
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w") as arquivo:
+            json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline salvo em {args.salvar_baseline}")
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo), args.tolerancia)
+        if regressoes:
+            print("❌ Regressões de latência (p95):")
+            for regressao in regressoes:
+                print(f"   {regressao}")
+            return 1
+        print(f"✅ Nenhuma regressão acima de {args.tolerancia:.0%} em relação ao baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de carga dos endpoints da API.")
+    parser.add_argument("--modo", choices=["asgi", "http"], default="asgi")
+    parser.add_argument("--url", help="servidor já em execução (modo http); sem ele, um uvicorn é iniciado")
+    parser.add_argument("--porta", type=int, default=8799)
+    parser.add_argument("--requisicoes", type=int, default=200, help="requisições por endpoint")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--filtro", help="regex para limitar os endpoints medidos")
+    parser.add_argument("--sem-cache", action="store_true", help="desliga o cache de respostas (mede o banco)")
+    parser.add_argument("--popular", action="store_true", help="recria o banco sintético antes de medir")
+    parser.add_argument("--reservatorios", type=int, default=10)
+    parser.add_argument("--anos", type=int, default=20)
+    parser.add_argument("--salvar-baseline", metavar="ARQUIVO")
+    parser.add_argument("--comparar", metavar="ARQUIVO", help="baseline para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="piora aceita no p95 (fração)")
+    args = parser.parse_args()
+    if args.sem_cache:
+        # Precisa estar no ambiente antes de importar a aplicação (e do uvicorn iniciado no modo http)
+        os.environ["CACHE_MAX_ITENS"] = "0"
+    sys.exit(asyncio.run(main(args)))
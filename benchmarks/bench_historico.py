@@ -0,0 +1,113 @@
+# benchmarks/bench_historico.py
+# Compara, numa série sintética de 50 mil leituras, a classificação do histórico feita a partir de objetos do
+# ORM + pd.merge (caminho antigo) com a leitura colunar do crud (tuplas -> arrays NumPy + metas indexadas por mês).
+# Mede tempo (mediana de N execuções) e pico de memória alocada (tracemalloc, numa execução separada) por chamada.
+#
+# Uso: DATABASE_URL=sqlite+aiosqlite:// python benchmarks/bench_historico.py [--linhas 50000] [--repeticoes 5]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+import crud  # noqa: E402
+import models  # noqa: E402
+from database import engine, Base, AsyncSessionLocal  # noqa: E402
+
+RESERVATORIO_ID = 1
+
+
+async def popular(linhas: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    rng = np.random.default_rng(42)
+    volumes = np.clip(50 + np.cumsum(rng.normal(0, 0.8, linhas)), 0, 100)
+    inicio = date(1960, 1, 1)
+    async with AsyncSessionLocal() as db:
+        db.add(models.Reservatorio(id=RESERVATORIO_ID, nome="Sintético"))
+        await db.execute(insert(models.VolumeMeta), [
+            {"mes_num": m, "mes_nome": str(m), "meta1v": 0.1 + m / 200, "meta2v": 0.3 + m / 200,
+             "meta3v": 0.5 + m / 200, "reservatorio_id": RESERVATORIO_ID} for m in range(1, 13)])
+        await db.execute(insert(models.Monitoramento), [
+            {"data": inicio + timedelta(days=i), "volume_hm3": float(v) * 3, "volume_percentual": float(v),
+             "reservatorio_id": RESERVATORIO_ID} for i, v in enumerate(volumes)])
+        await db.commit()
+
+
+async def classificar_orm(db) -> pd.DataFrame:
+    """Caminho antigo: instâncias do ORM, DataFrame a partir de __dict__ e pd.merge com as metas."""
+    monitoramento = (await db.execute(
+        select(models.Monitoramento).where(models.Monitoramento.reservatorio_id == RESERVATORIO_ID)
+        .order_by(models.Monitoramento.data))).scalars().all()
+    metas = (await db.execute(
+        select(models.VolumeMeta).where(models.VolumeMeta.reservatorio_id == RESERVATORIO_ID))).scalars().all()
+    df_monitoramento = pd.DataFrame([m.__dict__ for m in monitoramento])
+    df_metas = pd.DataFrame([m.__dict__ for m in metas])
+    df_monitoramento['mes_num'] = pd.to_datetime(df_monitoramento['data']).dt.month
+    df = pd.merge(df_monitoramento, df_metas[['mes_num', 'meta1v', 'meta2v', 'meta3v']], on='mes_num', how='left')
+    df['volume_percentual'] = pd.to_numeric(df['volume_percentual'], errors='coerce').fillna(0) / 100
+    condicoes = [df['volume_percentual'] < df['meta1v'], df['volume_percentual'] < df['meta2v'],
+                 df['volume_percentual'] < df['meta3v']]
+    df['estado_calculado'] = np.select(condicoes, ["SECA SEVERA", "SECA", "ALERTA"], default='NORMAL')
+    db.expunge_all()
+    return df
+
+
+async def classificar_colunar(db) -> dict:
+    """Caminho atual do crud: colunas como tuplas -> arrays e metas por indexação do array 12x3."""
+    leituras = await crud.get_monitoring_columns(db, RESERVATORIO_ID)
+    metas = await crud.get_metas_por_mes(db, RESERVATORIO_ID)
+    return crud._calcular_periodos(crud._classificar_historico(leituras, metas))
+
+
+async def ler_historico(db) -> pd.DataFrame:
+    """Leitura do histórico materializado, como nos endpoints de histórico e gráfico."""
+    return await crud.get_history_with_status(db, RESERVATORIO_ID)
+
+
+async def medir(nome: str, funcao, repeticoes: int) -> None:
+    tempos = []
+    async with AsyncSessionLocal() as db:
+        await funcao(db)  # aquecimento
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            await funcao(db)
+            tempos.append(time.perf_counter() - inicio)
+        # Memória medida numa execução à parte: o tracemalloc deixa o código bem mais lento
+        tracemalloc.start()
+        await funcao(db)
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(f"{nome:<28} {statistics.median(tempos) * 1000:9.1f} ms {pico / 2 ** 20:9.1f} MB")
+
+
+async def main(linhas: int, repeticoes: int) -> None:
+    await popular(linhas)
+    async with AsyncSessionLocal() as db:
+        await crud.rebuild_history_status(db, RESERVATORIO_ID)
+        await db.commit()
+    print(f"📊 {linhas} leituras, tempo mediano de {repeticoes} execuções, pico de memória via tracemalloc")
+    print(f"{'caminho':<28} {'tempo':>12} {'memória':>12}")
+    await medir("classificação ORM + merge", classificar_orm, repeticoes)
+    await medir("classificação colunar", classificar_colunar, repeticoes)
+    await medir("leitura do histórico", ler_historico, repeticoes)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da classificação e leitura do histórico.")
+    parser.add_argument("--linhas", type=int, default=50_000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.linhas, args.repeticoes))
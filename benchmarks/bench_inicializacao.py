@@ -0,0 +1,131 @@
+# benchmarks/bench_inicializacao.py
+# Tempo de inicialização e memória por worker da aplicação sob o gunicorn, como no Procfile.
+# Mede o tempo de `import main`, o tempo até todos os workers concluírem o lifespan e a memória de cada
+# processo (RSS, PSS e USS, lidos de /proc/<pid>/smaps_rollup) logo após subir e depois de uma carga de
+# aquecimento que passa pelos endpoints de histórico e gráfico (os que carregam pandas).
+# O PSS divide as páginas compartilhadas entre os processos que as usam: a soma do PSS é a memória real
+# do conjunto; o USS é o que cada worker tem só para si.
+#
+# Uso (banco sintético de bench_api.py):
+#   python benchmarks/bench_inicializacao.py --workers 4
+#   python benchmarks/bench_inicializacao.py --workers 4 --preload
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(RAIZ, '.cache', 'bench.db')}")
+os.environ.setdefault("AGENDADOR_HABILITADO", "0")
+# Com vários workers disputando a CPU o log de consultas lentas só polui a saída
+os.environ.setdefault("METRICAS_CONSULTA_LENTA_MS", "60000")
+
+import httpx  # noqa: E402
+
+AQUECIMENTO = ["/api/reservatorios", "/api/dashboard/overview", "/api/reservatorios/{id}/identification",
+               "/api/reservatorios/{id}/history?format=columnar",
+               "/api/reservatorios/{id}/chart/volume-data?resolution=monthly",
+               "/api/reservatorios/{id}/dashboard/summary", "/api/reservatorios/{id}/action-plans"]
+
+
+def _tempo_import() -> float:
+    codigo = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    saida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    return float(saida.stdout.strip().splitlines()[-1])
+
+
+def _memoria_kb(pid: int) -> Dict[str, int]:
+    """RSS, PSS e USS (páginas privadas) do processo, em KB."""
+    campos = {}
+    with open(f"/proc/{pid}/smaps_rollup") as arquivo:
+        for linha in arquivo:
+            combinacao = re.match(r"(\w+):\s+(\d+) kB", linha)
+            if combinacao:
+                campos[combinacao.group(1)] = int(combinacao.group(2))
+    return {"rss": campos["Rss"], "pss": campos["Pss"],
+            "uss": campos["Private_Clean"] + campos["Private_Dirty"]}
+
+
+def _filhos(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as arquivo:
+        return [int(p) for p in arquivo.read().split()]
+
+
+def _relatorio_memoria(titulo: str, master: int) -> dict:
+    workers = {pid: _memoria_kb(pid) for pid in _filhos(master)}
+    principal = _memoria_kb(master)
+    print(f"\n{titulo}")
+    print(f"{'processo':<16}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}")
+    print(f"{'master':<16}{principal['rss'] / 1024:>10.1f}{principal['pss'] / 1024:>10.1f}{principal['uss'] / 1024:>10.1f}")
+    for pid, memoria in sorted(workers.items()):
+        print(f"{f'worker {pid}':<16}{memoria['rss'] / 1024:>10.1f}{memoria['pss'] / 1024:>10.1f}{memoria['uss'] / 1024:>10.1f}")
+    total_pss = (principal["pss"] + sum(m["pss"] for m in workers.values())) / 1024
+    media = {c: statistics.mean(m[c] for m in workers.values()) / 1024 for c in ("rss", "pss", "uss")}
+    print(f"média por worker: RSS {media['rss']:.1f} MB, USS {media['uss']:.1f} MB; PSS total {total_pss:.1f} MB")
+    return {"media": media, "pss_total": total_pss}
+
+
+def _aquecer(base: str, requisicoes: int, workers: int) -> None:
+    ids = [r["id"] for r in httpx.get(f"{base}/api/reservatorios", timeout=30).json()]
+
+    def trabalhador(deslocamento: int):
+        with httpx.Client(base_url=base, timeout=60) as cliente:
+            for n in range(deslocamento, requisicoes, workers * 2):
+                caminho = AQUECIMENTO[n % len(AQUECIMENTO)].format(id=ids[n % len(ids)])
+                cliente.get(caminho).raise_for_status()
+
+    # Conexões simultâneas para que a carga se espalhe pelos workers
+    threads = [threading.Thread(target=trabalhador, args=(i,)) for i in range(workers * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(args) -> int:
+    tempos_import = [_tempo_import() for _ in range(args.repeticoes)]
+    print(f"import main: mediana {statistics.median(tempos_import) * 1000:.0f} ms em {args.repeticoes} execuções")
+
+    comando = [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-k", "uvicorn.workers.UvicornWorker",
+               "-b", f"127.0.0.1:{args.porta}", "main:app"] + (["--preload"] if args.preload else [])
+    inicio = time.perf_counter()
+    servidor = subprocess.Popen(comando, cwd=RAIZ, env=os.environ.copy(), stderr=subprocess.PIPE, text=True)
+    try:
+        # Cada worker registra "Application startup complete" ao terminar o lifespan
+        prontos = 0
+        for linha in servidor.stderr:
+            if "Application startup complete" in linha:
+                prontos += 1
+                if prontos == args.workers:
+                    break
+        else:
+            print("❌ O gunicorn terminou antes de todos os workers iniciarem.")
+            return 1
+        pronto_em = time.perf_counter() - inicio
+        threading.Thread(target=servidor.stderr.read, daemon=True).start()
+        print(f"gunicorn -w {args.workers}{' --preload' if args.preload else ''}: "
+              f"todos os workers prontos em {pronto_em * 1000:.0f} ms")
+
+        _relatorio_memoria("Memória após a inicialização", servidor.pid)
+        base = f"http://127.0.0.1:{args.porta}"
+        _aquecer(base, args.aquecimento, args.workers)
+        _relatorio_memoria(f"Memória após {args.aquecimento} requisições de aquecimento", servidor.pid)
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de inicialização e memória por worker sob o gunicorn.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--preload", action="store_true", help="importa a aplicação no master antes do fork")
+    parser.add_argument("--porta", type=int, default=8798)
+    parser.add_argument("--aquecimento", type=int, default=400, help="requisições após a inicialização")
+    parser.add_argument("--repeticoes", type=int, default=3, help="execuções de `import main` para a mediana")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+# benchmarks/sintetico.py
+# Popula um banco com dados sintéticos para os benchmarks: reservatórios com metas mensais, anos de leituras
+# diárias (passeio aleatório do volume), planos de ação, balanço hídrico, usos e responsáveis.
+# O histórico classificado é materializado ao final, como faz a carga das planilhas.
+#
+# Uso: python benchmarks/sintetico.py --reservatorios 10 --anos 20  (DATABASE_URL padrão: .cache/bench.db)
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import insert
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.makedirs(os.path.join(RAIZ, ".cache"), exist_ok=True)
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(RAIZ, '.cache', 'bench.db')}")
+
+import cache  # noqa: E402
+import crud  # noqa: E402
+import migracoes  # noqa: E402
+import models  # noqa: E402
+from database import engine, Base, AsyncSessionLocal  # noqa: E402
+
+ESTADOS = ["NORMAL", "ALERTA", "SECA", "SECA SEVERA"]
+SITUACOES = ["Em andamento", "Concluído", "Não iniciado"]
+MESES = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro",
+         "Novembro", "Dezembro"]
+
+
+def _leituras(rng, reservatorio_id: int, inicio: date, dias: int, capacidade: float) -> list:
+    percentual = np.clip(60 + np.cumsum(rng.normal(0, 0.6, dias)), 2, 100)
+    return [
+        {"data": inicio + timedelta(days=i), "volume_hm3": round(float(p) * capacidade / 100, 2),
+         "volume_percentual": round(float(p), 2), "reservatorio_id": reservatorio_id}
+        for i, p in enumerate(percentual)
+    ]
+
+
+def _planos(rng, reservatorio_id: int, quantidade: int) -> list:
+    return [
+        {"estado_seca": ESTADOS[i % len(ESTADOS)], "problemas": f"Problema {i % 7}",
+         "tipos_impactos": f"Impacto {i % 5}", "acoes": f"Ação {i}", "descricao_acao": f"Descrição da ação {i}",
+         "classes_acao": f"Classe {i % 3}", "responsaveis": f"Órgão {i % 4}",
+         "situacao": SITUACOES[int(rng.integers(len(SITUACOES)))], "indicadores": None,
+         "orgaos_envolvidos": None, "reservatorio_id": reservatorio_id}
+        for i in range(quantidade)
+    ]
+
+
+async def popular(reservatorios: int = 10, anos: int = 20, planos: int = 40, semente: int = 42) -> list:
+    """Recria o esquema e insere os dados sintéticos. Retorna os ids dos reservatórios criados."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migracoes.aplicar_migracoes)
+
+    rng = np.random.default_rng(semente)
+    dias = anos * 365
+    inicio = date.today() - timedelta(days=dias)
+    ids = list(range(1, reservatorios + 1))
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(models.Reservatorio), [
+            {"id": rid, "nome": f"Reservatório Sintético {rid:03d}", "municipio": f"Município {rid % 9}",
+             "descricao": "Reservatório gerado para benchmark.", "lat": -3 - rng.random() * 4,
+             "long": -38 - rng.random() * 3, "codigo_funceme": str(1000 + rid)} for rid in ids])
+        for rid in ids:
+            metas = np.sort(rng.uniform(0.05, 0.5, 3))[::-1]
+            await db.execute(insert(models.VolumeMeta), [
+                {"mes_num": m, "mes_nome": MESES[m - 1], "meta1v": float(metas[0]), "meta2v": float(metas[1]),
+                 "meta3v": float(metas[2]), "reservatorio_id": rid} for m in range(1, 13)])
+            await db.execute(insert(models.Monitoramento),
+                             _leituras(rng, rid, inicio, dias, capacidade=float(rng.uniform(20, 500))))
+            await db.execute(insert(models.PlanoAcao), _planos(rng, rid, planos))
+            await db.execute(insert(models.BalancoMensal), [
+                {"mes": MESES[m], "afluencia_m3s": float(rng.uniform(0, 20)), "demandas_m3s": float(rng.uniform(0, 5)),
+                 "evaporacao_m3s": float(rng.uniform(0, 2)), "reservatorio_id": rid} for m in range(12)])
+            await db.execute(insert(models.ComposicaoDemanda), [
+                {"usos": uso, "demandas_hm3": float(rng.uniform(0, 10)), "reservatorio_id": rid}
+                for uso in ("Abastecimento humano", "Irrigação", "Indústria", "Dessedentação animal")])
+            await db.execute(insert(models.OfertaDemanda), [
+                {"cenarios": f"Cenário {c}", "oferta_m3s": float(rng.uniform(0, 10)),
+                 "demanda_m3s": float(rng.uniform(0, 10)), "reservatorio_id": rid} for c in range(1, 4)])
+            await db.execute(insert(models.UsoAgua), [
+                {"uso": uso, "vazao_normal": float(rng.uniform(0, 3)), "vazao_escassez": float(rng.uniform(0, 2)),
+                 "reservatorio_id": rid} for uso in ("Abastecimento humano", "Irrigação", "Indústria")])
+            await db.execute(insert(models.Responsavel), [
+                {"nome": f"Responsável {i}", "grupo": f"Grupo {i % 3}", "organizacao": f"Organização {i % 5}",
+                 "cargo": "Técnico", "reservatorio_id": rid} for i in range(12)])
+            await crud.rebuild_history_status(db, rid)
+            await cache.invalidar(db, rid)
+        await db.commit()
+    return ids
+
+
+async def main(reservatorios: int, anos: int, planos: int) -> None:
+    inicio = time.perf_counter()
+    ids = await popular(reservatorios, anos, planos)
+    print(f"✅ {len(ids)} reservatórios x {anos} anos de leituras diárias em {time.perf_counter() - inicio:.1f}s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Popula o banco com dados sintéticos para benchmark.")
+    parser.add_argument("--reservatorios", type=int, default=10)
+    parser.add_argument("--anos", type=int, default=20)
+    parser.add_argument("--planos", type=int, default=40, help="planos de ação por reservatório")
+    args = parser.parse_args()
+    asyncio.run(main(args.reservatorios, args.anos, args.planos))
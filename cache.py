@@ -0,0 +1,137 @@
+# cache.py
+# Cache de respostas em memória (por worker) com TTL e descarte LRU.
+# A validade das entradas é amarrada a um contador de geração por reservatório guardado no banco,
+# de modo que uma escrita feita por qualquer worker (ou pela carga de dados) invalida o cache de todos.
+import functools
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from sqlalchemy import select, update, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+import models
+
+CACHE_TTL_SEGUNDOS = float(os.getenv("CACHE_TTL_SEGUNDOS", "300"))
+CACHE_MAX_ITENS = int(os.getenv("CACHE_MAX_ITENS", "512"))
+
+GERACAO_GLOBAL = 0
+
+
+class TTLCache:
+    """Dicionário LRU com expiração por tempo. Não é thread-safe: cada worker asyncio tem o seu."""
+
+    def __init__(self, max_itens: int = CACHE_MAX_ITENS, ttl: float = CACHE_TTL_SEGUNDOS):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chave: Hashable) -> Tuple[bool, Any]:
+        item = self._itens.get(chave)
+        if item is None:
+            self.misses += 1
+            return False, None
+        expira_em, valor = item
+        if expira_em < time.monotonic():
+            del self._itens[chave]
+            self.misses += 1
+            return False, None
+        self._itens.move_to_end(chave)
+        self.hits += 1
+        return True, valor
+
+    def set(self, chave: Hashable, valor: Any) -> None:
+        self._itens[chave] = (time.monotonic() + self.ttl, valor)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+            self.evictions += 1
+
+    def descartar_reservatorio(self, reservatorio_id: int) -> None:
+        for chave in [c for c in self._itens if c[1] == reservatorio_id]:
+            del self._itens[chave]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "pid": os.getpid(),
+            "itens": len(self._itens),
+            "max_itens": self.max_itens,
+            "ttl_segundos": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+response_cache = TTLCache()
+
+
+async def get_geracao(db: AsyncSession, reservatorio_id: int) -> int:
+    result = await db.execute(
+        select(models.CacheGeracao.geracao).where(models.CacheGeracao.reservatorio_id == reservatorio_id)
+    )
+    return result.scalar() or 0
+
+
+async def invalidar(db: AsyncSession, reservatorio_id: int) -> None:
+    """
+    Incrementa a geração do reservatório (e a global) dentro da transação do chamador.
+    Deve ser chamada por todo caminho que escreve dados de um reservatório, antes do commit.
+    """
+    agora = datetime.now(timezone.utc)
+    for rid in {reservatorio_id, GERACAO_GLOBAL}:
+        result = await db.execute(
+            update(models.CacheGeracao)
+            .where(models.CacheGeracao.reservatorio_id == rid)
+            .values(geracao=models.CacheGeracao.geracao + 1, atualizado_em=agora)
+        )
+        if result.rowcount == 0:
+            await db.execute(insert(models.CacheGeracao).values(reservatorio_id=rid, geracao=1, atualizado_em=agora))
+    # As leituras deste worker só voltam a usar uma réplica depois que ela receber esta escrita
+    database.registrar_geracao_primaria(await get_geracao(db, GERACAO_GLOBAL))
+    response_cache.descartar_reservatorio(reservatorio_id)
+    response_cache.descartar_reservatorio(GERACAO_GLOBAL)
+
+
+def _chave_parametros(kwargs: dict) -> tuple:
+    return tuple(sorted(
+        (k, tuple(v) if isinstance(v, list) else v)
+        for k, v in kwargs.items() if k not in ("db", "reservatorio_id")
+    ))
+
+
+async def cached(db: AsyncSession, namespace: str, reservatorio_id: int, produtor: Callable, params: tuple = ()):
+    geracao = await get_geracao(db, reservatorio_id)
+    chave = (namespace, reservatorio_id, geracao, params)
+    encontrado, valor = response_cache.get(chave)
+    if encontrado:
+        return valor
+    valor = await produtor()
+    response_cache.set(chave, valor)
+    return valor
+
+
+def cached_endpoint(namespace: str, versao: Optional[Callable[[], Hashable]] = None):
+    """
+    Decorador para endpoints que recebem `reservatorio_id` e `db`: guarda a resposta por geração.
+    `versao` acrescenta à chave um estado que não está no banco (ex.: o manifesto das imagens): quando ele
+    muda, a entrada antiga deixa de ser encontrada e a resposta é refeita.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            parametros = _chave_parametros(kwargs)
+            if versao is not None:
+                parametros += (("_versao", versao()),)
+            return await cached(kwargs["db"], namespace, kwargs["reservatorio_id"],
+                                lambda: func(*args, **kwargs), parametros)
+        return wrapper
+    return decorator
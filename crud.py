@@ -1,12 +1,18 @@
 # crud.py (VERSÃO FINAL MULTI-RESERVATÓRIO)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List, Optional
-import pandas as pd
-import numpy as np
+from sqlalchemy import select, insert, delete, func, text, bindparam
+import re
+from typing import TYPE_CHECKING, List, Optional
+from datetime import date
 
+import cache
 import models
 
+if TYPE_CHECKING:
+    # pandas e NumPy são importados sob demanda, nas funções que montam arrays e DataFrames
+    import numpy as np
+    import pandas as pd
+
 
 # --- NOVA FUNÇÃO ---
 async def get_reservatorios(db: AsyncSession) -> List[models.Reservatorio]:
@@ -83,6 +89,118 @@ async def get_action_plans(db: AsyncSession, reservatorio_id: int, estado: Optio
     result = await db.execute(query)
     return result.scalars().all()
 
+async def get_action_plans_estado_atual(db: AsyncSession, reservatorio_id: int) -> List[models.PlanoAcao]:
+    """
+    Planos de ação do estado de seca da leitura mais recente. O estado vem de uma subconsulta no histórico
+    materializado, então a busca não depende de get_latest_status e pode rodar em paralelo com ela.
+    """
+    historico = models.HistoricoEstado
+    estado_atual = (
+        select(historico.estado_calculado)
+        .where(historico.reservatorio_id == reservatorio_id)
+        .order_by(historico.data.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(models.PlanoAcao)
+        .where(models.PlanoAcao.reservatorio_id == reservatorio_id, models.PlanoAcao.estado_seca == estado_atual))
+    return result.scalars().all()
+
+async def get_action_plan_rows(db: AsyncSession, reservatorio_id: int) -> list:
+    """Todos os planos de ação do reservatório em ordem de cadastro, como linhas (sem objetos do ORM)."""
+    plano = models.PlanoAcao
+    result = await db.execute(
+        select(plano.id, plano.estado_seca, plano.tipos_impactos, plano.problemas, plano.acoes, plano.situacao,
+               plano.descricao_acao, plano.classes_acao, plano.responsaveis)
+        .where(plano.reservatorio_id == reservatorio_id)
+        .order_by(plano.id)
+    )
+    return result.all()
+
+# --- Busca textual nos planos de ação (índices criados em migracoes.py) ---
+
+# Colunas pesquisáveis, em ordem de peso (A, B, B, C, C no Postgres; pesos do bm25 no SQLite)
+BUSCA_COLUNAS = ['acoes', 'descricao_acao', 'problemas', 'responsaveis', 'indicadores']
+BUSCA_PESOS = ['A', 'B', 'B', 'C', 'C']
+BUSCA_PESOS_BM25 = [10.0, 5.0, 5.0, 2.0, 2.0]
+# Configuração de busca do Postgres: radicais do português e sem acentos (unaccent)
+BUSCA_CONFIGURACAO = "portugues_sem_acento"
+# Documento indexado no Postgres. O índice GIN é criado sobre esta mesma expressão (colunas sem alias, para
+# valer tanto no CREATE INDEX quanto nas consultas sobre plano_acao)
+BUSCA_DOCUMENTO_SQL = " || ".join(
+    f"setweight(to_tsvector('{BUSCA_CONFIGURACAO}', coalesce({coluna}, '')), '{peso}')"
+    for coluna, peso in zip(BUSCA_COLUNAS, BUSCA_PESOS)
+)
+_MARCAS = ("<mark>", "</mark>")
+
+
+def _consulta_fts5(termo: str) -> str:
+    """Termo livre -> consulta FTS5: cada palavra entre aspas e como prefixo ("poco"* casa com "poços")."""
+    return " ".join(f'"{palavra}"*' for palavra in re.findall(r"\w+", termo))
+
+
+async def search_action_plans(db: AsyncSession, termo: str, reservatorio_ids: Optional[List[int]] = None,
+                              limite: int = 20, deslocamento: int = 0) -> dict:
+    """
+    Busca textual nos planos de ação de todos (ou de alguns) reservatórios, ordenada por relevância.
+    Retorna o total de planos encontrados e a página pedida, com trechos destacados de cada coluna pesquisável.
+    No Postgres usa o tsvector com radicais do português (websearch_to_tsquery aceita "frase", or e -termo);
+    no SQLite usa a tabela FTS5, sem acentos e com casamento por prefixo no lugar dos radicais.
+    """
+    filtro = "AND p.reservatorio_id IN :ids" if reservatorio_ids else ""
+    parametros = {"limite": limite, "deslocamento": deslocamento}
+    if reservatorio_ids:
+        parametros["ids"] = list(reservatorio_ids)
+
+    if db.bind.dialect.name == "postgresql":
+        parametros["termo"] = termo
+        consulta = f"websearch_to_tsquery('{BUSCA_CONFIGURACAO}', :termo)"
+        encontrados = f"FROM plano_acao p WHERE ({BUSCA_DOCUMENTO_SQL}) @@ {consulta} {filtro}"
+        opcoes = f"StartSel={_MARCAS[0]}, StopSel={_MARCAS[1]}, MaxFragments=2, MaxWords=30, MinWords=10"
+        destaques = ", ".join(
+            f"ts_headline('{BUSCA_CONFIGURACAO}', coalesce(p.{c}, ''), {consulta}, '{opcoes}') AS destaque_{c}"
+            for c in BUSCA_COLUNAS)
+        pagina = f"""
+            SELECT p.id, p.reservatorio_id, r.nome AS reservatorio, p.estado_seca, p.situacao, p.acoes,
+                   p.descricao_acao, p.responsaveis, pagina.relevancia, {destaques}
+            FROM (SELECT p.id, ts_rank_cd({BUSCA_DOCUMENTO_SQL}, {consulta}) AS relevancia {encontrados}
+                  ORDER BY relevancia DESC, p.id LIMIT :limite OFFSET :deslocamento) AS pagina
+            JOIN plano_acao p ON p.id = pagina.id
+            JOIN reservatorio r ON r.id = p.reservatorio_id
+            ORDER BY pagina.relevancia DESC, p.id"""
+    else:
+        parametros["termo"] = _consulta_fts5(termo)
+        if not parametros["termo"]:
+            return {"total": 0, "resultados": []}
+        origem = "FROM plano_acao_fts JOIN plano_acao p ON p.id = plano_acao_fts.rowid"
+        condicao = f"WHERE plano_acao_fts MATCH :termo {filtro}"
+        encontrados = f"{origem} {condicao}"
+        destaques = ", ".join(
+            f"snippet(plano_acao_fts, {i}, '{_MARCAS[0]}', '{_MARCAS[1]}', '…', 24) AS destaque_{c}"
+            for i, c in enumerate(BUSCA_COLUNAS))
+        pesos = ", ".join(str(peso) for peso in BUSCA_PESOS_BM25)
+        pagina = f"""
+            SELECT p.id, p.reservatorio_id, r.nome AS reservatorio, p.estado_seca, p.situacao, p.acoes,
+                   p.descricao_acao, p.responsaveis, -bm25(plano_acao_fts, {pesos}) AS relevancia, {destaques}
+            {origem} JOIN reservatorio r ON r.id = p.reservatorio_id {condicao}
+            ORDER BY relevancia DESC, p.id LIMIT :limite OFFSET :deslocamento"""
+
+    def _consulta(sql: str):
+        query = text(sql)
+        return query.bindparams(bindparam("ids", expanding=True)) if reservatorio_ids else query
+
+    total = (await db.execute(_consulta(f"SELECT count(*) {encontrados}"), parametros)).scalar()
+    linhas = (await db.execute(_consulta(pagina), parametros)).mappings().all() if total else []
+    resultados = []
+    for linha in linhas:
+        resultado = {chave: valor for chave, valor in linha.items() if not chave.startswith("destaque_")}
+        # Só os trechos que contêm algum termo encontrado
+        resultado["destaques"] = {c: linha[f"destaque_{c}"] for c in BUSCA_COLUNAS
+                                  if linha[f"destaque_{c}"] and _MARCAS[0] in linha[f"destaque_{c}"]}
+        resultados.append(resultado)
+    return {"total": total, "resultados": resultados}
+
 # Arquivo: crud.py
 
 async def get_action_plan_filters(db: AsyncSession, reservatorio_id: int) -> dict:
@@ -126,29 +244,445 @@ async def get_reservatorio_by_id(db: AsyncSession, reservatorio_id: int) -> Opti
     return result.scalars().first()
 
 
-async def get_history_with_status(db: AsyncSession, reservatorio_id: int) -> pd.DataFrame:
-    monitoramento_data = await get_all_monitoring_data(db, reservatorio_id)
-    metas_data = await get_all_volume_meta(db, reservatorio_id)
+HISTORICO_COLUNAS = [
+    'data', 'volume_hm3', 'volume_percentual', 'meta1v', 'meta2v', 'meta3v',
+    'estado_calculado', 'inicio_estado', 'data_estado_anterior',
+]
+# dtype fixo de cada coluna do histórico: datas como datetime64[D], ausentes viram NaN/NaT
+HISTORICO_TIPOS = {
+    'data': 'datetime64[D]', 'volume_hm3': 'float64', 'volume_percentual': 'float64',
+    'meta1v': 'float64', 'meta2v': 'float64', 'meta3v': 'float64', 'estado_calculado': object,
+    'inicio_estado': 'datetime64[D]', 'data_estado_anterior': 'datetime64[D]',
+}
+ESTADOS_SECA = ("SECA SEVERA", "SECA", "ALERTA", "NORMAL")
+
+
+_ORDINAL_1970 = date(1970, 1, 1).toordinal()
+# Menor int64: o valor que datetime64 usa para NaT
+_NAT = -2 ** 63
 
-    if not monitoramento_data or not metas_data:
-        return pd.DataFrame()
 
-    df_monitoramento = pd.DataFrame([m.__dict__ for m in monitoramento_data])
-    df_metas = pd.DataFrame([m.__dict__ for m in metas_data])
+def _datas_numpy(valores) -> "np.ndarray":
+    """date -> datetime64[D] pelo ordinal do dia (np.array direto sobre objetos date é dezenas de vezes mais lento)."""
+    import numpy as np
 
-    if df_monitoramento.empty or df_metas.empty:
-        return df_monitoramento
+    dias = np.fromiter((_NAT if d is None else d.toordinal() - _ORDINAL_1970 for d in valores),
+                       dtype=np.int64, count=len(valores))
+    return dias.astype('datetime64[D]')
 
-    df_monitoramento['mes_num'] = pd.to_datetime(df_monitoramento['data']).dt.month
-    df_merged = pd.merge(df_monitoramento, df_metas, on='mes_num', how='left')
 
-    df_merged['volume_percentual'] = pd.to_numeric(df_merged['volume_percentual'], errors='coerce').fillna(0) / 100
-    conditions = [
-        (df_merged['volume_percentual'] < df_merged['meta1v']),
-        (df_merged['volume_percentual'] < df_merged['meta2v']),
-        (df_merged['volume_percentual'] < df_merged['meta3v'])
-    ]
-    choices = ["SECA SEVERA", "SECA", "ALERTA"]
-    df_merged['estado_calculado'] = np.select(conditions, choices, default='NORMAL')
+def _colunas_numpy(rows, tipos: dict) -> dict:
+    """Transpõe as linhas (tuplas) vindas do banco em um array NumPy por coluna, com o dtype de `tipos`."""
+    import numpy as np
+
+    colunas = list(zip(*rows)) if rows else [()] * len(tipos)
+    return {
+        nome: _datas_numpy(valores) if tipo == 'datetime64[D]' else np.array(valores, dtype=tipo)
+        for (nome, tipo), valores in zip(tipos.items(), colunas)
+    }
 
-    return df_merged.sort_values(by='data', ascending=False)
+
+def _lista_python(valores: "np.ndarray") -> list:
+    """Converte um array em lista de objetos Python para o INSERT (NaN/NaT viram None, datetime64[D] vira date)."""
+    import numpy as np
+
+    objetos = valores.astype(object)
+    if valores.dtype.kind == 'f':
+        objetos[np.isnan(valores)] = None
+    return objetos.tolist()
+
+
+async def get_monitoring_columns(db: AsyncSession, reservatorio_id: int, depois_de: Optional[date] = None) -> dict:
+    """
+    Leituras do reservatório em ordem de data, como arrays (data, volume_hm3, volume_percentual).
+    Só as colunas necessárias são lidas, sem instanciar objetos do ORM. `depois_de` restringe às datas posteriores.
+    """
+    mon = models.Monitoramento
+    query = select(mon.data, mon.volume_hm3, mon.volume_percentual).where(mon.reservatorio_id == reservatorio_id)
+    if depois_de is not None:
+        query = query.where(mon.data > depois_de)
+    result = await db.execute(query.order_by(mon.data, mon.id))
+    colunas = _colunas_numpy(result.all(), {'data': 'datetime64[D]', 'volume_hm3': 'float64',
+                                            'volume_percentual': 'float64'})
+    if len(colunas['data']) < 2:
+        return colunas
+    import numpy as np
+
+    # Uma leitura por data (a última inserida), como garante o índice único
+    ultima_do_dia = np.append(colunas['data'][1:] != colunas['data'][:-1], True)
+    return {nome: valores[ultima_do_dia] for nome, valores in colunas.items()}
+
+
+async def get_metas_por_mes(db: AsyncSession, reservatorio_id: int) -> "Optional[np.ndarray]":
+    """Metas do reservatório num array 12x3 (linha = mês - 1; colunas meta1v, meta2v, meta3v). None se não houver."""
+    meta = models.VolumeMeta
+    result = await db.execute(
+        select(meta.mes_num, meta.meta1v, meta.meta2v, meta.meta3v)
+        .where(meta.reservatorio_id == reservatorio_id)
+        .order_by(meta.id)
+    )
+    linhas = result.all()
+    if not linhas:
+        return None
+    import numpy as np
+
+    metas = np.full((12, 3), np.nan)
+    for mes_num, meta1v, meta2v, meta3v in linhas:
+        # Mês repetido na planilha: vale a última linha
+        if mes_num and 1 <= mes_num <= 12:
+            metas[mes_num - 1] = [np.nan if m is None else m for m in (meta1v, meta2v, meta3v)]
+    return metas
+
+
+def _classificar_historico(leituras: dict, metas: "np.ndarray") -> dict:
+    """
+    Calcula o estado de seca de cada leitura comparando o volume (em fração) com as metas do mês.
+    As metas são obtidas por indexação do array 12x3 com o mês de cada data.
+    """
+    import numpy as np
+
+    datas = leituras['data']
+    mes = (datas.astype('datetime64[M]') - datas.astype('datetime64[Y]')).astype(np.int64)
+    metas_leitura = metas[mes]
+    percentual = np.nan_to_num(leituras['volume_percentual'], nan=0.0) / 100
+    with np.errstate(invalid='ignore'):
+        # Primeira condição verdadeira vence; sem meta (NaN) a comparação é falsa e o estado é NORMAL
+        abaixo = percentual[:, None] < metas_leitura
+    estado = np.where(abaixo.any(axis=1), np.argmax(abaixo, axis=1), 3)
+    return {
+        'data': datas,
+        'volume_hm3': leituras['volume_hm3'],
+        'volume_percentual': percentual,
+        'meta1v': metas_leitura[:, 0],
+        'meta2v': metas_leitura[:, 1],
+        'meta3v': metas_leitura[:, 2],
+        'estado_calculado': np.array(ESTADOS_SECA, dtype=object)[estado],
+    }
+
+
+def _calcular_periodos(historico: dict, anterior: Optional[models.HistoricoEstado] = None) -> dict:
+    """
+    Preenche `inicio_estado` e `data_estado_anterior` para um histórico ordenado por data.
+    `anterior` é o último registro já materializado, usado para continuar o período em curso.
+    """
+    import numpy as np
+
+    datas = historico['data']
+    estados = historico['estado_calculado']
+    posicoes = np.arange(len(datas))
+    mudou = np.empty(len(datas), dtype=bool)
+    mudou[0] = anterior is None or estados[0] != anterior.estado_calculado
+    mudou[1:] = estados[1:] != estados[:-1]
+
+    # Posição em que começa o período de cada leitura; o período anterior termina na posição seguinte menos um
+    inicio_periodo = np.maximum.accumulate(np.where(mudou, posicoes, 0))
+    inicio = datas[inicio_periodo]
+    fim_anterior = np.where(inicio_periodo > 0, datas[np.maximum(inicio_periodo - 1, 0)], np.datetime64('NaT'))
+
+    if anterior is not None:
+        primeiro_periodo = inicio_periodo == 0
+        if mudou[0]:
+            fim_anterior[primeiro_periodo] = np.datetime64(anterior.data, 'D')
+        else:
+            # As novas leituras continuam o estado do último registro
+            inicio[primeiro_periodo] = np.datetime64(anterior.inicio_estado, 'D')
+            fim_anterior[primeiro_periodo] = np.datetime64(anterior.data_estado_anterior or 'NaT', 'D')
+
+    historico['inicio_estado'] = inicio
+    historico['data_estado_anterior'] = fim_anterior
+    return historico
+
+
+def _registros_historico(historico: dict, reservatorio_id: int) -> List[dict]:
+    colunas = [_lista_python(historico[c]) for c in HISTORICO_COLUNAS]
+    chaves = HISTORICO_COLUNAS + ['reservatorio_id']
+    return [dict(zip(chaves, (*valores, reservatorio_id))) for valores in zip(*colunas)]
+
+
+PERIODO_COLUNAS = [
+    'estado', 'inicio', 'fim', 'leituras',
+    'volume_min_hm3', 'volume_max_hm3', 'volume_percentual_min', 'volume_percentual_max',
+]
+
+
+def _agrupar_periodos(historico: dict) -> dict:
+    """
+    Agrupa um histórico classificado e ordenado por data em períodos contínuos de mesmo estado (run-length),
+    com as colunas de PERIODO_COLUNAS. Mínimos e máximos ignoram volumes ausentes.
+    """
+    import numpy as np
+
+    datas = historico['data']
+    estados = historico['estado_calculado']
+    mudou = np.empty(len(datas), dtype=bool)
+    mudou[0] = True
+    mudou[1:] = estados[1:] != estados[:-1]
+    inicios = np.flatnonzero(mudou)
+    fins = np.append(inicios[1:], len(datas)) - 1
+    volume = historico['volume_hm3']
+    percentual = historico['volume_percentual']
+    return {
+        'estado': estados[inicios],
+        'inicio': datas[inicios],
+        'fim': datas[fins],
+        'leituras': fins - inicios + 1,
+        'volume_min_hm3': np.fmin.reduceat(volume, inicios),
+        'volume_max_hm3': np.fmax.reduceat(volume, inicios),
+        'volume_percentual_min': np.fmin.reduceat(percentual, inicios),
+        'volume_percentual_max': np.fmax.reduceat(percentual, inicios),
+    }
+
+
+def _registros_periodos(periodos: dict, reservatorio_id: int) -> List[dict]:
+    colunas = [_lista_python(periodos[c]) for c in PERIODO_COLUNAS]
+    chaves = PERIODO_COLUNAS + ['reservatorio_id']
+    return [dict(zip(chaves, (*valores, reservatorio_id))) for valores in zip(*colunas)]
+
+
+def _extremo(a: Optional[float], b: Optional[float], funcao) -> Optional[float]:
+    valores = [v for v in (a, b) if v is not None]
+    return funcao(valores) if valores else None
+
+
+async def _acrescentar_periodos(db: AsyncSession, reservatorio_id: int, historico: dict,
+                                anterior: models.HistoricoEstado) -> None:
+    """
+    Acrescenta os períodos das leituras novas. Se elas continuam o estado do último registro materializado,
+    o primeiro período é incorporado ao período em curso já gravado.
+    """
+    periodo = models.PeriodoEstado
+    result = await db.execute(select(periodo).where(periodo.reservatorio_id == reservatorio_id,
+                                                    periodo.inicio == anterior.inicio_estado))
+    em_curso = result.scalars().first()
+    if em_curso is None:
+        # Períodos ainda não gerados para este reservatório: refaz a partir do histórico já gravado
+        await rebuild_state_runs(db, reservatorio_id)
+        return
+
+    periodos = _registros_periodos(_agrupar_periodos(historico), reservatorio_id)
+    if periodos[0]['estado'] == anterior.estado_calculado:
+        continuacao = periodos.pop(0)
+        em_curso.fim = continuacao['fim']
+        em_curso.leituras += continuacao['leituras']
+        for coluna, funcao in (('volume_min_hm3', min), ('volume_max_hm3', max),
+                               ('volume_percentual_min', min), ('volume_percentual_max', max)):
+            setattr(em_curso, coluna, _extremo(getattr(em_curso, coluna), continuacao[coluna], funcao))
+        await db.flush()
+    if periodos:
+        await db.execute(insert(models.PeriodoEstado), periodos)
+
+
+async def rebuild_state_runs(db: AsyncSession, reservatorio_id: int) -> int:
+    """Refaz os períodos de estado do reservatório a partir do histórico classificado já materializado."""
+    historico = models.HistoricoEstado
+    result = await db.execute(
+        select(historico.data, historico.estado_calculado, historico.volume_hm3, historico.volume_percentual)
+        .where(historico.reservatorio_id == reservatorio_id)
+        .order_by(historico.data)
+    )
+    colunas = _colunas_numpy(result.all(), {'data': 'datetime64[D]', 'estado_calculado': object,
+                                            'volume_hm3': 'float64', 'volume_percentual': 'float64'})
+    await db.execute(delete(models.PeriodoEstado).where(models.PeriodoEstado.reservatorio_id == reservatorio_id))
+    if not len(colunas['data']):
+        return 0
+    periodos = _registros_periodos(_agrupar_periodos(colunas), reservatorio_id)
+    await db.execute(insert(models.PeriodoEstado), periodos)
+    return len(periodos)
+
+
+async def rebuild_history_status(db: AsyncSession, reservatorio_id: int) -> int:
+    """
+    Reconstrói todo o histórico classificado do reservatório e os seus períodos de estado.
+    Deve ser chamado quando as metas mudam.
+    """
+    leituras = await get_monitoring_columns(db, reservatorio_id)
+    metas = await get_metas_por_mes(db, reservatorio_id)
+
+    await db.execute(delete(models.HistoricoEstado).where(models.HistoricoEstado.reservatorio_id == reservatorio_id))
+    await db.execute(delete(models.PeriodoEstado).where(models.PeriodoEstado.reservatorio_id == reservatorio_id))
+    if not len(leituras['data']) or metas is None:
+        return 0
+
+    historico = _calcular_periodos(_classificar_historico(leituras, metas))
+    registros = _registros_historico(historico, reservatorio_id)
+    await db.execute(insert(models.HistoricoEstado), registros)
+    await db.execute(insert(models.PeriodoEstado), _registros_periodos(_agrupar_periodos(historico), reservatorio_id))
+    return len(registros)
+
+
+async def update_history_status(db: AsyncSession, reservatorio_id: int, desde: Optional[date] = None) -> int:
+    """
+    Acrescenta ao histórico classificado as leituras posteriores ao último registro materializado.
+    Se `desde` (data mais antiga inserida) não for posterior a esse registro, o histórico é reconstruído.
+    """
+    anterior = await get_latest_status(db, reservatorio_id)
+    if anterior is None or desde is None or desde <= anterior.data:
+        return await rebuild_history_status(db, reservatorio_id)
+
+    leituras = await get_monitoring_columns(db, reservatorio_id, depois_de=anterior.data)
+    metas = await get_metas_por_mes(db, reservatorio_id)
+    if not len(leituras['data']) or metas is None:
+        return 0
+
+    historico = _calcular_periodos(_classificar_historico(leituras, metas), anterior=anterior)
+    registros = _registros_historico(historico, reservatorio_id)
+    await db.execute(insert(models.HistoricoEstado), registros)
+    await _acrescentar_periodos(db, reservatorio_id, historico, anterior)
+    return len(registros)
+
+
+async def bootstrap_history_status(db: AsyncSession) -> int:
+    """
+    Materializa o histórico dos reservatórios que possuem monitoramento mas ainda não foram classificados,
+    e os períodos de estado dos que já têm histórico mas ainda não têm períodos (bancos anteriores à tabela).
+    """
+    com_historico = select(models.HistoricoEstado.reservatorio_id).distinct()
+    result = await db.execute(
+        select(models.Monitoramento.reservatorio_id)
+        .where(models.Monitoramento.reservatorio_id.not_in(com_historico))
+        .distinct()
+    )
+    pendentes = result.scalars().all()
+    for reservatorio_id in pendentes:
+        await rebuild_history_status(db, reservatorio_id)
+        await cache.invalidar(db, reservatorio_id)
+
+    com_periodos = select(models.PeriodoEstado.reservatorio_id).distinct()
+    result = await db.execute(com_historico.where(models.HistoricoEstado.reservatorio_id.not_in(com_periodos)))
+    sem_periodos = result.scalars().all()
+    for reservatorio_id in sem_periodos:
+        await rebuild_state_runs(db, reservatorio_id)
+        await cache.invalidar(db, reservatorio_id)
+    await db.commit()
+    return len(pendentes) + len(sem_periodos)
+
+
+async def get_latest_status(db: AsyncSession, reservatorio_id: int) -> Optional[models.HistoricoEstado]:
+    """Retorna a leitura classificada mais recente do reservatório."""
+    result = await db.execute(
+        select(models.HistoricoEstado)
+        .where(models.HistoricoEstado.reservatorio_id == reservatorio_id)
+        .order_by(models.HistoricoEstado.data.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+async def get_state_runs(db: AsyncSession, reservatorio_id: int, inicio: Optional[date] = None,
+                         fim: Optional[date] = None) -> List[models.PeriodoEstado]:
+    """Períodos de estado do reservatório em ordem cronológica; o intervalo seleciona os que o intersectam."""
+    periodo = models.PeriodoEstado
+    query = select(periodo).where(periodo.reservatorio_id == reservatorio_id)
+    if inicio:
+        query = query.where(periodo.fim >= inicio)
+    if fim:
+        query = query.where(periodo.inicio <= fim)
+    result = await db.execute(query.order_by(periodo.inicio))
+    return result.scalars().all()
+
+
+async def get_overview(db: AsyncSession, reservatorio_ids: Optional[List[int]] = None) -> list:
+    """
+    Situação atual de todos (ou de alguns) reservatórios numa única consulta. A leitura mais recente de cada
+    reservatório é localizada por um max(data) correlacionado, resolvido pelo índice único (reservatorio_id, data)
+    do histórico materializado sem percorrer as leituras antigas.
+    """
+    historico = models.HistoricoEstado
+    ultima_data = (
+        select(func.max(historico.data))
+        .where(historico.reservatorio_id == models.Reservatorio.id)
+        .correlate(models.Reservatorio)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            models.Reservatorio.id, models.Reservatorio.nome, models.Reservatorio.lat, models.Reservatorio.long,
+            historico.data, historico.volume_hm3, historico.volume_percentual, historico.estado_calculado,
+            historico.inicio_estado, historico.data_estado_anterior,
+        )
+        .outerjoin(historico, (historico.reservatorio_id == models.Reservatorio.id) & (historico.data == ultima_data))
+        .order_by(models.Reservatorio.nome)
+    )
+    if reservatorio_ids:
+        query = query.where(models.Reservatorio.id.in_(reservatorio_ids))
+    result = await db.execute(query)
+    return result.all()
+
+
+async def get_versao_reservatorio(db: AsyncSession, reservatorio_id: int) -> dict:
+    """
+    Versão barata dos dados de um reservatório: a geração do cache (incrementada por toda escrita, ver
+    cache.invalidar) e a última data de leitura, ambas buscas diretas por índice, sem agregar o histórico.
+    """
+    mon = models.Monitoramento
+    geracao = models.CacheGeracao
+    query = select(
+        select(func.max(mon.data)).where(mon.reservatorio_id == reservatorio_id).scalar_subquery(),
+        select(geracao.geracao).where(geracao.reservatorio_id == reservatorio_id).scalar_subquery(),
+        select(geracao.atualizado_em).where(geracao.reservatorio_id == reservatorio_id).scalar_subquery(),
+    )
+    ultima_data, numero_geracao, atualizado_em = (await db.execute(query)).one()
+    return {
+        "ultima_data": ultima_data,
+        "geracao": numero_geracao or 0,
+        "atualizado_em": atualizado_em,
+    }
+
+
+async def get_history_with_status(db: AsyncSession, reservatorio_id: int, inicio: Optional[date] = None,
+                                  fim: Optional[date] = None, limite: Optional[int] = None,
+                                  cursor: Optional[date] = None, ascendente: bool = False) -> "pd.DataFrame":
+    """
+    Lê o histórico classificado (materializado). Por padrão do registro mais recente para o mais antigo.
+    Intervalo de datas, limite e cursor (data do último registro da página anterior) são aplicados no SQL.
+    """
+    historico = models.HistoricoEstado
+    colunas = [getattr(historico, c) for c in HISTORICO_COLUNAS]
+    query = select(*colunas).where(historico.reservatorio_id == reservatorio_id)
+    if inicio:
+        query = query.where(historico.data >= inicio)
+    if fim:
+        query = query.where(historico.data <= fim)
+    if cursor:
+        query = query.where(historico.data > cursor if ascendente else historico.data < cursor)
+    query = query.order_by(historico.data.asc() if ascendente else historico.data.desc())
+    if limite:
+        query = query.limit(limite)
+
+    import pandas as pd
+
+    result = await db.execute(query)
+    rows = result.all()
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(_colunas_numpy(rows, HISTORICO_TIPOS), copy=False)
+
+
+EXPORTACAO_COLUNAS = ['reservatorio_id', 'reservatorio'] + HISTORICO_COLUNAS
+
+
+async def stream_history(db: AsyncSession, reservatorio_ids: Optional[List[int]] = None, inicio: Optional[date] = None,
+                         fim: Optional[date] = None, lote: int = 5000):
+    """
+    Percorre o histórico classificado de um, de alguns ou de todos os reservatórios (ordem: reservatório, data)
+    por um cursor do lado do servidor, entregando lotes de até `lote` linhas (tuplas em EXPORTACAO_COLUNAS).
+    A memória usada não depende do tamanho do histórico.
+    """
+    historico = models.HistoricoEstado
+    query = (
+        select(historico.reservatorio_id, models.Reservatorio.nome,
+               *[getattr(historico, c) for c in HISTORICO_COLUNAS])
+        .join(models.Reservatorio, models.Reservatorio.id == historico.reservatorio_id)
+        .order_by(historico.reservatorio_id, historico.data)
+        .execution_options(yield_per=lote)
+    )
+    if reservatorio_ids:
+        query = query.where(historico.reservatorio_id.in_(reservatorio_ids))
+    if inicio:
+        query = query.where(historico.data >= inicio)
+    if fim:
+        query = query.where(historico.data <= fim)
+
+    result = await db.stream(query)
+    async for particao in result.partitions():
+        yield particao
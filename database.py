@@ -1,6 +1,16 @@
+import asyncio
+import itertools
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base  # Importe declarative_base
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional, Tuple
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker, declarative_base  # Importe declarative_base
+from sqlalchemy.pool import StaticPool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,19 +20,373 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("A variável de ambiente DATABASE_URL não foi definida.")
 
-async_db_url = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+# Pool de conexões por worker do gunicorn (o total no banco é workers x (pool + overflow))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Cache de prepared statements do asyncpg por conexão; use 0 atrás do PgBouncer em modo transaction
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+# Espera máxima (ms) por um lock de escrita no SQLite antes de falhar com "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
-engine = create_async_engine(async_db_url)
+# Réplicas de leitura (opcional), separadas por vírgula. Os endpoints GET leem delas em rodízio (get_db_leitura);
+# escritas, jobs e carregadores continuam na primária (get_db / AsyncSessionLocal).
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# Atraso máximo aceito numa réplica antes de as leituras irem para outra réplica ou para a primária
+DB_REPLICA_ATRASO_MAX_SEGUNDOS = float(os.getenv("DB_REPLICA_ATRASO_MAX_SEGUNDOS", "5"))
+# Intervalo entre as verificações de atraso de cada réplica (por worker)
+DB_REPLICA_VERIFICACAO_SEGUNDOS = float(os.getenv("DB_REPLICA_VERIFICACAO_SEGUNDOS", "2"))
+# Tempo que uma réplica fica fora do rodízio depois de uma falha de conexão
+DB_REPLICA_PAUSA_SEGUNDOS = float(os.getenv("DB_REPLICA_PAUSA_SEGUNDOS", "30"))
+# Validade da geração global da primária guardada por worker (ver geracao_primaria); as escritas do próprio
+# worker a atualizam na hora, as dos demais workers e da carga de dados aparecem depois desse intervalo
+DB_REPLICA_GERACAO_TTL_SEGUNDOS = float(os.getenv("DB_REPLICA_GERACAO_TTL_SEGUNDOS", "1"))
+
+
+def _url_assincrona(url: str):
+    """Aceita as URLs síncronas usuais (postgres://, postgresql://, sqlite://) e troca pelo driver assíncrono."""
+    for prefixo, driver in (("postgres://", "postgresql+asyncpg://"), ("postgresql://", "postgresql+asyncpg://"),
+                            ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(prefixo):
+            url = driver + url[len(prefixo):]
+            break
+    return make_url(url)
+
+
+def _sqlite_memoria(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _criar_engine(url: URL, somente_leitura: bool = False) -> AsyncEngine:
+    """Engine com o pool e as configurações de conexão do backend; usado pela primária e pelas réplicas."""
+    sqlite = url.get_backend_name() == "sqlite"
+    memoria = _sqlite_memoria(url)
+    engine_kwargs = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if memoria:
+        # Banco em memória só existe dentro da conexão: todas as sessões compartilham a mesma
+        engine_kwargs.update(poolclass=StaticPool, connect_args={"check_same_thread": False})
+    else:
+        engine_kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                             pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE)
+    if url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict({"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)})
+        engine_kwargs["connect_args"] = {"statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+        if somente_leitura:
+            engine_kwargs["connect_args"]["server_settings"] = {"default_transaction_read_only": "on"}
+
+    novo = create_async_engine(url, **engine_kwargs)
+    if sqlite:
+        @event.listens_for(novo.sync_engine, "connect")
+        def _configurar_sqlite(dbapi_connection, connection_record):
+            # WAL permite leituras concorrentes com uma escrita; NORMAL é seguro com WAL e evita fsync a cada commit
+            cursor = dbapi_connection.cursor()
+            if not memoria:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA cache_size=-65536")  # 64 MB
+            cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+            if somente_leitura:
+                cursor.execute("PRAGMA query_only=ON")
+            cursor.close()
+    return novo
+
+
+async_db_url = _url_assincrona(DATABASE_URL)
+SQLITE = async_db_url.get_backend_name() == "sqlite"
+SQLITE_MEMORIA = _sqlite_memoria(async_db_url)
+
+# Leituras independentes de um mesmo endpoint em sessões paralelas (ver em_paralelo). Compensa quando cada
+# consulta paga a ida e volta na rede até o banco; no SQLite local a consulta custa menos que o checkout extra.
+DB_CONSULTAS_PARALELAS = os.getenv("DB_CONSULTAS_PARALELAS", "0" if SQLITE else "1") == "1"
+# Sessões extras abertas ao mesmo tempo por em_paralelo neste worker. Fica abaixo do tamanho do pool: cada
+# requisição já segura a própria conexão, e extras sem limite podem ocupar o pool inteiro com requisições
+# esperando umas pelas outras até o DB_POOL_TIMEOUT.
+DB_CONSULTAS_PARALELAS_MAX = int(os.getenv("DB_CONSULTAS_PARALELAS_MAX",
+                                           str(max(DB_POOL_SIZE + DB_MAX_OVERFLOW - 1, 0))))
+_vagas_paralelas = asyncio.Semaphore(DB_CONSULTAS_PARALELAS_MAX)
+
+engine = _criar_engine(async_db_url)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
+# Sessões dos endpoints de leitura (réplica ou, na falta dela, primária); não aceitam escritas
+AsyncSessionLeitura = sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    info={"somente_leitura": True},
+)
+
+
+@event.listens_for(Session, "before_flush")
+def _bloquear_flush(session, flush_context, instances):
+    if session.info.get("somente_leitura"):
+        raise RuntimeError("Sessão somente leitura: escritas devem usar get_db (primária).")
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bloquear_dml(estado):
+    if estado.session.info.get("somente_leitura") and (estado.is_insert or estado.is_update or estado.is_delete):
+        raise RuntimeError("Sessão somente leitura: escritas devem usar get_db (primária).")
 
 # Defina a Base aqui!
 Base = declarative_base()
 
+
+# --- Réplicas de leitura ---
+
+# Geração global dos dados (ver cache.py): a réplica está em dia quando já recebeu a última escrita da primária
+_SQL_GERACAO_GLOBAL = text("SELECT geracao FROM cache_geracao WHERE reservatorio_id = 0")
+
+
+class Replica:
+    """Engine de uma réplica de leitura e o estado observado por este worker (falhas e atraso)."""
+
+    def __init__(self, indice: int, url: str):
+        self.nome = f"replica{indice}"
+        self.url = _url_assincrona(url)
+        self.engine = _criar_engine(self.url, somente_leitura=True)
+        self.leituras = 0
+        self.falhas = 0
+        # Instantes em time.monotonic()
+        self.fora_ate = 0.0
+        self.verificada_em: Optional[float] = None
+        # Primeira verificação em que a réplica estava atrás da primária (None se estava em dia)
+        self.atrasada_desde: Optional[float] = None
+
+    def atraso(self, agora: float) -> float:
+        """Estimativa do atraso: há quanto tempo a réplica está sem a última escrita conhecida da primária."""
+        return 0.0 if self.atrasada_desde is None else agora - self.atrasada_desde
+
+    def registrar_falha(self, erro: Exception) -> None:
+        self.falhas += 1
+        self.fora_ate = time.monotonic() + DB_REPLICA_PAUSA_SEGUNDOS
+        self.verificada_em = None
+        print(f"⚠️ Réplica {self.nome} fora do rodízio por {DB_REPLICA_PAUSA_SEGUNDOS:.0f}s: "
+              f"{erro.__class__.__name__}: {erro}")
+
+
+replicas = [Replica(i, url) for i, url in enumerate(DATABASE_REPLICA_URLS)]
+_rodizio = itertools.count()
+_leituras_primaria = {"leituras": 0, "fallbacks": 0}
+# Última geração global lida da primária (ou escrita por este worker) e o instante da leitura
+_geracao_primaria = {"geracao": None, "lida_em": 0.0}
+
+
+def todos_os_engines() -> List[AsyncEngine]:
+    return [engine] + [r.engine for r in replicas]
+
+
+async def _geracao_global(conexao) -> int:
+    return (await conexao.execute(_SQL_GERACAO_GLOBAL)).scalar() or 0
+
+
+def registrar_geracao_primaria(geracao: int) -> None:
+    """Chamada por cache.invalidar com a geração global que a escrita deste worker acabou de gravar."""
+    atual = _geracao_primaria["geracao"]
+    _geracao_primaria["geracao"] = geracao if atual is None else max(atual, geracao)
+    _geracao_primaria["lida_em"] = time.monotonic()
+
+
+async def geracao_primaria() -> int:
+    """
+    Geração global da primária conhecida por este worker. Só consulta a primária quando o valor guardado tem
+    mais de DB_REPLICA_GERACAO_TTL_SEGUNDOS, em vez de a cada sessão de leitura que verifica uma réplica.
+    """
+    if (_geracao_primaria["geracao"] is None
+            or time.monotonic() - _geracao_primaria["lida_em"] >= DB_REPLICA_GERACAO_TTL_SEGUNDOS):
+        async with engine.connect() as primaria:
+            registrar_geracao_primaria(await _geracao_global(primaria))
+    return _geracao_primaria["geracao"]
+
+
+async def abrir_sessao_leitura(candidatas: Optional[List[Replica]] = None,
+                               atualizada: bool = False) -> Tuple[AsyncSession, Optional[Replica]]:
+    """
+    Abre uma sessão somente leitura na próxima réplica do rodízio que esteja disponível e dentro do atraso
+    aceito. Com `atualizada` a réplica só é usada se já tiver a última escrita conhecida da primária
+    (geracao_primaria), para endpoints que precisam enxergar uma sincronização recém-concluída. Sem réplica
+    utilizável, ou se a conexão falhar, a sessão é aberta na primária. Retorna a sessão e a réplica (None =
+    primária).
+    """
+    if candidatas is None:
+        inicio = next(_rodizio) % len(replicas) if replicas else 0
+        candidatas = replicas[inicio:] + replicas[:inicio]
+    geracao = None
+    for replica in candidatas:
+        agora = time.monotonic()
+        if agora < replica.fora_ate:
+            continue
+        verificar = (atualizada or replica.verificada_em is None
+                     or agora - replica.verificada_em >= DB_REPLICA_VERIFICACAO_SEGUNDOS)
+        if verificar and geracao is None:
+            geracao = await geracao_primaria()
+        sessao = AsyncSessionLeitura(bind=replica.engine)
+        try:
+            await _obter_conexao(sessao)
+            if verificar:
+                em_dia = await _geracao_global(sessao) >= geracao
+                replica.verificada_em = agora
+                replica.atrasada_desde = None if em_dia else (replica.atrasada_desde or agora)
+                if atualizada and not em_dia:
+                    await sessao.close()
+                    continue
+        except (OSError, DBAPIError, PoolTimeoutError, asyncio.TimeoutError) as erro:
+            await sessao.close()
+            replica.registrar_falha(erro)
+            continue
+        if replica.atraso(agora) > DB_REPLICA_ATRASO_MAX_SEGUNDOS:
+            await sessao.close()
+            continue
+        replica.leituras += 1
+        return sessao, replica
+
+    _leituras_primaria["leituras"] += 1
+    if replicas:
+        _leituras_primaria["fallbacks"] += 1
+    sessao = AsyncSessionLeitura()
+    await _obter_conexao(sessao)
+    return sessao, None
+
+
+@asynccontextmanager
+async def sessao_leitura(request: Optional[Request] = None, atualizada: bool = False):
+    """
+    Sessão somente leitura. Com `request`, a primeira escolha (réplica ou primária) vale para a requisição
+    inteira: o GET condicional e o endpoint leem do mesmo banco, e o ETag corresponde aos dados enviados.
+    """
+    candidatas = None
+    if request is not None and hasattr(request.state, "replica_leitura"):
+        escolhida = request.state.replica_leitura
+        candidatas = [escolhida] if escolhida is not None else []
+    sessao, replica = await abrir_sessao_leitura(candidatas, atualizada)
+    if request is not None:
+        request.state.replica_leitura = replica
+    try:
+        yield sessao
+    finally:
+        await sessao.close()
+
+
+async def get_db_leitura(request: Request) -> AsyncSession:
+    """Dependência dos endpoints GET: réplica em rodízio, com atraso limitado e queda para a primária."""
+    async with sessao_leitura(request) as db:
+        yield db
+
+
+async def get_db_leitura_atualizada(request: Request) -> AsyncSession:
+    """Como get_db_leitura, mas só usa uma réplica que já tenha a última escrita da primária."""
+    async with sessao_leitura(request, atualizada=True) as db:
+        yield db
+
+
+def estado_replicas() -> List[dict]:
+    agora = time.monotonic()
+    return [{"replica": r.nome, "url": r.url.render_as_string(hide_password=True),
+             "disponivel": agora >= r.fora_ate, "leituras": r.leituras, "falhas": r.falhas,
+             "atraso_segundos": round(r.atraso(agora), 3)} for r in replicas]
+
+
+def reiniciar_pool() -> None:
+    """
+    Descarta, sem fechar, as conexões herdadas do processo pai. Chamada logo após o fork de cada worker do
+    gunicorn com --preload (ver gunicorn.conf.py): o worker passa a abrir as próprias conexões em vez de
+    compartilhar sockets com o master.
+    """
+    for motor in todos_os_engines():
+        motor.sync_engine.dispose(close=False)
+
+
+# Espera para obter uma conexão do pool, medida em get_db (por worker)
+_espera_pool = {"checkouts": 0, "espera_total_s": 0.0, "espera_max_s": 0.0, "timeouts": 0}
+
+
+def pool_stats() -> dict:
+    """Ocupação do pool de conexões deste worker e o tempo de espera por conexão."""
+    pool = engine.sync_engine.pool
+    stats = {"backend": async_db_url.get_backend_name(), "pool": pool.__class__.__name__}
+    if hasattr(pool, "checkedout"):
+        stats.update(
+            tamanho=pool.size(),
+            max_overflow=DB_MAX_OVERFLOW,
+            em_uso=pool.checkedout(),
+            disponiveis=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    checkouts = _espera_pool["checkouts"]
+    stats.update(
+        checkouts=checkouts,
+        espera_media_ms=round(_espera_pool["espera_total_s"] / checkouts * 1000, 3) if checkouts else 0.0,
+        espera_max_ms=round(_espera_pool["espera_max_s"] * 1000, 3),
+        timeouts=_espera_pool["timeouts"],
+    )
+    if replicas:
+        stats.update(leituras_primaria=_leituras_primaria["leituras"],
+                     fallbacks_primaria=_leituras_primaria["fallbacks"], replicas=estado_replicas())
+    return stats
+
+
+async def _obter_conexao(db: AsyncSession) -> None:
+    """Obtém a conexão da sessão já na abertura, para medir quanto a requisição esperou pelo pool."""
+    inicio = time.perf_counter()
+    try:
+        await db.connection()
+    except PoolTimeoutError:
+        _espera_pool["timeouts"] += 1
+        raise
+    espera = time.perf_counter() - inicio
+    _espera_pool["checkouts"] += 1
+    _espera_pool["espera_total_s"] += espera
+    _espera_pool["espera_max_s"] = max(_espera_pool["espera_max_s"], espera)
+
+
 async def get_db() -> AsyncSession:
+    """Sessão na primária, para escritas e leituras que não podem ir para uma réplica."""
     async with AsyncSessionLocal() as db:
+        await _obter_conexao(db)
         yield db
+
+
+async def em_paralelo(db: AsyncSession, *consultas: Callable[[AsyncSession], Awaitable]) -> List:
+    """
+    Executa leituras independentes ao mesmo tempo e retorna os resultados na ordem das consultas.
+    Uma AsyncSession não executa comandos concorrentes: a primeira consulta usa a sessão da requisição (`db`)
+    e cada uma das demais uma sessão própria do pool, então a latência fica próxima à da consulta mais lenta.
+    Com DB_CONSULTAS_PARALELAS desligado (padrão no SQLite) ou SQLite em memória, que tem uma única conexão
+    compartilhada, as consultas rodam em sequência na sessão da requisição. As sessões extras são limitadas
+    por DB_CONSULTAS_PARALELAS_MAX: sem vaga livre, a consulta roda em sequência na sessão da requisição em
+    vez de esperar por uma conexão do pool.
+    """
+    if not DB_CONSULTAS_PARALELAS or SQLITE_MEMORIA:
+        return [await consulta(db) for consulta in consultas]
+
+    # As demais sessões usam o mesmo banco (e o mesmo modo) da sessão da requisição, mesmo numa réplica
+    fabrica = AsyncSessionLeitura if db.info.get("somente_leitura") else AsyncSessionLocal
+
+    async def em_sessao_propria(consulta):
+        async with fabrica(bind=db.bind) as sessao:
+            return await consulta(sessao)
+
+    async def em_sequencia(consultas_requisicao):
+        return [await consulta(db) for consulta in consultas_requisicao]
+
+    primeira, *demais = consultas
+    vagas = 0
+    try:
+        # Sem espera: uma vaga ocupada não bloqueia a requisição, que segue com a própria conexão
+        while vagas < len(demais) and not _vagas_paralelas.locked():
+            await _vagas_paralelas.acquire()
+            vagas += 1
+        na_requisicao, *em_sessoes = await asyncio.gather(
+            em_sequencia([primeira, *demais[vagas:]]), *(em_sessao_propria(c) for c in demais[:vagas]))
+    finally:
+        for _ in range(vagas):
+            _vagas_paralelas.release()
+    return [na_requisicao[0], *em_sessoes, *na_requisicao[1:]]
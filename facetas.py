@@ -0,0 +1,91 @@
+# facetas.py
+# Índice em memória (por worker) dos planos de ação de cada reservatório para os filtros em cascata do
+# frontend. Cada faceta (estado, impacto, problema, ação, situação) é codificada como um array de inteiros;
+# a seleção vira uma máscara NumPy e as contagens saem de um bincount, sem consultar o banco.
+# O índice é refeito quando a geração do reservatório (ver cache.py) muda, isto é, quando os dados mudam.
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import crud
+
+if TYPE_CHECKING:
+    # Importado dentro das funções: a aplicação só carrega NumPy quando um índice é montado ou consultado
+    import numpy as np
+
+# Parâmetro da API -> coluna de PlanoAcao
+FACETAS = {
+    "estado": "estado_seca",
+    "impacto": "tipos_impactos",
+    "problema": "problemas",
+    "acao": "acoes",
+    "situacao": "situacao",
+}
+
+Selecao = Dict[str, Optional[Sequence[str]]]
+
+
+class IndiceFacetas:
+    """Planos de ação de um reservatório com as facetas codificadas para filtrar e contar em NumPy."""
+
+    def __init__(self, planos: list):
+        import numpy as np
+        self.planos = planos
+        self.valores: Dict[str, List[str]] = {}
+        self.posicoes: Dict[str, Dict[str, int]] = {}
+        self.codigos: Dict[str, "np.ndarray"] = {}
+        for faceta, coluna in FACETAS.items():
+            brutos = [getattr(p, coluna) for p in planos]
+            valores = sorted({v for v in brutos if v})
+            posicoes = {v: i for i, v in enumerate(valores)}
+            self.valores[faceta] = valores
+            self.posicoes[faceta] = posicoes
+            # -1 para plano sem valor na faceta (nunca casa com um filtro nem entra nas contagens)
+            self.codigos[faceta] = np.array([posicoes.get(v, -1) for v in brutos], dtype=np.int32)
+
+    def _mascara(self, selecao: Selecao, exceto: Optional[str] = None) -> "np.ndarray":
+        """Planos que atendem à seleção: OU entre os valores de uma faceta, E entre facetas."""
+        import numpy as np
+        mascara = np.ones(len(self.planos), dtype=bool)
+        for faceta, escolhidos in selecao.items():
+            escolhidos = [v for v in (escolhidos or ()) if v]
+            if faceta == exceto or not escolhidos:
+                continue
+            posicoes = self.posicoes[faceta]
+            mascara &= np.isin(self.codigos[faceta], [posicoes[v] for v in escolhidos if v in posicoes])
+        return mascara
+
+    def filtrar(self, selecao: Selecao) -> list:
+        import numpy as np
+        return [self.planos[i] for i in np.flatnonzero(self._mascara(selecao))]
+
+    def contar(self, selecao: Selecao) -> dict:
+        """
+        Total de planos da seleção e, para cada faceta, os valores com a contagem de planos que restariam ao
+        escolhê-los, aplicando as seleções das demais facetas (a faceta não filtra a si mesma, para que a
+        interface possa marcar mais de um valor). Valores já escolhidos aparecem mesmo com contagem zero.
+        """
+        import numpy as np
+        facetas = {}
+        for faceta, valores in self.valores.items():
+            codigos = self.codigos[faceta][self._mascara(selecao, exceto=faceta)]
+            totais = np.bincount(codigos[codigos >= 0], minlength=len(valores))
+            escolhidos = set(selecao.get(faceta) or ())
+            facetas[faceta] = [{"valor": v, "total": int(t)} for v, t in zip(valores, totais) if t or v in escolhidos]
+        return {"total": int(self._mascara(selecao).sum()), "facetas": facetas}
+
+
+# reservatorio_id -> (geração, índice)
+_indices: Dict[int, tuple] = {}
+
+
+async def obter_indice(db: AsyncSession, reservatorio_id: int) -> IndiceFacetas:
+    """Índice do reservatório; só consulta os planos quando a geração dos dados mudou desde a última montagem."""
+    geracao = await cache.get_geracao(db, reservatorio_id)
+    atual = _indices.get(reservatorio_id)
+    if atual is not None and atual[0] == geracao:
+        return atual[1]
+    indice = IndiceFacetas(await crud.get_action_plan_rows(db, reservatorio_id))
+    _indices[reservatorio_id] = (geracao, indice)
+    return indice
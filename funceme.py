@@ -0,0 +1,152 @@
+# funceme.py
+# Sincronização das séries de volume dos reservatórios com a API da FUNCEME.
+# Pode ser executado como comando: python funceme.py [--ids 1 2 3] [--concorrencia 4]
+import argparse
+import asyncio
+import os
+import random
+from datetime import date, timedelta
+from typing import List, Optional
+
+import httpx
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import crud
+import models
+from database import AsyncSessionLocal
+
+FUNCEME_API_URL = os.getenv("FUNCEME_API_URL", "https://apil5.funceme.br/rpc/v1/reservatorio-series")
+FUNCEME_DATA_INICIAL = date.fromisoformat(os.getenv("FUNCEME_DATA_INICIAL", "2023-01-01"))
+FUNCEME_CONCORRENCIA = int(os.getenv("FUNCEME_CONCORRENCIA", "4"))
+FUNCEME_TENTATIVAS = int(os.getenv("FUNCEME_TENTATIVAS", "3"))
+FUNCEME_TIMEOUT = float(os.getenv("FUNCEME_TIMEOUT", "30"))
+FUNCEME_BACKOFF = float(os.getenv("FUNCEME_BACKOFF", "1.0"))
+
+
+class FuncemeError(Exception):
+    """Falha ao obter dados da FUNCEME depois de esgotadas as tentativas."""
+
+
+def criar_cliente(concorrencia: int = FUNCEME_CONCORRENCIA) -> httpx.AsyncClient:
+    """Cliente HTTP com pool de conexões dimensionado para a concorrência da sincronização."""
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    return httpx.AsyncClient(timeout=FUNCEME_TIMEOUT, limits=limites)
+
+
+async def buscar_serie(client: httpx.AsyncClient, codigo_funceme: str, inicio: date, fim: date) -> list:
+    """Busca a série diária do reservatório, repetindo com backoff exponencial em erros de rede ou 5xx/429."""
+    params = {"reservatorio_id": codigo_funceme, "data_inicio": inicio.isoformat(), "data_fim": fim.isoformat()}
+    for tentativa in range(FUNCEME_TENTATIVAS):
+        try:
+            response = await client.get(FUNCEME_API_URL, params=params)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response.json().get('data', {}).get('list', [])
+            erro = f"HTTP {response.status_code}"
+        except httpx.RequestError as e:
+            erro = str(e) or e.__class__.__name__
+        if tentativa < FUNCEME_TENTATIVAS - 1:
+            await asyncio.sleep(FUNCEME_BACKOFF * 2 ** tentativa + random.uniform(0, FUNCEME_BACKOFF))
+    raise FuncemeError(f"Erro de conexão ao buscar dados da FUNCEME: {erro}")
+
+
+async def inserir_leituras(db: AsyncSession, registros: List[dict]) -> List[date]:
+    """INSERT ... ON CONFLICT DO NOTHING em (reservatorio_id, data). Retorna as datas efetivamente inseridas."""
+    if not registros:
+        return []
+    dialeto = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    query = (
+        dialeto.insert(models.Monitoramento)
+        .on_conflict_do_nothing(index_elements=["reservatorio_id", "data"])
+        .returning(models.Monitoramento.data)
+    )
+    result = await db.execute(query, registros)
+    return list(result.scalars().all())
+
+
+async def sincronizar_reservatorio(db: AsyncSession, client: httpx.AsyncClient,
+                                   reservatorio: models.Reservatorio) -> dict:
+    """
+    Busca apenas as datas posteriores à última leitura guardada e grava as novas leituras.
+    Retorna o resumo do reservatório; `erro` indica se a sincronização falhou (ver sincronizar_todos).
+    """
+    ultima_data = (await db.execute(
+        select(func.max(models.Monitoramento.data)).where(models.Monitoramento.reservatorio_id == reservatorio.id)
+    )).scalar()
+    inicio = ultima_data + timedelta(days=1) if ultima_data else FUNCEME_DATA_INICIAL
+    fim = date.today()
+    resultado = {"reservatorio_id": reservatorio.id, "nome": reservatorio.nome, "novos_registros": 0, "erro": False}
+    if inicio > fim:
+        resultado["status"] = f"Nenhum registro novo para '{reservatorio.nome}'. O banco de dados já está atualizado."
+        return resultado
+
+    print(f"📡 Buscando dados para o reservatório '{reservatorio.nome}' (FUNCEME ID: {reservatorio.codigo_funceme}) desde {inicio}...")
+    dados_reais = await buscar_serie(client, reservatorio.codigo_funceme, inicio, fim)
+    if not dados_reais:
+        resultado["status"] = "A API da FUNCEME não retornou novos dados para este reservatório."
+        return resultado
+
+    registros = []
+    for registro in dados_reais:
+        data_registro = date.fromisoformat(registro['data'])
+        if data_registro >= inicio:
+            registros.append({
+                "data": data_registro,
+                "volume_hm3": registro.get('volume'),
+                "volume_percentual": registro.get('volume_perc'),
+                "reservatorio_id": reservatorio.id,
+            })
+
+    inseridas = await inserir_leituras(db, registros)
+    if not inseridas:
+        resultado["status"] = f"Nenhum registro novo para '{reservatorio.nome}'. O banco de dados já está atualizado."
+        return resultado
+
+    await crud.update_history_status(db, reservatorio_id=reservatorio.id, desde=min(inseridas))
+    await cache.invalidar(db, reservatorio.id)
+    await db.commit()
+    resultado["novos_registros"] = len(inseridas)
+    resultado["status"] = f"{len(inseridas)} novos registros de monitoramento foram adicionados para '{reservatorio.nome}'."
+    return resultado
+
+
+async def sincronizar_todos(reservatorio_ids: Optional[List[int]] = None,
+                            concorrencia: int = FUNCEME_CONCORRENCIA) -> List[dict]:
+    """
+    Sincroniza todos os reservatórios com código da FUNCEME em paralelo, limitado por `concorrencia`.
+    Cada reservatório usa a sua própria sessão; o cliente HTTP (e o pool de conexões) é compartilhado.
+    Falhas de um reservatório não interrompem os demais: o resultado dele vem com `erro` verdadeiro.
+    """
+    async with AsyncSessionLocal() as db:
+        query = select(models.Reservatorio).where(models.Reservatorio.codigo_funceme.is_not(None))
+        if reservatorio_ids:
+            query = query.where(models.Reservatorio.id.in_(reservatorio_ids))
+        reservatorios = (await db.execute(query.order_by(models.Reservatorio.id))).scalars().all()
+
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def tarefa(client: httpx.AsyncClient, reservatorio: models.Reservatorio) -> dict:
+        async with semaforo, AsyncSessionLocal() as db:
+            try:
+                return await sincronizar_reservatorio(db, client, reservatorio)
+            except (FuncemeError, httpx.HTTPStatusError, ValueError, SQLAlchemyError) as e:
+                await db.rollback()
+                return {"reservatorio_id": reservatorio.id, "nome": reservatorio.nome, "novos_registros": 0,
+                        "erro": True, "status": f"Erro: {e}"}
+
+    async with criar_cliente(concorrencia) as client:
+        return list(await asyncio.gather(*(tarefa(client, r) for r in reservatorios)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza os dados de monitoramento com a API da FUNCEME.")
+    parser.add_argument("--ids", type=int, nargs="*", help="IDs dos reservatórios (padrão: todos)")
+    parser.add_argument("--concorrencia", type=int, default=FUNCEME_CONCORRENCIA)
+    args = parser.parse_args()
+
+    for item in asyncio.run(sincronizar_todos(args.ids, args.concorrencia)):
+        print(f"-> [{item['reservatorio_id']}] {item['status']}")
@@ -0,0 +1,18 @@
+# gunicorn.conf.py
+# Ganchos do gunicorn, lido automaticamente do diretório da aplicação (ver Procfile).
+# Com --preload o master importa a aplicação uma única vez antes do fork: os workers não repetem a
+# importação e compartilham as páginas dos módulos já carregados (copy-on-write).
+import importlib
+
+
+def when_ready(server):
+    # pandas é importado sob demanda pelos endpoints de série; carregado no master (antes de criar os
+    # workers), fica compartilhado em vez de cada worker importar a sua cópia na primeira requisição
+    if server.cfg.preload_app:
+        importlib.import_module("pandas")
+
+
+def post_fork(server, worker):
+    # Cada worker começa com o pool de conexões vazio, sem herdar conexões do master
+    import database
+    database.reiniciar_pool()
@@ -0,0 +1,111 @@
+# http_cache.py
+# GET condicional (ETag / Last-Modified) para os endpoints de reservatório e cache HTTP dos arquivos estáticos.
+import hashlib
+import os
+import re
+from datetime import datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+
+import crud
+import imagens
+import metricas
+from database import sessao_leitura
+
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "86400"))
+# Arquivos com o hash do conteúdo no nome nunca mudam: podem ficar no cache do navegador por um ano
+STATIC_IMUTAVEL_MAX_AGE = 31536000
+
+_ROTA_RESERVATORIO = re.compile(r"^/api/reservatorios/(\d+)/")
+# Endpoints cujas respostas trazem as URLs das variantes de imagem (ver imagens.py): a versão inclui o manifesto
+_ROTA_COM_IMAGENS = re.compile(r"^/api/reservatorios/\d+/identification$")
+# Endpoints que dependem de get_db_leitura_atualizada: a versão só pode vir de uma réplica já em dia
+_ROTA_ATUALIZADA = re.compile(r"^/api/reservatorios/\d+/dashboard/summary$")
+
+
+def _calcular_etag(request: Request, versao: dict) -> str:
+    consulta = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    base = f"{request.url.path}?{consulta}|{versao['ultima_data']}|{versao['geracao']}|{versao.get('imagens', '')}"
+    return '"' + hashlib.sha1(base.encode()).hexdigest() + '"'
+
+
+def _ultima_modificacao(versao: dict):
+    ultima = None
+    if versao["atualizado_em"] is not None:
+        atualizado_em = versao["atualizado_em"]
+        ultima = atualizado_em if atualizado_em.tzinfo else atualizado_em.replace(tzinfo=timezone.utc)
+    elif versao["ultima_data"] is not None:
+        ultima = datetime.combine(versao["ultima_data"], time.min, tzinfo=timezone.utc)
+    imagens_em = versao.get("imagens_modificadas_em")
+    if imagens_em is not None and (ultima is None or imagens_em > ultima):
+        return imagens_em
+    return ultima
+
+
+def _nao_modificado(request: Request, etag: str, ultima_modificacao) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and ultima_modificacao is not None:
+        try:
+            desde = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return ultima_modificacao.replace(microsecond=0) <= desde
+    return False
+
+
+async def conditional_get(request: Request, call_next):
+    """
+    Responde 304 antes de executar o endpoint quando o cliente já possui a versão atual dos dados.
+    A versão vem de `crud.get_versao_reservatorio`: geração do cache e última data, lidas por índice.
+    """
+    combinacao = _ROTA_RESERVATORIO.match(request.url.path)
+    if request.method not in ("GET", "HEAD") or not combinacao:
+        return await call_next(request)
+
+    # Lida no mesmo banco (réplica ou primária) que o endpoint vai usar, para o ETag corresponder ao corpo.
+    # Nas rotas atualizadas uma réplica atrasada responderia 304 com a versão anterior a uma sincronização.
+    async with sessao_leitura(request, atualizada=bool(_ROTA_ATUALIZADA.match(request.url.path))) as db:
+        versao = await crud.get_versao_reservatorio(db, int(combinacao.group(1)))
+    if _ROTA_COM_IMAGENS.match(request.url.path):
+        # As variantes têm o hash no nome e as antigas são apagadas a cada deploy: uma imagem nova muda a versão
+        versao.update(imagens=imagens.versao_manifesto(), imagens_modificadas_em=imagens.manifesto_modificado_em())
+
+    etag = _calcular_etag(request, versao)
+    ultima_modificacao = _ultima_modificacao(versao)
+    cabecalhos = {"ETag": etag, "Cache-Control": "no-cache"}
+    if ultima_modificacao is not None:
+        cabecalhos["Last-Modified"] = format_datetime(ultima_modificacao, usegmt=True)
+
+    if _nao_modificado(request, etag, ultima_modificacao):
+        # O 304 não passa pelo roteador: a rota é resolvida aqui para as métricas por endpoint
+        metricas.resolver_rota(request.scope)
+        return Response(status_code=304, headers=cabecalhos)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(cabecalhos)
+    return response
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles com `Cache-Control` para que o navegador reaproveite as imagens dos reservatórios."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+        return response
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles das variantes de imagem (nomes com hash do conteúdo), servidas com cache imutável."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_IMUTAVEL_MAX_AGE}, immutable"
+        return response
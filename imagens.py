@@ -0,0 +1,204 @@
+# imagens.py
+# Variantes redimensionadas (miniatura, cartão e inteira) das imagens dos reservatórios em WebP e JPEG, com o
+# hash do conteúdo no nome do arquivo para que possam ser servidas com cache imutável. Um manifesto
+# (static/variants/manifest.json) liga cada imagem original às suas variantes e é lido pela API para montar
+# os `srcset`. As variantes são geradas por `python imagens.py` antes de subir o servidor (ver Procfile);
+# só as imagens novas ou alteradas são processadas.
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import unicodedata
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+DIRETORIO_ORIGINAIS = os.path.join("static", "images")
+DIRETORIO_VARIANTES = os.path.join("static", "variants")
+ARQUIVO_MANIFESTO = "manifest.json"
+EXTENSOES = (".jpg", ".jpeg", ".png", ".webp")
+
+# Variante -> largura máxima em pixels (as imagens menores não são ampliadas)
+VARIANTES = {"thumb": 320, "card": 800, "full": 1600}
+QUALIDADE_WEBP = int(os.getenv("IMAGENS_QUALIDADE_WEBP", "80"))
+QUALIDADE_JPEG = int(os.getenv("IMAGENS_QUALIDADE_JPEG", "82"))
+# Variante usada como `src` (fallback dos navegadores sem suporte a srcset)
+VARIANTE_PADRAO = "card"
+
+
+def _chave(nome: str) -> str:
+    """Nome da imagem como chave do manifesto: os nomes gravados no banco nem sempre batem em caixa/acentuação."""
+    return unicodedata.normalize("NFC", nome).casefold()
+
+
+def _slug(nome: str) -> str:
+    base = unicodedata.normalize("NFKD", os.path.splitext(nome)[0]).encode("ascii", "ignore").decode()
+    return "".join(c if c.isalnum() or c in "-_" else "-" for c in base.lower())
+
+
+def _impressao_digital(conteudo: bytes) -> str:
+    """Hash do arquivo original e dos parâmetros de geração: mudar qualquer um deles gera novos nomes."""
+    parametros = f"{sorted(VARIANTES.items())}|{QUALIDADE_WEBP}|{QUALIDADE_JPEG}".encode()
+    return hashlib.sha256(conteudo + parametros).hexdigest()[:12]
+
+
+def _gravar(imagem, caminho: str, formato: str, **opcoes) -> None:
+    """Grava num arquivo temporário e renomeia, para outro processo nunca servir um arquivo pela metade."""
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    imagem.save(temporario, formato, **opcoes)
+    os.replace(temporario, caminho)
+
+
+def _gerar(caminho_original: str, nome: str, impressao: str, destino: str) -> dict:
+    from PIL import Image, ImageOps
+
+    with Image.open(caminho_original) as aberta:
+        # Fotos de celular guardam a rotação no EXIF; aplica antes de redimensionar
+        original = ImageOps.exif_transpose(aberta)
+        original.load()
+    largura, altura = original.size
+    com_alfa = original.mode in ("RGBA", "LA") or (original.mode == "P" and "transparency" in original.info)
+    original = original.convert("RGBA" if com_alfa else "RGB")
+
+    variantes = {}
+    geradas: Dict[int, dict] = {}
+    for variante, largura_maxima in VARIANTES.items():
+        largura_alvo = min(largura_maxima, largura)
+        if largura_alvo not in geradas:
+            altura_alvo = max(1, round(altura * largura_alvo / largura))
+            reduzida = original if largura_alvo == largura else original.resize((largura_alvo, altura_alvo), Image.LANCZOS)
+            prefixo = f"{_slug(nome)}-{largura_alvo}w-{impressao}"
+            _gravar(reduzida, os.path.join(destino, f"{prefixo}.webp"), "WEBP", quality=QUALIDADE_WEBP, method=4)
+            if com_alfa:
+                # JPEG não tem transparência: compõe sobre fundo branco, como o dashboard exibe
+                fundo = Image.new("RGB", reduzida.size, (255, 255, 255))
+                fundo.paste(reduzida, mask=reduzida.getchannel("A"))
+                reduzida = fundo
+            _gravar(reduzida, os.path.join(destino, f"{prefixo}.jpg"), "JPEG", quality=QUALIDADE_JPEG,
+                    optimize=True, progressive=True)
+            geradas[largura_alvo] = {"largura": largura_alvo, "altura": altura_alvo,
+                                     "webp": f"{prefixo}.webp", "jpeg": f"{prefixo}.jpg"}
+        variantes[variante] = geradas[largura_alvo]
+    return {"original": nome, "hash": impressao, "largura": largura, "altura": altura, "variantes": variantes}
+
+
+def gerar_variantes(origem: str = DIRETORIO_ORIGINAIS, destino: str = DIRETORIO_VARIANTES,
+                    forcar: bool = False) -> int:
+    """
+    Gera as variantes das imagens novas ou alteradas, regrava o manifesto e remove as variantes órfãs.
+    Um lock de arquivo serializa execuções simultâneas: as seguintes encontram tudo pronto.
+    Retorna quantas imagens foram (re)processadas.
+    """
+    if not os.path.isdir(origem):
+        return 0
+    os.makedirs(destino, exist_ok=True)
+    with open(os.path.join(destino, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        anterior = {} if forcar else _ler_manifesto(destino)
+        imagens, processadas = {}, 0
+        for nome in sorted(os.listdir(origem)):
+            if not nome.lower().endswith(EXTENSOES):
+                continue
+            caminho = os.path.join(origem, nome)
+            with open(caminho, "rb") as arquivo:
+                impressao = _impressao_digital(arquivo.read())
+            entrada = anterior.get(_chave(nome))
+            arquivos = [a for v in (entrada or {}).get("variantes", {}).values() for a in (v["webp"], v["jpeg"])]
+            if (entrada is None or entrada["hash"] != impressao
+                    or not all(os.path.exists(os.path.join(destino, a)) for a in arquivos)):
+                entrada = _gerar(caminho, nome, impressao, destino)
+                processadas += 1
+            imagens[_chave(nome)] = entrada
+
+        if processadas or len(imagens) != len(anterior):
+            temporario = os.path.join(destino, f"{ARQUIVO_MANIFESTO}.{os.getpid()}.tmp")
+            with open(temporario, "w", encoding="utf-8") as arquivo:
+                json.dump({"imagens": imagens}, arquivo, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(temporario, os.path.join(destino, ARQUIVO_MANIFESTO))
+            referenciados = {a for e in imagens.values() for v in e["variantes"].values() for a in (v["webp"], v["jpeg"])}
+            for arquivo in os.listdir(destino):
+                if arquivo.endswith((".webp", ".jpg")) and arquivo not in referenciados:
+                    os.remove(os.path.join(destino, arquivo))
+        return processadas
+
+
+def _ler_manifesto(destino: str = DIRETORIO_VARIANTES) -> dict:
+    try:
+        with open(os.path.join(destino, ARQUIVO_MANIFESTO), encoding="utf-8") as arquivo:
+            return json.load(arquivo)["imagens"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return {}
+
+
+# (mtime do manifesto em ns, imagens, hash do conteúdo); relido quando o arquivo muda
+_manifesto: Optional[tuple] = None
+
+
+def _manifesto_atual() -> Optional[tuple]:
+    global _manifesto
+    caminho = os.path.join(DIRETORIO_VARIANTES, ARQUIVO_MANIFESTO)
+    try:
+        modificado = os.stat(caminho).st_mtime_ns
+        if _manifesto is None or _manifesto[0] != modificado:
+            with open(caminho, "rb") as arquivo:
+                conteudo = arquivo.read()
+            try:
+                imagens = json.loads(conteudo)["imagens"]
+            except (ValueError, KeyError):
+                imagens = {}
+            _manifesto = (modificado, imagens, hashlib.sha256(conteudo).hexdigest()[:12])
+    except FileNotFoundError:
+        _manifesto = None
+    return _manifesto
+
+
+def manifesto() -> dict:
+    atual = _manifesto_atual()
+    return atual[1] if atual else {}
+
+
+def versao_manifesto() -> str:
+    """
+    Hash do manifesto ("" se ainda não foi gerado). Muda sempre que alguma variante muda de nome; entra no
+    ETag e na chave do cache das respostas que trazem as URLs das variantes (as antigas são removidas).
+    """
+    atual = _manifesto_atual()
+    return atual[2] if atual else ""
+
+
+def manifesto_modificado_em() -> Optional[datetime]:
+    """Quando o manifesto foi gravado, para o Last-Modified das respostas com as URLs das variantes."""
+    atual = _manifesto_atual()
+    return datetime.fromtimestamp(atual[0] / 1e9, tz=timezone.utc) if atual else None
+
+
+def variantes(nome_imagem: Optional[str], url_base: str) -> Optional[dict]:
+    """URLs das variantes de uma imagem no formato de `<img srcset>` / `<source type="image/webp">`."""
+    if not nome_imagem:
+        return None
+    entrada = manifesto().get(_chave(nome_imagem))
+    if entrada is None:
+        return None
+    prefixo = f"{url_base}/static/variants/"
+    por_largura = {v["largura"]: v for v in entrada["variantes"].values()}
+    padrao = entrada["variantes"][VARIANTE_PADRAO]
+    return {
+        "src": prefixo + padrao["jpeg"],
+        "srcset": ", ".join(f"{prefixo}{v['jpeg']} {w}w" for w, v in sorted(por_largura.items())),
+        "srcset_webp": ", ".join(f"{prefixo}{v['webp']} {w}w" for w, v in sorted(por_largura.items())),
+        "largura": entrada["largura"],
+        "altura": entrada["altura"],
+        "variantes": {nome: {"largura": v["largura"], "altura": v["altura"],
+                             "webp": prefixo + v["webp"], "jpeg": prefixo + v["jpeg"]}
+                      for nome, v in entrada["variantes"].items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera as variantes redimensionadas das imagens dos reservatórios.")
+    parser.add_argument("--forcar", action="store_true", help="regera todas as variantes, mesmo as atualizadas")
+    args = parser.parse_args()
+    total = gerar_variantes(forcar=args.forcar)
+    print(f"✅ Variantes geradas para {total} imagem(ns); manifesto em {DIRETORIO_VARIANTES}/{ARQUIVO_MANIFESTO}.")
+    sys.exit(0)
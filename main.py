@@ -1,32 +1,57 @@
 # main.py (VERSÃO COMPLETA E OTIMIZADA PARA DEPLOY NO RAILWAY)
 import os
-import httpx
-import pandas as pd
 from contextlib import asynccontextmanager
 from datetime import date
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 # Importações locais
+import agendador
+import cache
 import crud
-import models
+import facetas
+import http_cache
+import imagens
+import mapa
+import metricas
+import migracoes
+import respostas
 import schemas
-from database import engine, get_db, Base # Importa a Base que agora vive em database.py
+import series
+import simulacao
+from database import (engine, get_db, get_db_leitura, get_db_leitura_atualizada, em_paralelo, pool_stats,
+                      estado_replicas, todos_os_engines)
+
+if TYPE_CHECKING:
+    # pandas só é carregado pelos endpoints de série (histórico e gráfico), na primeira requisição
+    import pandas as pd
 
 # Função para rodar durante o ciclo de vida da aplicação (startup e shutdown)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Aplicação a arrancar...")
-    async with engine.begin() as conn:
-        # Cria todas as tabelas (se não existirem) a partir dos modelos
-        await conn.run_sync(Base.metadata.create_all)
+    # O esquema é preparado uma vez por deploy por `python migracoes.py` (ver Procfile); cada worker só
+    # confere, com uma consulta, e prepara o banco apenas se ainda não estiver atualizado
+    async with engine.connect() as conn:
+        atualizado = await conn.run_sync(migracoes.esquema_atualizado)
+    if atualizado:
+        print("✅ Esquema do banco de dados atualizado.")
+    else:
+        novas, materializados = await migracoes.preparar_banco()
         print("✅ Tabelas do banco de dados verificadas/criadas.")
+        if novas:
+            print(f"✅ Migrações aplicadas: {novas}")
+        if materializados:
+            print(f"✅ Histórico classificado materializado para {materializados} reservatório(s).")
+    agendador.agendador.iniciar()
     yield
+    await agendador.agendador.parar()
+    simulacao.encerrar()
     print("👋 Aplicação a encerrar...")
 
 # --- Configuração da Aplicação FastAPI ---
@@ -34,10 +59,27 @@ app = FastAPI(
     title="API de Monitoramento de Seca",
     description="API para servir dados sobre reservatórios e monitoramento de seca.",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=respostas.ORJSONResponse,
 )
 
 # --- Middlewares ---
+# Compressão das respostas acima de COMPRESSAO_MIN_BYTES (séries longas comprimem ~10x).
+# Usa Brotli quando o pacote opcional brotli-asgi estiver instalado, com GZip para clientes sem suporte.
+# Fica por dentro do GET condicional para enxergar o Content-Length das respostas e respeitar o tamanho mínimo.
+COMPRESSAO_MIN_BYTES = int(os.getenv("COMPRESSAO_MIN_BYTES", "1024"))
+COMPRESSAO_NIVEL_GZIP = int(os.getenv("COMPRESSAO_NIVEL_GZIP", "6"))
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSAO_MIN_BYTES, compresslevel=COMPRESSAO_NIVEL_GZIP)
+else:
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=COMPRESSAO_MIN_BYTES, gzip_fallback=True)
+
+# GET condicional (ETag / Last-Modified) para os endpoints de reservatório.
+# Registrado antes do CORS para que as respostas 304 também recebam os cabeçalhos de CORS.
+app.middleware("http")(http_cache.conditional_get)
+
 # Adiciona o CORS para permitir que o frontend acesse a API
 app.add_middleware(
     CORSMiddleware,
@@ -45,14 +87,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor"],
 )
 
+# Métricas por requisição (latência, SQL, pandas, bytes); o mais externo para medir a resposta já comprimida
+for motor in todos_os_engines():
+    metricas.instrumentar_engine(motor)
+app.add_middleware(metricas.MetricasMiddleware)
+
 # --- Arquivos Estáticos ---
-# Monta o diretório 'static' para servir imagens
+# Monta o diretório 'static' para servir imagens. Sem check_dir os diretórios não precisam existir na
+# importação (nada é criado no master do gunicorn); um arquivo ausente apenas responde 404.
 static_dir = "static"
-if not os.path.exists(static_dir):
-    os.makedirs(os.path.join(static_dir, "images"))
-app.mount(f"/{static_dir}", StaticFiles(directory=static_dir), name="static")
+# Variantes redimensionadas das imagens (geradas por imagens.py); montadas antes para não cair em /static
+app.mount("/static/variants", http_cache.ImmutableStaticFiles(directory=imagens.DIRETORIO_VARIANTES, check_dir=False),
+          name="variants")
+app.mount(f"/{static_dir}", http_cache.CachedStaticFiles(directory=static_dir, check_dir=False), name="static")
 
 
 # --- Endpoints da API ---
@@ -63,8 +113,47 @@ def read_root():
     return {"status": "API de Monitoramento de Seca está online."}
 
 
+@app.get("/api/cache/stats", tags=["Root"])
+def get_cache_stats():
+    """Contadores de acerto/erro do cache de respostas deste worker."""
+    return cache.response_cache.stats()
+
+
+# Campos de pool_stats() e do cache de respostas que só crescem: exportados como contadores (_total)
+_CONTADORES_POOL = {
+    "checkouts": "Conexões obtidas do pool.",
+    "timeouts": "Esperas por conexão do pool que estouraram o tempo limite.",
+    "leituras_primaria": "Sessões de leitura abertas na primária.",
+    "fallbacks_primaria": "Sessões de leitura que foram para a primária por falta de réplica utilizável.",
+}
+_CONTADORES_CACHE = {
+    "hits": "Acertos do cache de respostas.",
+    "misses": "Erros do cache de respostas.",
+    "evictions": "Entradas descartadas do cache de respostas por falta de espaço.",
+}
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Métricas deste worker no formato de texto do Prometheus."""
+    pool, cache_stats = pool_stats(), cache.response_cache.stats()
+    extras = {f"dashboard_db_pool_{k}": v for k, v in pool.items()
+              if isinstance(v, (int, float)) and k not in _CONTADORES_POOL}
+    extras["dashboard_cache_itens"] = cache_stats["itens"]
+    contadores = {f"dashboard_db_pool_{k}": (ajuda, pool[k]) for k, ajuda in _CONTADORES_POOL.items() if k in pool}
+    contadores.update({f"dashboard_cache_{k}": (ajuda, cache_stats[k]) for k, ajuda in _CONTADORES_CACHE.items()})
+    return PlainTextResponse(metricas.exportar(extras, estado_replicas(), contadores),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/db/pool", tags=["Root"])
+def get_pool_stats():
+    """Ocupação do pool de conexões deste worker (em uso, overflow) e o tempo de espera por conexão."""
+    return pool_stats()
+
+
 @app.get("/api/reservatorios", response_model=List[schemas.ReservatorioSelecao], tags=["Reservatórios"])
-async def get_reservatorios_list(db: AsyncSession = Depends(get_db)):
+async def get_reservatorios_list(db: AsyncSession = Depends(get_db_leitura)):
     """Retorna uma lista de todos os reservatórios disponíveis para o seletor."""
     reservatorios = await crud.get_reservatorios(db)
     if not reservatorios:
@@ -72,8 +161,70 @@ async def get_reservatorios_list(db: AsyncSession = Depends(get_db)):
     return reservatorios
 
 
+# Visão geral e resumo são recarregados logo após uma sincronização: só leem de réplica já em dia
+@app.get("/api/dashboard/overview", response_model=List[schemas.ResumoReservatorio], tags=["Dashboard"])
+async def get_dashboard_overview(ids: Optional[List[int]] = Query(None), estado: Optional[str] = None,
+                                 db: AsyncSession = Depends(get_db_leitura_atualizada)):
+    """Situação atual (volume, estado de seca, última medição) de todos os reservatórios numa só consulta."""
+    async def produzir():
+        linhas = await crud.get_overview(db, reservatorio_ids=ids)
+        resumo = []
+        for linha in linhas:
+            referencia = linha.data_estado_anterior or linha.inicio_estado
+            resumo.append(schemas.ResumoReservatorio(
+                id=linha.id,
+                nome=linha.nome,
+                volumeAtualHm3=linha.volume_hm3,
+                volumePercentual=linha.volume_percentual * 100 if linha.volume_percentual is not None else None,
+                estadoAtualSeca=linha.estado_calculado,
+                dataUltimaMedicao=linha.data,
+                diasDesdeUltimaMudanca=(linha.data - referencia).days if linha.data else None,
+            ))
+        return resumo
+
+    resumo = await cache.cached(db, "overview", cache.GERACAO_GLOBAL, produzir, (tuple(ids or ()),))
+    if estado:
+        return [r for r in resumo if r.estadoAtualSeca == estado]
+    return resumo
+
+
+@app.get("/api/map/reservatorios", tags=["Dashboard"])
+async def get_map(formato: respostas.FormatoMapa = Query("geojson", alias="format"),
+                  bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+                  lat: Optional[float] = Query(None, ge=-90, le=90), lon: Optional[float] = Query(None, ge=-180, le=180),
+                  k: int = Query(5, ge=1, le=500), db: AsyncSession = Depends(get_db_leitura)):
+    """
+    Reservatórios com coordenadas e a situação atual para o mapa, num único payload compacto.
+    Com `bbox`, só os que estão dentro do retângulo; com `lat` e `lon`, os `k` mais próximos do ponto
+    (do mais próximo ao mais distante, com a distância em km).
+    """
+    indice = await mapa.obter_indice(db)
+    distancias = None
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=422, detail="Informe lat e lon juntos para a busca por proximidade.")
+    if lat is not None:
+        if bbox:
+            raise HTTPException(status_code=422, detail="Use bbox ou lat/lon, não os dois.")
+        posicoes, distancias = indice.vizinhos(lat, lon, k)
+    elif bbox:
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=422, detail="bbox deve ser minLon,minLat,maxLon,maxLat.")
+        if min_lon > max_lon or min_lat > max_lat:
+            raise HTTPException(status_code=422, detail="bbox com mínimos maiores que os máximos.")
+        posicoes = indice.bbox(min_lon, min_lat, max_lon, max_lat)
+    else:
+        posicoes = range(len(indice.linhas))
+    conteudo = mapa.formatar(indice, posicoes, formato, distancias)
+    if formato == "geojson":
+        return respostas.ORJSONResponse(conteudo, media_type="application/geo+json")
+    return respostas.ORJSONResponse(conteudo)
+
+
 @app.get("/api/reservatorios/{reservatorio_id}/identification", response_model=schemas.Reservatorio, tags=["Reservatórios"])
-async def get_identification_data(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
+@cache.cached_endpoint("identification", versao=imagens.versao_manifesto)
+async def get_identification_data(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura)):
     """Busca os dados de identificação de um reservatório específico."""
     identificacao = await crud.get_identificacao(db, reservatorio_id=reservatorio_id)
     if not identificacao:
@@ -87,91 +238,225 @@ async def get_identification_data(reservatorio_id: int, db: AsyncSession = Depen
     response_data = schemas.Reservatorio.model_validate(identificacao)
     response_data.url_imagem = f"{url_base}/static/images/{identificacao.nome_imagem}" if identificacao.nome_imagem else None
     response_data.url_imagem_usos = f"{url_base}/static/images/{identificacao.nome_imagem_usos}" if identificacao.nome_imagem_usos else None
+    # Versões redimensionadas em WebP/JPEG para <img srcset>; nulas enquanto as variantes não foram geradas
+    for campo, nome_imagem in (("imagem", identificacao.nome_imagem), ("imagem_usos", identificacao.nome_imagem_usos)):
+        variantes = imagens.variantes(nome_imagem, url_base)
+        setattr(response_data, campo, schemas.VariantesImagem.model_validate(variantes) if variantes else None)
 
     return response_data
 
 
+# Ver get_dashboard_overview: réplica só se já tiver a última escrita da primária
 @app.get("/api/reservatorios/{reservatorio_id}/dashboard/summary", tags=["Dashboard"])
-async def get_dashboard_summary(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
+@cache.cached_endpoint("summary")
+async def get_dashboard_summary(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura_atualizada)):
     """Retorna um resumo dos dados para o painel principal."""
-    historico = await crud.get_history_with_status(db, reservatorio_id=reservatorio_id)
-    if historico.empty:
+    ultimo_registro, medidas = await em_paralelo(
+        db,
+        lambda sessao: crud.get_latest_status(sessao, reservatorio_id=reservatorio_id),
+        lambda sessao: crud.get_action_plans_estado_atual(sessao, reservatorio_id=reservatorio_id),
+    )
+    if not ultimo_registro:
         raise HTTPException(status_code=404, detail="Dados de monitoramento não disponíveis.")
 
-    ultimo_registro = historico.iloc[0]
-    estado_atual = ultimo_registro['estado_calculado']
-    data_atual = ultimo_registro['data']
+    estado_atual = ultimo_registro.estado_calculado
+    data_atual = ultimo_registro.data
 
-    historico_anterior = historico[historico['estado_calculado'] != estado_atual]
-    dias = (data_atual - historico_anterior.iloc[0]['data']).days if not historico_anterior.empty else (data_atual - historico.iloc[-1]['data']).days
+    # O histórico materializado já guarda onde o período no estado atual começou
+    referencia = ultimo_registro.data_estado_anterior or ultimo_registro.inicio_estado
+    dias = (data_atual - referencia).days
 
-    medidas = await crud.get_action_plans(db, reservatorio_id=reservatorio_id, estado=estado_atual)
     medidas_formatadas = [{"Ação": m.acoes, "Descrição": m.descricao_acao, "Responsáveis": m.responsaveis} for m in medidas]
 
     return {
-        "volumeAtualHm3": ultimo_registro.get("volume_hm3", 0),
-        "volumePercentual": ultimo_registro.get("volume_percentual", 0) * 100,
+        "volumeAtualHm3": ultimo_registro.volume_hm3 or 0,
+        "volumePercentual": (ultimo_registro.volume_percentual or 0) * 100,
         "estadoAtualSeca": estado_atual,
         "dataUltimaMedicao": data_atual,
         "diasDesdeUltimaMudanca": dias,
         "medidasRecomendadas": medidas_formatadas
     }
 
+def _proximo_cursor(historico: "pd.DataFrame", limit: Optional[int]) -> Optional[str]:
+    """Data do último registro da página, quando a página veio cheia e pode haver mais registros."""
+    if limit and len(historico) == limit:
+        import pandas as pd
+        return pd.Timestamp(historico['data'].iloc[-1]).date().isoformat()
+    return None
+
+
 @app.get("/api/reservatorios/{reservatorio_id}/history", tags=["Histórico"])
-async def get_history_data(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    historico_com_estado = await crud.get_history_with_status(db, reservatorio_id=reservatorio_id)
-    if historico_com_estado.empty: return []
-    df_merged = historico_com_estado.copy()
-    df_merged.rename(columns={'data': 'Data', 'estado_calculado': 'Estado de Seca', 'volume_hm3': 'Volume (Hm³)'},
-                     inplace=True)
-    df_merged['Data'] = pd.to_datetime(df_merged['Data']).dt.strftime('%d/%m/%Y')
-    return df_merged[['Data', 'Estado de Seca', 'Volume (Hm³)']].to_dict('records')
+async def get_history_data(reservatorio_id: int, start: Optional[date] = None,
+                           end: Optional[date] = None, limit: Optional[int] = Query(None, ge=1),
+                           cursor: Optional[date] = None, resolution: series.Resolucao = "daily",
+                           aggregate: series.Agregacao = "mean", max_points: Optional[int] = Query(None, ge=3),
+                           formato: respostas.FormatoSerie = Query("records", alias="format"),
+                           db: AsyncSession = Depends(get_db_leitura)):
+    async def produzir():
+        historico_com_estado = await crud.get_history_with_status(db, reservatorio_id=reservatorio_id, inicio=start,
+                                                                  fim=end, limite=limit, cursor=cursor)
+        colunas = ['Data', 'Estado de Seca', 'Volume (Hm³)']
+        if historico_com_estado.empty: return respostas.formatar_serie(historico_com_estado, colunas, formato), None
+        with metricas.etapa_pandas():
+            import pandas as pd
+            proximo_cursor = _proximo_cursor(historico_com_estado, limit)
+            df_merged = series.reamostrar(historico_com_estado, resolution, aggregate)
+            df_merged = series.reduzir_pontos(df_merged, max_points)
+            df_merged = df_merged.rename(columns={'data': 'Data', 'estado_calculado': 'Estado de Seca', 'volume_hm3': 'Volume (Hm³)'})
+            df_merged['Data'] = pd.to_datetime(df_merged['Data']).dt.strftime('%d/%m/%Y')
+            return respostas.formatar_serie(df_merged, colunas, formato), proximo_cursor
+
+    conteudo, proximo_cursor = await cache.cached(
+        db, "history", reservatorio_id, produzir,
+        (start, end, limit, cursor, resolution, aggregate, max_points, formato))
+    return respostas.resposta_serie(conteudo, proximo_cursor)
+
+
+@app.get("/api/reservatorios/{reservatorio_id}/history/export", tags=["Histórico"])
+async def export_history(reservatorio_id: int, formato: respostas.FormatoExportacao = Query("ndjson", alias="format"),
+                         start: Optional[date] = None, end: Optional[date] = None,
+                         db: AsyncSession = Depends(get_db_leitura)):
+    """Exporta o histórico completo do reservatório em NDJSON ou CSV, transmitido em lotes (memória constante)."""
+    if not await crud.get_reservatorio_by_id(db, reservatorio_id):
+        raise HTTPException(status_code=404, detail="Reservatório não encontrado.")
+    return respostas.exportar_historico(formato, f"historico_{reservatorio_id}", [reservatorio_id], start, end)
+
+
+@app.get("/api/history/export", tags=["Histórico"])
+async def export_all_history(formato: respostas.FormatoExportacao = Query("ndjson", alias="format"),
+                             ids: Optional[List[int]] = Query(None), start: Optional[date] = None,
+                             end: Optional[date] = None):
+    """Exporta o histórico de todos os reservatórios (ou dos `ids` informados) em NDJSON ou CSV."""
+    return respostas.exportar_historico(formato, "historico", ids, start, end)
+
+
+@app.get("/api/reservatorios/{reservatorio_id}/state-timeline", response_model=List[schemas.PeriodoEstado],
+         tags=["Histórico"])
+@cache.cached_endpoint("state-timeline")
+async def get_state_timeline(reservatorio_id: int, start: Optional[date] = None, end: Optional[date] = None,
+                             db: AsyncSession = Depends(get_db_leitura)):
+    """Períodos contínuos em cada estado de seca, para desenhar as faixas de estado sem baixar o histórico."""
+    periodos = await crud.get_state_runs(db, reservatorio_id=reservatorio_id, inicio=start, fim=end)
+    return [schemas.PeriodoEstado(
+        estado=p.estado,
+        inicio=p.inicio,
+        fim=p.fim,
+        dias=(p.fim - p.inicio).days + 1,
+        leituras=p.leituras,
+        volumeMinHm3=p.volume_min_hm3,
+        volumeMaxHm3=p.volume_max_hm3,
+        volumePercentualMin=p.volume_percentual_min * 100 if p.volume_percentual_min is not None else None,
+        volumePercentualMax=p.volume_percentual_max * 100 if p.volume_percentual_max is not None else None,
+    ) for p in periodos]
 
 
 @app.get("/api/reservatorios/{reservatorio_id}/chart/volume-data", tags=["Gráficos"])
-async def get_chart_data(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    historico_com_estado = await crud.get_history_with_status(db, reservatorio_id=reservatorio_id)
-    if historico_com_estado.empty: return []
-    df_merged = historico_com_estado.copy()
-    df_merged = df_merged.sort_values(by='data', ascending=True)
-    df_merged.rename(
-        columns={'data': 'Data', 'volume_hm3': 'volume', 'meta1v': 'meta1', 'meta2v': 'meta2', 'meta3v': 'meta3'},
-        inplace=True)
-    df_merged['Data'] = pd.to_datetime(df_merged['Data']).dt.strftime('%Y-%m-%d')
-    return df_merged[['Data', 'volume', 'meta1', 'meta2', 'meta3']].to_dict('records')
+async def get_chart_data(reservatorio_id: int, start: Optional[date] = None,
+                         end: Optional[date] = None, limit: Optional[int] = Query(None, ge=1),
+                         cursor: Optional[date] = None, resolution: series.Resolucao = "daily",
+                         aggregate: series.Agregacao = "mean", max_points: Optional[int] = Query(None, ge=3),
+                         formato: respostas.FormatoSerie = Query("records", alias="format"),
+                         db: AsyncSession = Depends(get_db_leitura)):
+    async def produzir():
+        # Já vem ordenado por data crescente do banco
+        historico_com_estado = await crud.get_history_with_status(db, reservatorio_id=reservatorio_id, inicio=start,
+                                                                  fim=end, limite=limit, cursor=cursor,
+                                                                  ascendente=True)
+        colunas = ['Data', 'volume', 'meta1', 'meta2', 'meta3']
+        if historico_com_estado.empty: return respostas.formatar_serie(historico_com_estado, colunas, formato), None
+        with metricas.etapa_pandas():
+            import pandas as pd
+            proximo_cursor = _proximo_cursor(historico_com_estado, limit)
+            df_merged = series.reamostrar(historico_com_estado, resolution, aggregate)
+            df_merged = series.reduzir_pontos(df_merged, max_points)
+            df_merged = df_merged.rename(
+                columns={'data': 'Data', 'volume_hm3': 'volume', 'meta1v': 'meta1', 'meta2v': 'meta2', 'meta3v': 'meta3'})
+            df_merged['Data'] = pd.to_datetime(df_merged['Data']).dt.strftime('%Y-%m-%d')
+            return respostas.formatar_serie(df_merged, colunas, formato), proximo_cursor
+
+    conteudo, proximo_cursor = await cache.cached(
+        db, "chart", reservatorio_id, produzir,
+        (start, end, limit, cursor, resolution, aggregate, max_points, formato))
+    return respostas.resposta_serie(conteudo, proximo_cursor)
 
 @app.get("/api/reservatorios/{reservatorio_id}/ongoing-actions", tags=["Planos de Ação"])
-async def get_ongoing_actions(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    acoes = await crud.get_action_plans(db, reservatorio_id=reservatorio_id, situacao="Em andamento")
+@cache.cached_endpoint("ongoing-actions")
+async def get_ongoing_actions(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura)):
+    indice = await facetas.obter_indice(db, reservatorio_id)
+    acoes = indice.filtrar({"situacao": ["Em andamento"]})
     return [{"AÇÕES": a.acoes, "RESPONSÁVEIS": a.responsaveis, "SITUAÇÃO": a.situacao} for a in acoes]
 
 
 @app.get("/api/reservatorios/{reservatorio_id}/completed-actions", tags=["Planos de Ação"])
-async def get_completed_actions(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    acoes = await crud.get_action_plans(db, reservatorio_id=reservatorio_id, situacao="Concluído")
+@cache.cached_endpoint("completed-actions")
+async def get_completed_actions(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura)):
+    indice = await facetas.obter_indice(db, reservatorio_id)
+    acoes = indice.filtrar({"situacao": ["Concluído"]})
     return [{"AÇÕES": a.acoes, "RESPONSÁVEIS": a.responsaveis, "SITUAÇÃO": a.situacao} for a in acoes]
 
 
 @app.get("/api/reservatorios/{reservatorio_id}/action-plans/filters", response_model=schemas.ActionPlanFilterOptions, tags=["Planos de Ação"])
-async def get_action_plan_filters(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.get_action_plan_filters(db, reservatorio_id=reservatorio_id)
+@cache.cached_endpoint("action-plan-filters")
+async def get_action_plan_filters(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura)):
+    indice = await facetas.obter_indice(db, reservatorio_id)
+    return {"estados": indice.valores["estado"], "impactos": indice.valores["impacto"],
+            "problemas": indice.valores["problema"], "acoes": indice.valores["acao"]}
+
+
+@app.get("/api/reservatorios/{reservatorio_id}/action-plans/facets", tags=["Planos de Ação"])
+@cache.cached_endpoint("action-plan-facets")
+async def get_action_plan_facets(reservatorio_id: int, estado: Optional[List[str]] = Query(None),
+                                 impacto: Optional[List[str]] = Query(None),
+                                 problema: Optional[List[str]] = Query(None),
+                                 acao: Optional[List[str]] = Query(None),
+                                 situacao: Optional[List[str]] = Query(None),
+                                 db: AsyncSession = Depends(get_db_leitura)):
+    """
+    Facetas dependentes para os filtros em cascata: para cada filtro, os valores possíveis com a quantidade
+    de planos dada a seleção dos demais. Cada filtro aceita vários valores (?estado=SECA&estado=ALERTA).
+    """
+    indice = await facetas.obter_indice(db, reservatorio_id)
+    return indice.contar({"estado": estado, "impacto": impacto, "problema": problema, "acao": acao,
+                          "situacao": situacao})
 
 
 @app.get("/api/reservatorios/{reservatorio_id}/action-plans", tags=["Planos de Ação"])
-async def get_action_plans(reservatorio_id: int, estado: Optional[str] = None, impacto: Optional[str] = None,
-                           problema: Optional[str] = None, acao: Optional[str] = None,
-                           db: AsyncSession = Depends(get_db)):
-    planos = await crud.get_action_plans(db, reservatorio_id=reservatorio_id, estado=estado, impacto=impacto,
-                                         problema=problema, acao=acao)
+@cache.cached_endpoint("action-plans")
+async def get_action_plans(reservatorio_id: int, estado: Optional[List[str]] = Query(None),
+                           impacto: Optional[List[str]] = Query(None), problema: Optional[List[str]] = Query(None),
+                           acao: Optional[List[str]] = Query(None), situacao: Optional[List[str]] = Query(None),
+                           db: AsyncSession = Depends(get_db_leitura)):
+    indice = await facetas.obter_indice(db, reservatorio_id)
+    planos = indice.filtrar({"estado": estado, "impacto": impacto, "problema": problema, "acao": acao,
+                             "situacao": situacao})
     return [{"DESCRIÇÃO DA AÇÃO": p.descricao_acao, "CLASSES DE AÇÃO": p.classes_acao, "RESPONSÁVEIS": p.responsaveis}
             for p in planos]
 
 
+@app.get("/api/action-plans/search", tags=["Planos de Ação"])
+async def search_action_plans(q: str = Query(..., min_length=2, max_length=200), ids: Optional[List[int]] = Query(None),
+                              limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0),
+                              db: AsyncSession = Depends(get_db_leitura)):
+    """
+    Busca textual nas ações, descrições, problemas, responsáveis e indicadores dos planos de ação de todos
+    os reservatórios (ou dos `ids` informados), por relevância, com os trechos encontrados entre <mark>.
+    """
+    async def produzir():
+        return await crud.search_action_plans(db, q, reservatorio_ids=ids, limite=limit, deslocamento=offset)
+
+    return await cache.cached(db, "action-plans-search", cache.GERACAO_GLOBAL, produzir,
+                              (q, tuple(ids or ()), limit, offset))
+
+
 @app.get("/api/reservatorios/{reservatorio_id}/water-balance/static-charts", tags=["Balanço Hídrico"])
-async def get_static_balance_charts(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    balanco_mensal_data = await crud.get_balanco_mensal(db, reservatorio_id=reservatorio_id)
-    composicao_demanda_data = await crud.get_composicao_demanda(db, reservatorio_id=reservatorio_id)
-    oferta_demanda_data = await crud.get_oferta_demanda(db, reservatorio_id=reservatorio_id)
+@cache.cached_endpoint("water-balance")
+async def get_static_balance_charts(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura)):
+    balanco_mensal_data, composicao_demanda_data, oferta_demanda_data = await em_paralelo(
+        db,
+        lambda sessao: crud.get_balanco_mensal(sessao, reservatorio_id=reservatorio_id),
+        lambda sessao: crud.get_composicao_demanda(sessao, reservatorio_id=reservatorio_id),
+        lambda sessao: crud.get_oferta_demanda(sessao, reservatorio_id=reservatorio_id),
+    )
     balanco_formatado = [
         {"Mês": bm.mes, "Afluência (m³/s)": float(bm.afluencia_m3s or 0), "Demanda (m³/s)": float(bm.demandas_m3s or 0),
          "Balanço (m³/s)": float(bm.afluencia_m3s or 0) - float(bm.demandas_m3s or 0), "Evaporação (m³/s)": float(bm.evaporacao_m3s or 0)} for bm in
@@ -185,60 +470,88 @@ async def get_static_balance_charts(reservatorio_id: int, db: AsyncSession = Dep
             "ofertaDemanda": oferta_formatada}
 
 
+@app.get("/api/reservatorios/{reservatorio_id}/water-balance/simulation", tags=["Balanço Hídrico"])
+async def simulate_water_balance(reservatorio_id: int, cenarios: int = Query(5000, ge=100, le=50000),
+                                 meses: int = Query(12, ge=1, le=60), semente: Optional[int] = None,
+                                 db: AsyncSession = Depends(get_db_leitura)):
+    """
+    Projeção por Monte Carlo do volume a partir da última leitura, do balanço mensal, das demandas dos usos
+    e das metas: probabilidade de cada estado de seca por mês e dias até o volume ficar abaixo de cada meta.
+    """
+    ultimo, balanco, usos, metas = await em_paralelo(
+        db,
+        lambda sessao: crud.get_latest_status(sessao, reservatorio_id=reservatorio_id),
+        lambda sessao: crud.get_balanco_mensal(sessao, reservatorio_id=reservatorio_id),
+        lambda sessao: crud.get_usos_agua(sessao, reservatorio_id=reservatorio_id),
+        lambda sessao: crud.get_metas_por_mes(sessao, reservatorio_id=reservatorio_id),
+    )
+    if not ultimo:
+        raise HTTPException(status_code=404, detail="Dados de monitoramento não disponíveis.")
+    if not balanco:
+        raise HTTPException(status_code=404, detail="Balanço hídrico mensal não disponível.")
+
+    entradas = simulacao.montar_entradas(ultimo, balanco, usos, metas, cenarios, meses, semente)
+    if entradas["capacidade_hm3"] is None:
+        raise HTTPException(status_code=422, detail="Capacidade do reservatório desconhecida: a última leitura "
+                                                    "não tem volume percentual para simular.")
+    # Chave pelas próprias entradas: qualquer mudança nos dados ou nos parâmetros gera uma nova simulação
+    chave = ("simulation", reservatorio_id, simulacao.impressao_digital(entradas), ())
+    encontrado, resultado = cache.response_cache.get(chave)
+    if not encontrado:
+        resultado = await simulacao.executar(entradas)
+        cache.response_cache.set(chave, resultado)
+    return resultado
+
+
 @app.get("/api/reservatorios/{reservatorio_id}/usos-agua", response_model=List[schemas.UsoAgua], tags=["Usos da Água"])
-async def get_usos_agua(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.get_usos_agua(db, reservatorio_id=reservatorio_id)
+@cache.cached_endpoint("usos-agua")
+async def get_usos_agua(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura)):
+    usos = await crud.get_usos_agua(db, reservatorio_id=reservatorio_id)
+    return [schemas.UsoAgua.model_validate(u) for u in usos]
 
 
 @app.get("/api/reservatorios/{reservatorio_id}/responsaveis", response_model=List[schemas.Responsavel], tags=["Responsáveis"])
-async def get_responsaveis(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.get_responsaveis(db, reservatorio_id=reservatorio_id)
+@cache.cached_endpoint("responsaveis")
+async def get_responsaveis(reservatorio_id: int, db: AsyncSession = Depends(get_db_leitura)):
+    responsaveis = await crud.get_responsaveis(db, reservatorio_id=reservatorio_id)
+    return [schemas.Responsavel.model_validate(r) for r in responsaveis]
+
+
+@app.post("/api/reservatorios/update-funceme-data", status_code=202, response_model=schemas.ExecucaoJob,
+          tags=["Dados Externos"])
+async def update_all_funceme_data(db: AsyncSession = Depends(get_db)):
+    """Enfileira a sincronização de todos os reservatórios com código da FUNCEME e retorna o job criado."""
+    return await agendador.enfileirar(db, origem="api")
 
 
-@app.post("/api/reservatorios/{reservatorio_id}/update-funceme-data", tags=["Dados Externos"])
+@app.post("/api/reservatorios/{reservatorio_id}/update-funceme-data", status_code=202,
+          response_model=schemas.ExecucaoJob, tags=["Dados Externos"])
 async def update_funceme_data(reservatorio_id: int, db: AsyncSession = Depends(get_db)):
+    """Enfileira a sincronização do reservatório; o andamento é consultado em /api/jobs/{job_id}."""
     reservatorio = await crud.get_reservatorio_by_id(db, reservatorio_id=reservatorio_id)
     if not reservatorio:
         raise HTTPException(status_code=404, detail="Reservatório não encontrado na base de dados local.")
     if not reservatorio.codigo_funceme:
         raise HTTPException(status_code=400, detail="Este reservatório não possui um código da FUNCEME associado.")
 
-    print(f"📡 Buscando dados para o reservatório '{reservatorio.nome}' (FUNCEME ID: {reservatorio.codigo_funceme})...")
-    hoje = date.today().strftime("%Y-%m-%d")
-    url_funceme = f"https://apil5.funceme.br/rpc/v1/reservatorio-series?reservatorio_id={reservatorio.codigo_funceme}&data_inicio=2023-01-01&data_fim={hoje}"
+    return await agendador.enfileirar(db, origem="api", reservatorio_id=reservatorio_id)
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url_funceme, timeout=30.0)
-            response.raise_for_status()
-            dados_funceme_raw = response.json()
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=503, detail=f"Erro de conexão ao buscar dados da FUNCEME: {e}")
 
-    dados_reais = dados_funceme_raw.get('data', {}).get('list', [])
-    if not dados_reais:
-        return {"status": "A API da FUNCEME não retornou novos dados para este reservatório."}
+@app.get("/api/jobs/{job_id}", response_model=schemas.ExecucaoJob, tags=["Dados Externos"])
+async def get_job_status(job_id: int, db: AsyncSession = Depends(get_db)):
+    job = await agendador.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job
 
-    existing_dates_query = await db.execute(
-        select(models.Monitoramento.data).where(models.Monitoramento.reservatorio_id == reservatorio_id)
-    )
-    existing_dates = {d for d, in existing_dates_query}
-
-    novos_registros = []
-    for registro in dados_reais:
-        data_registro = date.fromisoformat(registro['data'])
-        if data_registro not in existing_dates:
-            novos_registros.append(models.Monitoramento(
-                data=data_registro,
-                volume_hm3=registro.get('volume'),
-                volume_percentual=registro.get('volume_perc'),
-                reservatorio_id=reservatorio_id
-            ))
 
-    if novos_registros:
-        db.add_all(novos_registros)
-        await db.commit()
-        return {
-            "status": f"{len(novos_registros)} novos registros de monitoramento foram adicionados para '{reservatorio.nome}'."}
-
-    return {"status": f"Nenhum registro novo para '{reservatorio.nome}'. O banco de dados já está atualizado."}
+@app.get("/api/agendador/status", response_model=schemas.AgendadorStatus, tags=["Dados Externos"])
+async def get_agendador_status(db: AsyncSession = Depends(get_db)):
+    """Configuração do agendador, jobs pendentes e as últimas execuções (com duração e registros inseridos)."""
+    return schemas.AgendadorStatus(
+        habilitado=agendador.AGENDADOR_HABILITADO,
+        lider=agendador.agendador.lider,
+        intervalo_minutos=agendador.AGENDADOR_INTERVALO_MINUTOS,
+        jobs_pendentes=await agendador.contar_pendentes(db),
+        ultimas_execucoes=await agendador.get_ultimas_execucoes(db),
+    )
@@ -0,0 +1,168 @@
+# mapa.py
+# Índice espacial em memória (por worker) dos reservatórios com coordenadas, para o mapa: uma grade regular
+# de células em graus responde às consultas por retângulo (bbox) e aos k vizinhos mais próximos (busca em
+# anéis de células ao redor do ponto). Junto das coordenadas ficam a situação atual de cada reservatório.
+# O índice é refeito quando a geração global dos dados (ver cache.py) muda.
+import math
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import cache
+import crud
+
+if TYPE_CHECKING:
+    # Importado dentro das funções: a aplicação só carrega NumPy quando o índice do mapa é montado ou consultado
+    import numpy as np
+
+# Lado da célula da grade em graus (~55 km): poucas dezenas de reservatórios por célula no estado inteiro
+MAPA_CELULA_GRAUS = 0.5
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU = math.pi * RAIO_TERRA_KM / 180
+
+
+def _distancias_km(lat: float, lon: float, lats: "np.ndarray", lons: "np.ndarray") -> "np.ndarray":
+    """Distância de haversine do ponto até cada coordenada."""
+    import numpy as np
+    fi1, fi2 = np.radians(lat), np.radians(lats)
+    dfi = fi2 - fi1
+    dlambda = np.radians(lons - lon)
+    a = np.sin(dfi / 2) ** 2 + np.cos(fi1) * np.cos(fi2) * np.sin(dlambda / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(a))
+
+
+class IndiceEspacial:
+    """Reservatórios com coordenadas em arrays NumPy e distribuídos numa grade de células."""
+
+    def __init__(self, linhas: list, celula: float = MAPA_CELULA_GRAUS):
+        import numpy as np
+        linhas = [l for l in linhas if l.lat is not None and l.long is not None]
+        self.celula = celula
+        self.linhas = linhas
+        self.lats = np.array([l.lat for l in linhas], dtype=np.float64)
+        self.lons = np.array([l.long for l in linhas], dtype=np.float64)
+        self.grade: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for posicao, chave in enumerate(zip(self._celulas(self.lats), self._celulas(self.lons))):
+            self.grade[chave].append(posicao)
+        if self.grade:
+            linhas_grade, colunas_grade = zip(*self.grade)
+            self._limites = (min(linhas_grade), max(linhas_grade), min(colunas_grade), max(colunas_grade))
+
+    def _celulas(self, graus) -> "np.ndarray":
+        import numpy as np
+        return np.floor(np.asarray(graus) / self.celula).astype(np.int64)
+
+    def bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> "np.ndarray":
+        """Posições dos reservatórios dentro do retângulo, visitando só as células que ele cobre."""
+        import numpy as np
+        if not self.grade:
+            return np.empty(0, dtype=np.int64)
+        i0, i1 = self._celulas([min_lat, max_lat])
+        j0, j1 = self._celulas([min_lon, max_lon])
+        menor_i, maior_i, menor_j, maior_j = self._limites
+        candidatos = [p for i in range(max(i0, menor_i), min(i1, maior_i) + 1)
+                      for j in range(max(j0, menor_j), min(j1, maior_j) + 1)
+                      for p in self.grade.get((i, j), ())]
+        candidatos = np.array(sorted(candidatos), dtype=np.int64)
+        lats, lons = self.lats[candidatos], self.lons[candidatos]
+        dentro = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return candidatos[dentro]
+
+    def _anel(self, ci: int, cj: int, raio: int) -> List[int]:
+        """Posições dos reservatórios nas células a exatamente `raio` células da célula (ci, cj), dentro da grade."""
+        menor_i, maior_i, menor_j, maior_j = self._limites
+        j0, j1 = max(cj - raio, menor_j), min(cj + raio, maior_j)
+        celulas = []
+        for i in (ci - raio, ci + raio) if raio else (ci,):
+            if menor_i <= i <= maior_i:
+                celulas += [(i, j) for j in range(j0, j1 + 1)]
+        for j in (cj - raio, cj + raio) if raio else ():
+            if menor_j <= j <= maior_j:
+                celulas += [(i, j) for i in range(max(ci - raio + 1, menor_i), min(ci + raio - 1, maior_i) + 1)]
+        return [p for celula in celulas for p in self.grade.get(celula, ())]
+
+    def _distancia_fora_km(self, lat: float, lon: float, ci: int, cj: int, raio: int) -> float:
+        """
+        Distância mínima do ponto a qualquer lugar fora dos anéis já visitados (células a até `raio` da célula
+        do ponto). Ao norte e ao sul vale a diferença de latitude até a borda. A leste e a oeste vale a distância
+        até o meridiano da borda, asin(cos(lat) * sin(dlon)), que encolhe com a latitude do próprio ponto.
+        """
+        c = self.celula
+        norte_sul = min(lat - (ci - raio) * c, (ci + raio + 1) * c - lat) * KM_POR_GRAU
+        dlon = math.radians(min(lon - (cj - raio) * c, (cj + raio + 1) * c - lon, 90.0))
+        leste_oeste = RAIO_TERRA_KM * math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(dlon)))
+        return min(norte_sul, leste_oeste)
+
+    def vizinhos(self, lat: float, lon: float, k: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Os k reservatórios mais próximos do ponto e as distâncias em km, do mais próximo ao mais distante.
+        Percorre anéis de células ao redor do ponto até que nenhum reservatório fora dos anéis visitados
+        possa estar mais perto que o k-ésimo encontrado.
+        """
+        import numpy as np
+        k = min(k, len(self.linhas))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ci, cj = (int(c) for c in self._celulas([lat, lon]))
+        menor_i, maior_i, menor_j, maior_j = self._limites
+        raio_maximo = max(abs(ci - menor_i), abs(ci - maior_i), abs(cj - menor_j), abs(cj - maior_j))
+        candidatos: List[int] = []
+        for raio in range(raio_maximo + 1):
+            candidatos += self._anel(ci, cj, raio)
+            if len(candidatos) >= k:
+                posicoes = np.array(candidatos, dtype=np.int64)
+                distancias = _distancias_km(lat, lon, self.lats[posicoes], self.lons[posicoes])
+                ordem = np.argsort(distancias, kind="stable")[:k]
+                if distancias[ordem[-1]] <= self._distancia_fora_km(lat, lon, ci, cj, raio) or raio == raio_maximo:
+                    return posicoes[ordem], distancias[ordem]
+
+
+# (geração global, índice)
+_indice: Optional[tuple] = None
+
+
+async def obter_indice(db: AsyncSession) -> IndiceEspacial:
+    """Índice de todos os reservatórios; só consulta o banco quando a geração global mudou desde a montagem."""
+    global _indice
+    geracao = await cache.get_geracao(db, cache.GERACAO_GLOBAL)
+    if _indice is not None and _indice[0] == geracao:
+        return _indice[1]
+    indice = IndiceEspacial(await crud.get_overview(db))
+    _indice = (geracao, indice)
+    return indice
+
+
+def _propriedades(linha, distancia: Optional[float]) -> dict:
+    propriedades = {
+        "id": linha.id,
+        "nome": linha.nome,
+        "estadoAtualSeca": linha.estado_calculado,
+        "volumeAtualHm3": linha.volume_hm3,
+        "volumePercentual": linha.volume_percentual * 100 if linha.volume_percentual is not None else None,
+        "dataUltimaMedicao": linha.data,
+    }
+    if distancia is not None:
+        propriedades["distanciaKm"] = round(float(distancia), 3)
+    return propriedades
+
+
+def formatar(indice: IndiceEspacial, posicoes: "np.ndarray", formato: str,
+             distancias: Optional["np.ndarray"] = None) -> dict:
+    """GeoJSON (FeatureCollection de pontos) ou colunar (uma lista por campo, com lat e lon)."""
+    itens = [(indice.linhas[p], indice.lats[p], indice.lons[p],
+              distancias[n] if distancias is not None else None) for n, p in enumerate(posicoes)]
+    if formato == "geojson":
+        return {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]},
+             "properties": _propriedades(linha, distancia)}
+            for linha, lat, lon, distancia in itens]}
+    campos = ["id", "nome", "estadoAtualSeca", "volumeAtualHm3", "volumePercentual", "dataUltimaMedicao"]
+    colunas: Dict[str, list] = {c: [] for c in ["lat", "lon"] + campos
+                                + (["distanciaKm"] if distancias is not None else [])}
+    for linha, lat, lon, distancia in itens:
+        colunas["lat"].append(float(lat))
+        colunas["lon"].append(float(lon))
+        for chave, valor in _propriedades(linha, distancia).items():
+            colunas[chave].append(valor)
+    return colunas
@@ -0,0 +1,275 @@
+# metricas.py
+# Instrumentação das requisições: latência por rota, número de comandos SQL e tempo no banco (eventos do
+# engine), tempo gasto no pós-processamento com pandas e bytes de resposta, expostos em /metrics no formato
+# de texto do Prometheus. Inclui o log de consultas lentas e um profiler opcional por requisição.
+# As métricas são por worker do gunicorn (cada processo mantém e expõe as suas).
+import contextvars
+import io
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+METRICAS_CONSULTA_LENTA_MS = float(os.getenv("METRICAS_CONSULTA_LENTA_MS", "200"))
+# O profiler por requisição (?profile=1 ou cabeçalho X-Profile: 1) só responde se habilitado
+METRICAS_PROFILER_HABILITADO = os.getenv("METRICAS_PROFILER_HABILITADO", "0") == "1"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+# Acumuladores da requisição em andamento; o dicionário é compartilhado com as greenlets do SQLAlchemy
+_requisicao: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("metricas_requisicao", default=None)
+
+
+class Histograma:
+    """Histograma cumulativo no formato do Prometheus, com uma série por conjunto de rótulos."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}
+
+    def observar(self, rotulos: tuple, valor: float) -> None:
+        serie = self.series.get(rotulos)
+        if serie is None:
+            serie = self.series[rotulos] = [[0] * len(self.buckets), 0.0, 0]
+        contagens = serie[0]
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                contagens[i] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def exportar(self, nome: str, nomes_rotulos: Tuple[str, ...]) -> list:
+        linhas = []
+        for rotulos, (contagens, soma, total) in sorted(self.series.items()):
+            base = _rotulos(nomes_rotulos, rotulos)
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f'{nome}_bucket{{{base},le="{limite}"}} {contagem}')
+            linhas.append(f'{nome}_bucket{{{base},le="+Inf"}} {total}')
+            linhas.append(f"{nome}_sum{{{base}}} {soma}")
+            linhas.append(f"{nome}_count{{{base}}} {total}")
+        return linhas
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes: Tuple[str, ...], valores: tuple) -> str:
+    return ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores))
+
+
+latencia = Histograma(BUCKETS_SEGUNDOS)
+consultas_por_requisicao = Histograma(BUCKETS_CONSULTAS)
+requisicoes = defaultdict(int)  # (rota, método, status) -> total
+bytes_resposta = defaultdict(int)  # rota -> bytes
+tempo_banco = defaultdict(float)  # rota -> segundos
+comandos_sql = defaultdict(int)  # rota -> comandos
+tempo_pandas = defaultdict(float)  # rota -> segundos
+consultas_lentas = 0
+
+
+# --- Banco de dados ---
+
+def instrumentar_engine(engine) -> None:
+    """Conta os comandos SQL e o tempo no banco da requisição atual e registra as consultas lentas."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        global consultas_lentas
+        duracao = time.perf_counter() - conn.info["metricas_inicio"].pop()
+        atual = _requisicao.get()
+        if atual is not None:
+            atual["sql"] += 1
+            atual["banco"] += duracao
+        if duracao * 1000 >= METRICAS_CONSULTA_LENTA_MS:
+            consultas_lentas += 1
+            rota = _rota(atual["scope"]) if atual is not None else "-"
+            consulta = " ".join(statement.split())
+            print(f"🐢 Consulta lenta ({duracao * 1000:.0f} ms) em {rota}: {consulta[:500]}")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _erro(contexto):
+        # Sem after_cursor_execute: descarta o início registrado para a pilha não crescer
+        if contexto.connection is not None and contexto.connection.info.get("metricas_inicio"):
+            contexto.connection.info["metricas_inicio"].pop()
+
+
+@contextmanager
+def etapa_pandas():
+    """Mede o pós-processamento com pandas/NumPy da requisição atual."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        atual = _requisicao.get()
+        if atual is not None:
+            atual["pandas"] += time.perf_counter() - inicio
+
+
+# --- Middleware ---
+
+def _rota(scope: Scope) -> str:
+    """Caminho da rota (com {parametros}) para não criar uma série por reservatório."""
+    rota = scope.get("route")
+    return getattr(rota, "path", None) or "(sem rota)"
+
+
+def resolver_rota(scope: Scope) -> None:
+    """
+    Grava em scope["route"] a rota que atenderia a requisição. Para as respostas dadas por um middleware antes
+    do roteador (ex.: 304 do GET condicional) serem contadas na série do endpoint, e não em "(sem rota)".
+    """
+    if "route" in scope:
+        return
+    for rota in scope["app"].router.routes:
+        combinacao, _ = rota.matches(scope)
+        if combinacao == Match.FULL:
+            scope["route"] = rota
+            return
+
+
+def _profiler_pedido(scope: Scope) -> bool:
+    if not METRICAS_PROFILER_HABILITADO:
+        return False
+    if (b"x-profile", b"1") in scope.get("headers", []):
+        return True
+    return parse_qs(scope.get("query_string", b"").decode()).get("profile") == ["1"]
+
+
+class MetricasMiddleware:
+    """Middleware ASGI puro: não bufferiza o corpo, apenas observa as mensagens enviadas."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if _profiler_pedido(scope):
+            await self._perfilar(scope, receive, send)
+            return
+
+        atual = {"scope": scope, "sql": 0, "banco": 0.0, "pandas": 0.0, "bytes": 0, "status": 500}
+        token = _requisicao.set(atual)
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                atual["status"] = mensagem["status"]
+            elif mensagem["type"] == "http.response.body":
+                atual["bytes"] += len(mensagem.get("body", b""))
+            await send(mensagem)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            _requisicao.reset(token)
+            rota = _rota(scope)
+            requisicoes[(rota, scope["method"], atual["status"])] += 1
+            latencia.observar((rota,), duracao)
+            consultas_por_requisicao.observar((rota,), atual["sql"])
+            bytes_resposta[rota] += atual["bytes"]
+            tempo_banco[rota] += atual["banco"]
+            comandos_sql[rota] += atual["sql"]
+            tempo_pandas[rota] += atual["pandas"]
+
+    async def _perfilar(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Executa a requisição sob um profiler e responde com o relatório em texto no lugar do corpo."""
+        status = {"codigo": 500}
+
+        async def descartar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                status["codigo"] = mensagem["status"]
+
+        try:
+            # pyinstrument (opcional) é um profiler por amostragem que entende código assíncrono
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+            import pstats
+
+            perfil = cProfile.Profile()
+            perfil.enable()
+            try:
+                await self.app(scope, receive, descartar)
+            finally:
+                perfil.disable()
+            saida = io.StringIO()
+            pstats.Stats(perfil, stream=saida).sort_stats("cumulative").print_stats(60)
+            relatorio = saida.getvalue()
+        else:
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, descartar)
+            finally:
+                profiler.stop()
+            relatorio = profiler.output_text(unicode=True)
+
+        corpo = f"status da resposta original: {status['codigo']}\n\n{relatorio}".encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                                (b"content-length", str(len(corpo)).encode())]})
+        await send({"type": "http.response.body", "body": corpo})
+
+
+# --- Exposição ---
+
+def _contador(nome: str, ajuda: str, valores: dict, nomes_rotulos: Tuple[str, ...], tipo: str = "counter") -> list:
+    linhas = [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+    for rotulos, valor in sorted(valores.items()):
+        rotulos = rotulos if isinstance(rotulos, tuple) else (rotulos,)
+        texto = _rotulos(nomes_rotulos, rotulos)
+        linhas.append(f"{nome}{{{texto}}} {valor}" if texto else f"{nome} {valor}")
+    return linhas
+
+
+def exportar(extras: Optional[Dict[str, float]] = None, replicas: Optional[List[dict]] = None,
+             contadores: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+    """
+    Todas as métricas deste worker no formato de exposição em texto do Prometheus. `extras` são medidas
+    instantâneas (gauge); `contadores` (nome -> (ajuda, valor)) só crescem e recebem o sufixo _total.
+    """
+    linhas = _contador("dashboard_http_requests_total", "Requisições HTTP por rota, método e status.",
+                       requisicoes, ("rota", "metodo", "status"))
+    linhas += ["# HELP dashboard_http_request_duration_seconds Latência das requisições por rota.",
+               "# TYPE dashboard_http_request_duration_seconds histogram"]
+    linhas += latencia.exportar("dashboard_http_request_duration_seconds", ("rota",))
+    linhas += ["# HELP dashboard_db_statements_per_request Comandos SQL executados por requisição.",
+               "# TYPE dashboard_db_statements_per_request histogram"]
+    linhas += consultas_por_requisicao.exportar("dashboard_db_statements_per_request", ("rota",))
+    linhas += _contador("dashboard_db_statements_total", "Comandos SQL executados por rota.", comandos_sql, ("rota",))
+    linhas += _contador("dashboard_db_seconds_total", "Tempo gasto no banco por rota.", tempo_banco, ("rota",))
+    linhas += _contador("dashboard_pandas_seconds_total", "Tempo de pós-processamento com pandas por rota.",
+                        tempo_pandas, ("rota",))
+    linhas += _contador("dashboard_http_response_bytes_total", "Bytes de corpo de resposta enviados por rota.",
+                        bytes_resposta, ("rota",))
+    linhas += ["# HELP dashboard_db_slow_queries_total Consultas acima do limite de consulta lenta.",
+               "# TYPE dashboard_db_slow_queries_total counter",
+               f"dashboard_db_slow_queries_total {consultas_lentas}"]
+    for campo, nome, ajuda, tipo in (
+            ("leituras", "leituras_total", "Sessões de leitura abertas na réplica.", "counter"),
+            ("falhas", "falhas_total", "Falhas de conexão com a réplica.", "counter"),
+            ("atraso_segundos", "atraso_segundos", "Atraso estimado da réplica em relação à primária.", "gauge")):
+        if replicas:
+            linhas += _contador(f"dashboard_db_replica_{nome}", ajuda,
+                                {r["replica"]: r[campo] for r in replicas}, ("replica",), tipo)
+    for nome, (ajuda, valor) in (contadores or {}).items():
+        linhas += _contador(f"{nome}_total", ajuda, {(): valor}, ())
+    for nome, valor in (extras or {}).items():
+        linhas += [f"# TYPE {nome} gauge", f"{nome} {valor}"]
+    return "\n".join(linhas) + "\n"
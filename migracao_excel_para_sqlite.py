@@ -1,58 +1,304 @@
 # migracao_excel_para_sqlite.py
-import pandas as pd
+# Carga completa das planilhas de data/<reservatorio>/*.xlsx para o banco.
+# As pastas são lidas em paralelo num pool de processos (o openpyxl é o gargalo) e cada reservatório
+# é gravado numa única transação. A carga é idempotente: rodar de novo atualiza os dados em vez de duplicá-los.
+# Cada planilha lida é guardada num cache colunar (.npz em EXCEL_CACHE_DIR), reaproveitado nas próximas cargas
+# enquanto o .xlsx não for alterado.
+# Uso: python migracao_excel_para_sqlite.py [--pasta data] [--processos 4]
+import argparse
+import asyncio
 import glob
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, delete
+from sqlalchemy.dialects import postgresql, sqlite
+
+import cache
+import crud
+import migracoes
+from database import engine, AsyncSessionLocal, Base
 from models import (
     Reservatorio, BalancoMensal, ComposicaoDemanda, OfertaDemanda,
     PlanoAcao, VolumeMeta, Monitoramento, UsoAgua, Responsavel
 )
 
-# Esta função fará todo o trabalho de ler os ficheiros e preparar os dados
-async def popular_dados(db_session):
+# Cópia colunar (.npz) das planilhas já lidas, reaproveitada enquanto o .xlsx não mudar
+EXCEL_CACHE_DIR = os.getenv("EXCEL_CACHE_DIR", os.path.join(".cache", "excel"))
+EXCEL_CACHE_VERSAO = "1"
+
+MESES = {"jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6,
+         "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12}
+
+# Planilha -> [(aba, modelo, renomeação das colunas já normalizadas com strip().lower(), colunas obrigatórias)]
+# Aba None indica a primeira aba do arquivo.
+PLANILHAS = {
+    'identificacao.xlsx': [
+        (None, Reservatorio, {}, ['nome']),
+    ],
+    'balanco_hidrico.xlsx': [
+        ('Balanço Mensal', BalancoMensal, {'mês': 'mes', 'afluência (m³/s)': 'afluencia_m3s',
+                                           'demanda (m³/s)': 'demandas_m3s', 'evaporação (m³/s)': 'evaporacao_m3s'},
+         ['mes', 'afluencia_m3s', 'demandas_m3s']),
+        ('Composição Demanda', ComposicaoDemanda, {'uso': 'usos', 'vazão (l/s)': 'demandas_hm3'},
+         ['usos', 'demandas_hm3']),
+        ('Oferta Demanda', OfertaDemanda, {'cenário': 'cenarios', 'oferta (l/s)': 'oferta_m3s',
+                                           'demanda (l/s)': 'demanda_m3s'},
+         ['cenarios', 'oferta_m3s', 'demanda_m3s']),
+    ],
+    'monitoramento_historico.xlsx': [
+        (None, Monitoramento, {'volume (hm³)': 'volume_hm3', 'volume (%)': 'volume_percentual'},
+         ['data', 'volume_hm3', 'volume_percentual']),
+    ],
+    'plano_acao.xlsx': [
+        (None, PlanoAcao, {'estado de seca': 'estado_seca', 'tipos de impactos': 'tipos_impactos', 'ações': 'acoes',
+                           'descrição da ação': 'descricao_acao', 'classes de ação': 'classes_acao',
+                           'responsáveis': 'responsaveis', 'situação': 'situacao'},
+         ['estado_seca', 'acoes']),
+    ],
+    'responsaveis.xlsx': [
+        (None, Responsavel, {}, ['nome']),
+    ],
+    'usos_agua.xlsx': [
+        (None, UsoAgua, {'vazão normal': 'vazao_normal', 'vazão escassez': 'vazao_escassez'},
+         ['uso', 'vazao_normal', 'vazao_escassez']),
+    ],
+    'volume_meta.xlsx': [
+        (None, VolumeMeta, {'mes_num': 'mes_nome'}, ['mes_nome', 'meta1v', 'meta2v', 'meta3v']),
+    ],
+}
+
+# Tabelas substituídas integralmente a cada carga (apagar + inserir na mesma transação)
+TABELAS_SUBSTITUIDAS = [BalancoMensal, ComposicaoDemanda, OfertaDemanda, PlanoAcao, Responsavel, UsoAgua, VolumeMeta]
+
+
+class PlanilhaInvalida(Exception):
+    """Planilha sem as colunas obrigatórias do modelo correspondente."""
+
+
+def _validar_colunas(df: pd.DataFrame, modelo, obrigatorias: list, arquivo: str, avisos: list) -> pd.DataFrame:
+    """Exige as colunas obrigatórias e mantém apenas as colunas que existem no modelo."""
+    faltando = [c for c in obrigatorias if c not in df.columns]
+    if faltando:
+        raise PlanilhaInvalida(f"{arquivo}: colunas obrigatórias ausentes {faltando}")
+    colunas_modelo = {c.name for c in modelo.__table__.columns} - {'id', 'reservatorio_id'}
+    desconhecidas = [c for c in df.columns if c not in colunas_modelo]
+    if desconhecidas:
+        avisos.append(f"{arquivo}: colunas ignoradas {desconhecidas}")
+    return df[[c for c in df.columns if c in colunas_modelo]]
+
+
+def _normalizar(df: pd.DataFrame, modelo) -> pd.DataFrame:
+    if modelo is Monitoramento:
+        df = df.dropna(subset=['data'])
+        df['data'] = pd.to_datetime(df['data']).dt.date
+        df = df.drop_duplicates(subset='data', keep='last')
+    elif modelo is VolumeMeta:
+        nomes = df['mes_nome'].astype(str).str.strip()
+        df['mes_num'] = pd.to_numeric(nomes, errors='coerce').fillna(nomes.str[:3].str.lower().map(MESES))
+        df = df.dropna(subset=['mes_num'])
+        df['mes_num'] = df['mes_num'].astype(int)
+        df = df.drop_duplicates(subset='mes_num', keep='last')
+    df = df.astype(object)
+    return df.where(df.notna(), None)
+
+
+def _arquivos_cache(caminho: str) -> tuple:
+    """Nome do cache derivado do caminho absoluto, do mtime e do tamanho do .xlsx (e o prefixo comum ao caminho)."""
+    estado = os.stat(caminho)
+    prefixo = hashlib.sha1(os.path.abspath(caminho).encode()).hexdigest()[:16]
+    versao = hashlib.sha1(f"{estado.st_mtime_ns}|{estado.st_size}|{EXCEL_CACHE_VERSAO}".encode()).hexdigest()[:16]
+    return os.path.join(EXCEL_CACHE_DIR, f"{prefixo}-{versao}.npz"), prefixo
+
+
+def _salvar_cache(arquivo_cache: str, prefixo: str, planilhas: dict) -> None:
+    """
+    Grava cada coluna como um array NumPy sem pickle: números e datas no dtype nativo, textos como
+    unicode acompanhados de uma máscara de nulos. Os nomes de abas e colunas vão num JSON em `__meta__`.
+    """
+    arrays, meta = {}, []
+    for i, (aba, df) in enumerate(planilhas.items()):
+        colunas = []
+        for j, coluna in enumerate(df.columns):
+            serie = df[coluna]
+            chave = f"a{i}c{j}"
+            if pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_any_dtype(serie):
+                arrays[chave] = serie.to_numpy()
+                tipo = "nativo"
+            else:
+                nulos = serie.isna().to_numpy()
+                arrays[chave] = np.where(nulos, "", serie.astype(str).to_numpy()).astype(str)
+                arrays[chave + "_nulos"] = nulos
+                tipo = "texto"
+            colunas.append([str(coluna), tipo])
+        meta.append([str(aba), colunas])
+    arrays["__meta__"] = np.array(json.dumps(meta))
+
+    os.makedirs(EXCEL_CACHE_DIR, exist_ok=True)
+    temporario = f"{arquivo_cache}.{os.getpid()}.tmp"
+    with open(temporario, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporario, arquivo_cache)
+    # Remove versões antigas do cache desta mesma planilha
+    for antigo in glob.glob(os.path.join(EXCEL_CACHE_DIR, f"{prefixo}-*.npz")):
+        if antigo != arquivo_cache:
+            os.remove(antigo)
+
+
+def _carregar_cache(arquivo_cache: str) -> dict:
+    planilhas = {}
+    with np.load(arquivo_cache, allow_pickle=False) as arrays:
+        for i, (aba, colunas) in enumerate(json.loads(str(arrays["__meta__"]))):
+            dados = {}
+            for j, (coluna, tipo) in enumerate(colunas):
+                valores = arrays[f"a{i}c{j}"]
+                if tipo == "texto":
+                    valores = pd.Series(valores, dtype=object).mask(arrays[f"a{i}c{j}_nulos"])
+                dados[coluna] = valores
+            planilhas[aba] = pd.DataFrame(dados, columns=[c for c, _ in colunas])
+    return planilhas
+
+
+def ler_planilhas(caminho: str) -> tuple:
+    """Lê todas as abas do .xlsx, usando a cópia em cache quando o arquivo não mudou. Retorna (abas, veio_do_cache)."""
+    arquivo_cache, prefixo = _arquivos_cache(caminho)
+    if os.path.exists(arquivo_cache):
+        try:
+            return _carregar_cache(arquivo_cache), True
+        except (OSError, ValueError, KeyError):
+            pass  # Cache corrompido: relê a planilha e regrava
+    planilhas = pd.read_excel(caminho, sheet_name=None)
+    _salvar_cache(arquivo_cache, prefixo, planilhas)
+    return planilhas, False
+
+
+def ler_pasta(pasta: str) -> dict:
+    """
+    Lê todas as planilhas de um reservatório. Executada nos processos do pool, por isso só devolve
+    objetos simples (listas de dicionários) e o tempo gasto em cada arquivo.
+    """
+    tabelas, tempos, avisos, em_cache = {}, {}, [], []
+    for arquivo, abas in PLANILHAS.items():
+        caminho = os.path.join(pasta, arquivo)
+        if not os.path.exists(caminho):
+            avisos.append(f"{arquivo}: arquivo não encontrado")
+            continue
+        inicio = time.perf_counter()
+        planilhas, veio_do_cache = ler_planilhas(caminho)
+        if veio_do_cache:
+            em_cache.append(arquivo)
+        for aba, modelo, renomear, obrigatorias in abas:
+            df = planilhas[aba] if aba is not None else next(iter(planilhas.values()))
+            df.columns = [str(col).strip().lower() for col in df.columns]
+            df = df.rename(columns=renomear)
+            df = _validar_colunas(df, modelo, obrigatorias, arquivo, avisos)
+            tabelas[modelo.__tablename__] = _normalizar(df, modelo).to_dict(orient="records")
+        tempos[arquivo] = time.perf_counter() - inicio
+    return {"pasta": pasta, "tabelas": tabelas, "tempos": tempos, "avisos": avisos, "em_cache": em_cache}
+
+
+async def _gravar_reservatorio(db_session, dados: dict) -> str:
+    """Grava um reservatório numa transação: upsert da identificação, substituição das tabelas filhas
+    e upsert do monitoramento (para não apagar as leituras já sincronizadas com a FUNCEME)."""
+    nome_pasta = os.path.basename(dados["pasta"])
+    tabelas = dados["tabelas"]
+    info = tabelas[Reservatorio.__tablename__][0]
+    nome = info.get('nome') or nome_pasta.capitalize()
+
+    reservatorio = (await db_session.execute(select(Reservatorio).where(Reservatorio.nome == nome))).scalars().first()
+    if reservatorio is None:
+        reservatorio = Reservatorio(nome=nome)
+        db_session.add(reservatorio)
+    for campo, valor in info.items():
+        # O código da FUNCEME não vem das planilhas; não apaga o valor já cadastrado
+        if campo != 'nome' and (valor is not None or campo != 'codigo_funceme'):
+            setattr(reservatorio, campo, valor)
+    await db_session.flush()
+    reservatorio_id = reservatorio.id
+
+    for modelo in TABELAS_SUBSTITUIDAS:
+        await db_session.execute(delete(modelo).where(modelo.reservatorio_id == reservatorio_id))
+        registros = [dict(r, reservatorio_id=reservatorio_id) for r in tabelas.get(modelo.__tablename__, [])]
+        if registros:
+            await db_session.execute(insert(modelo), registros)
+
+    leituras = [dict(r, reservatorio_id=reservatorio_id) for r in tabelas.get(Monitoramento.__tablename__, [])]
+    if leituras:
+        dialeto = postgresql if db_session.get_bind().dialect.name == "postgresql" else sqlite
+        query = dialeto.insert(Monitoramento)
+        query = query.on_conflict_do_update(
+            index_elements=['reservatorio_id', 'data'],
+            set_={'volume_hm3': query.excluded.volume_hm3, 'volume_percentual': query.excluded.volume_percentual},
+        )
+        await db_session.execute(query, leituras)
+
+    # As metas podem ter mudado: o histórico classificado é refeito por completo
+    await crud.rebuild_history_status(db_session, reservatorio_id)
+    await cache.invalidar(db_session, reservatorio_id)
+    await db_session.commit()
+    return nome
+
+
+def _imprimir_relatorio(relatorio: dict) -> None:
+    print("\nTempo por arquivo (s; * = lido do cache colunar):")
+    for nome_pasta, item in sorted(relatorio.items()):
+        arquivos = " ".join(f"{a.removesuffix('.xlsx')}{'*' if a in item['em_cache'] else ''}={t:.2f}"
+                            for a, t in item["tempos"].items())
+        print(f"  {nome_pasta:<25} leitura={sum(item['tempos'].values()):6.2f} gravação={item['gravacao']:6.2f}  {arquivos}")
+    for nome_pasta, item in sorted(relatorio.items()):
+        for aviso in item["avisos"]:
+            print(f"  ⚠️ {nome_pasta}: {aviso}")
+
+
+async def popular_dados(db_session, pasta_dados: str = "data", processos: Optional[int] = None):
+    """Carrega todas as pastas de `pasta_dados`. Retorna o relatório de tempos por pasta, ou False em caso de erro."""
     print("Iniciando a carga de dados...")
+    inicio = time.perf_counter()
+    relatorio = {}
     try:
-        pastas_reservatorios = [f for f in glob.glob("data/*") if os.path.isdir(f)]
-
-        for pasta in pastas_reservatorios:
-            nome_pasta = os.path.basename(pasta)
-            print(f"-> Processando: {nome_pasta.upper()}")
-
-            # Carregar Identificação
-            df_ident = pd.read_excel(os.path.join(pasta, 'identificacao.xlsx'))
-            df_ident.columns = [str(col).strip().lower() for col in df_ident.columns]
-            info = df_ident.iloc[0].to_dict()
-
-            novo_reservatorio = Reservatorio(
-                nome=info.get('nome', nome_pasta.capitalize()),
-                municipio=info.get('municipio'),
-                descricao=info.get('descricao'),
-                lat=info.get('lat'),
-                long=info.get('long'),
-                nome_imagem=info.get('nome_imagem'),
-                nome_imagem_usos=info.get('nome_imagem_usos'),
-                codigo_funceme=info.get('codigo_funceme')
-            )
-            db_session.add(novo_reservatorio)
-            await db_session.flush()
-            reservatorio_id = novo_reservatorio.id
-
-            # Carregar todos os outros dados
-            # (O código aqui é o seu, mas usando loops em vez de bulk_insert)
-            
-            df_pa = pd.read_excel(os.path.join(pasta, 'plano_acao.xlsx'))
-            df_pa.columns = [str(col).strip().lower() for col in df_pa.columns]
-            df_pa.rename(columns={'estado de seca': 'estado_seca', 'problemas': 'problemas', 'tipos de impactos': 'tipos_impactos', 'ações': 'acoes', 'descrição da ação': 'descricao_acao', 'classes de ação': 'classes_acao', 'responsáveis': 'responsaveis', 'situação': 'situacao'}, inplace=True)
-            df_pa['reservatorio_id'] = reservatorio_id
-            for r in df_pa.to_dict(orient="records"): db_session.add(PlanoAcao(**r))
-            
-            # Repita o padrão acima para os outros ficheiros:
-            # df_usos, df_mon, df_vm, df_resp, df_bm, df_cd, df_od
-
-        await db_session.commit()
-        print("✅ Dados carregados com sucesso!")
-        return True
+        pastas_reservatorios = sorted(f for f in glob.glob(os.path.join(pasta_dados, "*")) if os.path.isdir(f))
+        loop = asyncio.get_running_loop()
+
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            leituras = [loop.run_in_executor(pool, ler_pasta, pasta) for pasta in pastas_reservatorios]
+            for leitura in asyncio.as_completed(leituras):
+                dados = await leitura
+                nome_pasta = os.path.basename(dados["pasta"])
+                inicio_gravacao = time.perf_counter()
+                nome = await _gravar_reservatorio(db_session, dados)
+                relatorio[nome_pasta] = {"tempos": dados["tempos"], "avisos": dados["avisos"],
+                                         "em_cache": dados["em_cache"],
+                                         "gravacao": time.perf_counter() - inicio_gravacao}
+                print(f"-> Processado: {nome_pasta.upper()} ({nome})")
+
+        _imprimir_relatorio(relatorio)
+        print(f"✅ Dados carregados com sucesso em {time.perf_counter() - inicio:.1f}s!")
+        return relatorio
 
     except Exception as e:
         print(f"❌ ERRO ao popular dados: {e}")
         await db_session.rollback()
         return False
+
+
+async def main(pasta_dados: str, processos: Optional[int]) -> bool:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # O upsert das leituras depende do índice único criado pelas migrações
+        await conn.run_sync(migracoes.aplicar_migracoes)
+    async with AsyncSessionLocal() as db_session:
+        return bool(await popular_dados(db_session, pasta_dados, processos))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carrega as planilhas de data/ no banco de dados.")
+    parser.add_argument("--pasta", default="data")
+    parser.add_argument("--processos", type=int, default=None, help="Processos de leitura (padrão: nº de CPUs)")
+    args = parser.parse_args()
+    raise SystemExit(0 if asyncio.run(main(args.pasta, args.processos)) else 1)
@@ -0,0 +1,278 @@
+# migracoes.py
+# Migrações versionadas do esquema. `Base.metadata.create_all` só cria as tabelas que ainda não existem
+# (com os seus índices) e nunca altera uma tabela já criada; toda mudança em tabela existente entra aqui
+# como uma nova versão, registrada em schema_migracoes. As migrações precisam ser idempotentes: num banco
+# novo o create_all já criou tudo e elas apenas são marcadas como aplicadas.
+#
+# Uso:
+#   python migracoes.py              cria as tabelas, aplica as migrações pendentes e materializa o histórico
+#   python migracoes.py --verificar  roda EXPLAIN nas consultas do crud e confere o uso dos índices
+import argparse
+import asyncio
+import os
+import re
+import sys
+from datetime import date, datetime, timezone
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Connection, event, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+import crud
+import models
+from database import engine, Base, AsyncSessionLocal
+
+MIGRACOES_LOCK_ID = int(os.getenv("MIGRACOES_LOCK_ID", "7320062"))
+
+
+def _indices_existentes(conn: Connection, tabela: str) -> set:
+    return {i["name"] for i in inspect(conn).get_indexes(tabela)}
+
+
+def _criar_indices(conn: Connection, *nomes: str) -> None:
+    """Cria, a partir da definição em models.py, os índices que ainda não existem no banco."""
+    for tabela in Base.metadata.sorted_tables:
+        existentes = None
+        for indice in tabela.indexes:
+            if indice.name not in nomes:
+                continue
+            if existentes is None:
+                existentes = _indices_existentes(conn, tabela.name)
+            if indice.name not in existentes:
+                indice.create(conn)
+
+
+def _m001_unicidade_monitoramento(conn: Connection) -> None:
+    """
+    Índice único em monitoramento (reservatorio_id, data). Antes de criá-lo remove as leituras duplicadas
+    (mantém a última inserida); se houver remoção o histórico classificado é refeito pelo bootstrap.
+    """
+    if "uq_monitoramento_reservatorio_data" in _indices_existentes(conn, "monitoramento"):
+        return
+    duplicadas = conn.execute(text(
+        "DELETE FROM monitoramento WHERE id NOT IN "
+        "(SELECT max(id) FROM monitoramento GROUP BY reservatorio_id, data)"
+    ))
+    if duplicadas.rowcount:
+        conn.execute(text("DELETE FROM historico_estado"))
+    _criar_indices(conn, "uq_monitoramento_reservatorio_data")
+
+
+def _m002_indices_reservatorio(conn: Connection) -> None:
+    """Índices por reservatório (chave estrangeira) e compostos com as colunas filtradas/ordenadas no crud."""
+    _criar_indices(
+        conn,
+        "ix_balanco_mensal_reservatorio",
+        "ix_composicao_demanda_reservatorio",
+        "ix_oferta_demanda_reservatorio",
+        "ix_plano_acao_reservatorio_estado_situacao",
+        "ix_volume_meta_reservatorio_mes",
+        "ix_uso_agua_reservatorio",
+        "ix_responsaveis_reservatorio_grupo",
+        "ix_execucao_job_origem_criado",
+    )
+
+
+def _m003_busca_textual(conn: Connection) -> None:
+    """
+    Busca textual nos planos de ação. Postgres: configuração de busca em português sem acentos (unaccent) e
+    índice GIN sobre o tsvector ponderado. SQLite: tabela FTS5 de conteúdo externo, mantida por gatilhos.
+    """
+    colunas = ", ".join(crud.BUSCA_COLUNAS)
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        conn.execute(text(f"""
+            DO $$ BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{crud.BUSCA_CONFIGURACAO}') THEN
+                    CREATE TEXT SEARCH CONFIGURATION {crud.BUSCA_CONFIGURACAO} (COPY = portuguese);
+                    ALTER TEXT SEARCH CONFIGURATION {crud.BUSCA_CONFIGURACAO}
+                        ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+                END IF;
+            END $$"""))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_plano_acao_busca ON plano_acao USING gin (({crud.BUSCA_DOCUMENTO_SQL}))"))
+        return
+
+    novos = ", ".join(f"new.{c}" for c in crud.BUSCA_COLUNAS)
+    antigos = ", ".join(f"old.{c}" for c in crud.BUSCA_COLUNAS)
+    inserir = f"INSERT INTO plano_acao_fts(rowid, {colunas}) VALUES (new.id, {novos});"
+    remover = f"INSERT INTO plano_acao_fts(plano_acao_fts, rowid, {colunas}) VALUES ('delete', old.id, {antigos});"
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS plano_acao_fts USING fts5({colunas}, content='plano_acao', "
+        "content_rowid='id', tokenize='unicode61 remove_diacritics 2')"))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS plano_acao_fts_ai AFTER INSERT ON plano_acao BEGIN {inserir} END"))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS plano_acao_fts_ad AFTER DELETE ON plano_acao BEGIN {remover} END"))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS plano_acao_fts_au AFTER UPDATE ON plano_acao BEGIN {remover} {inserir} END"))
+    # Indexa os planos já existentes
+    conn.execute(text("INSERT INTO plano_acao_fts(plano_acao_fts) VALUES ('rebuild')"))
+
+
+# (versão, descrição, função). Novas migrações sempre no fim, com versão maior que a anterior.
+MIGRACOES: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Índice único em monitoramento (reservatorio_id, data)", _m001_unicidade_monitoramento),
+    (2, "Índices compostos por reservatório", _m002_indices_reservatorio),
+    (3, "Busca textual nos planos de ação", _m003_busca_textual),
+]
+
+
+def aplicar_migracoes(conn: Connection) -> List[int]:
+    """
+    Aplica, na transação de `conn`, as migrações ainda não registradas e retorna as versões aplicadas.
+    Deve rodar depois do create_all. No Postgres um advisory lock de transação impede que os workers
+    do gunicorn apliquem a mesma migração ao mesmo tempo.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:chave)"), {"chave": MIGRACOES_LOCK_ID})
+    models.SchemaMigracao.__table__.create(conn, checkfirst=True)
+    aplicadas = set(conn.execute(select(models.SchemaMigracao.versao)).scalars())
+
+    novas = []
+    for versao, descricao, migracao in MIGRACOES:
+        if versao in aplicadas:
+            continue
+        migracao(conn)
+        conn.execute(models.SchemaMigracao.__table__.insert().values(
+            versao=versao, descricao=descricao, aplicada_em=datetime.now(timezone.utc)))
+        novas.append(versao)
+    return novas
+
+
+def esquema_atualizado(conn: Connection) -> bool:
+    """
+    Confere, sem DDL nem locks, se todas as tabelas de models.py existem e todas as migrações já foram
+    registradas. Os workers só preparam o banco na inicialização quando esta verificação falha.
+    """
+    tabelas = set(inspect(conn).get_table_names())
+    if not {tabela.name for tabela in Base.metadata.sorted_tables} <= tabelas:
+        return False
+    aplicadas = set(conn.execute(select(models.SchemaMigracao.versao)).scalars())
+    return {versao for versao, _, _ in MIGRACOES} <= aplicadas
+
+
+async def preparar_banco() -> Tuple[List[int], int]:
+    """
+    Cria as tabelas, aplica as migrações pendentes e materializa o histórico dos reservatórios ainda não
+    classificados. Roda uma vez por deploy (`python migracoes.py`, ver Procfile) e, na inicialização da
+    aplicação, apenas se o esquema não estiver atualizado (ex.: uvicorn local sem o comando).
+    Retorna as versões aplicadas e quantos reservatórios foram materializados.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        novas = await conn.run_sync(aplicar_migracoes)
+    async with AsyncSessionLocal() as db:
+        try:
+            materializados = await crud.bootstrap_history_status(db)
+        except IntegrityError:
+            # Outro processo materializou o mesmo reservatório ao mesmo tempo
+            await db.rollback()
+            materializados = 0
+    return novas, materializados
+
+
+# --- Verificação dos planos de consulta ---
+
+# Tabelas que o crud lê por inteiro de propósito (listagem e visão geral de todos os reservatórios)
+TABELAS_VARREDURA_PERMITIDA = {"reservatorio"}
+
+
+async def _consultas_crud(db) -> None:
+    """Executa as consultas de leitura do crud, com os filtros usados pelos endpoints."""
+    reservatorios = await crud.get_reservatorios(db)
+    rid = reservatorios[0].id if reservatorios else 1
+    await crud.get_identificacao(db, rid)
+    await crud.get_reservatorio_by_id(db, rid)
+    await crud.get_balanco_mensal(db, rid)
+    await crud.get_composicao_demanda(db, rid)
+    await crud.get_oferta_demanda(db, rid)
+    await crud.get_usos_agua(db, rid)
+    await crud.get_responsaveis(db, rid)
+    await crud.get_action_plans(db, rid)
+    await crud.get_action_plans(db, rid, estado="SECA SEVERA", situacao="Em andamento")
+    await crud.get_action_plans_estado_atual(db, rid)
+    await crud.get_action_plan_filters(db, rid)
+    await crud.get_action_plan_rows(db, rid)
+    await crud.search_action_plans(db, "abastecimento poços")
+    await crud.search_action_plans(db, "abastecimento", reservatorio_ids=[rid])
+    await crud.get_all_monitoring_data(db, rid)
+    await crud.get_all_volume_meta(db, rid)
+    await crud.get_monitoring_columns(db, rid)
+    await crud.get_metas_por_mes(db, rid)
+    await crud.get_latest_status(db, rid)
+    await crud.get_state_runs(db, rid)
+    await crud.get_state_runs(db, rid, inicio=date(2020, 1, 1), fim=date(2021, 12, 31))
+    await crud.get_overview(db)
+    await crud.get_versao_reservatorio(db, rid)
+    historico = await crud.get_history_with_status(db, rid, limite=10)
+    await crud.get_history_with_status(db, rid, inicio=date(2020, 1, 1), limite=10,
+                                       cursor=historico["data"].iloc[-1].date() if not historico.empty else None)
+
+
+def _varreduras(plano: str, dialeto: str) -> List[str]:
+    """Tabelas lidas por varredura completa, segundo o texto do plano."""
+    if dialeto == "postgresql":
+        return re.findall(r"Seq Scan on (\w+)", plano)
+    # SQLite: "SCAN tabela" sem índice; "SEARCH ... USING INDEX" e "SCAN ... USING INDEX" usam índice
+    return re.findall(r"^\s*SCAN (?:TABLE )?(\w+)(?: AS \w+)?\s*$", plano, re.MULTILINE)
+
+
+async def verificar_indices() -> List[Tuple[str, List[str]]]:
+    """
+    Captura o SQL emitido pelas funções de leitura do crud e roda EXPLAIN em cada consulta.
+    Retorna as consultas em que alguma tabela filtrada por reservatório é lida por varredura completa,
+    com as tabelas varridas (lista vazia: todas usam índices).
+    """
+    capturadas: List[Tuple[str, object]] = []
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            capturadas.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capturar)
+    try:
+        async with AsyncSessionLocal() as db:
+            await _consultas_crud(db)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capturar)
+
+    dialeto = engine.dialect.name
+    prefixo = "EXPLAIN " if dialeto == "postgresql" else "EXPLAIN QUERY PLAN "
+    falhas = []
+    async with engine.connect() as conn:
+        if dialeto == "postgresql":
+            # Com poucas linhas o planejador prefere Seq Scan; desligado, só sobra se não houver índice
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for statement, parameters in capturadas:
+            linhas = (await conn.exec_driver_sql(prefixo + statement, parameters)).all()
+            plano = "\n".join(str(linha[-1]) for linha in linhas)
+            problemas = [t for t in _varreduras(plano, dialeto) if t not in TABELAS_VARREDURA_PERMITIDA]
+            consulta = " ".join(statement.split())[:110]
+            if problemas:
+                falhas.append((consulta, sorted(set(problemas))))
+                print(f"❌ Varredura completa em {', '.join(sorted(set(problemas)))}: {consulta}")
+                print("   " + plano.replace("\n", "\n   "))
+            else:
+                print(f"✅ {consulta}")
+        await conn.rollback()
+    return falhas
+
+
+async def main(verificar: bool = False) -> int:
+    novas, materializados = await preparar_banco()
+    print(f"✅ Migrações aplicadas: {novas}" if novas else "✅ Esquema já está na versão mais recente.")
+    if materializados:
+        print(f"✅ Histórico classificado materializado para {materializados} reservatório(s).")
+    if verificar:
+        if await verificar_indices():
+            return 1
+        print("✅ Todas as consultas do crud usam índices.")
+    await engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aplica as migrações do esquema do banco.")
+    parser.add_argument("--verificar", action="store_true",
+                        help="roda EXPLAIN nas consultas do crud e falha se alguma não usar índice")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.verificar)))
@@ -1,6 +1,6 @@
 # models.py (VERSÃO CORRIGIDA PARA USAR 'reservatorio' NO SINGULAR)
 
-from sqlalchemy import Column, Integer, String, Float, Date, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -21,6 +21,7 @@ class Reservatorio(Base):
 
 class BalancoMensal(Base):
     __tablename__ = "balanco_mensal"
+    __table_args__ = (Index("ix_balanco_mensal_reservatorio", "reservatorio_id"),)
     id = Column(Integer, primary_key=True, index=True)
     mes = Column(String)
     afluencia_m3s = Column(Float)
@@ -32,6 +33,7 @@ class BalancoMensal(Base):
 
 class ComposicaoDemanda(Base):
     __tablename__ = "composicao_demanda"
+    __table_args__ = (Index("ix_composicao_demanda_reservatorio", "reservatorio_id"),)
     id = Column(Integer, primary_key=True, index=True)
     usos = Column(String)
     demandas_hm3 = Column(Float)
@@ -41,6 +43,7 @@ class ComposicaoDemanda(Base):
 
 class OfertaDemanda(Base):
     __tablename__ = "oferta_demanda"
+    __table_args__ = (Index("ix_oferta_demanda_reservatorio", "reservatorio_id"),)
     id = Column(Integer, primary_key=True, index=True)
     cenarios = Column(String)
     oferta_m3s = Column(Float)
@@ -51,6 +54,10 @@ class OfertaDemanda(Base):
 
 class PlanoAcao(Base):
     __tablename__ = "plano_acao"
+    # Filtros do plano de ação: sempre por reservatório, normalmente também por estado de seca e situação
+    __table_args__ = (
+        Index("ix_plano_acao_reservatorio_estado_situacao", "reservatorio_id", "estado_seca", "situacao"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     estado_seca = Column(String, index=True)
     problemas = Column(String, nullable=True)
@@ -68,6 +75,8 @@ class PlanoAcao(Base):
 
 class VolumeMeta(Base):
     __tablename__ = "volume_meta"
+    # Junção das metas com as leituras por (reservatório, mês)
+    __table_args__ = (Index("ix_volume_meta_reservatorio_mes", "reservatorio_id", "mes_num"),)
     id = Column(Integer, primary_key=True, index=True)
     mes_num = Column(Integer)
     mes_nome = Column(String)
@@ -80,6 +89,10 @@ class VolumeMeta(Base):
 
 class Monitoramento(Base):
     __tablename__ = "monitoramento"
+    # Uma leitura por reservatório e data; usado pelo INSERT ... ON CONFLICT DO NOTHING da sincronização
+    __table_args__ = (
+        Index("uq_monitoramento_reservatorio_data", "reservatorio_id", "data", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     data = Column(Date, index=True)
     volume_hm3 = Column(Float)
@@ -90,6 +103,7 @@ class Monitoramento(Base):
 
 class UsoAgua(Base):
     __tablename__ = "uso_agua"
+    __table_args__ = (Index("ix_uso_agua_reservatorio", "reservatorio_id"),)
     id = Column(Integer, primary_key=True, index=True)
     uso = Column(String, nullable=True)
     vazao_normal = Column(Float, nullable=True)
@@ -101,6 +115,10 @@ class UsoAgua(Base):
 class Responsavel(Base):
     # CORREÇÃO: Padronizando para nome singular
     __tablename__ = "responsaveis"
+    # Mesma ordem da listagem (grupo, organização, nome) dentro do reservatório
+    __table_args__ = (
+        Index("ix_responsaveis_reservatorio_grupo", "reservatorio_id", "grupo", "organizacao", "nome"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     nome = Column(String, nullable=False)
     grupo = Column(String, index=True, nullable=True)
@@ -109,3 +127,82 @@ class Responsavel(Base):
     # CORREÇÃO: ForeignKey apontando para 'reservatorio.id'
     reservatorio_id = Column(Integer, ForeignKey("reservatorio.id"))
     reservatorio = relationship("Reservatorio")
+
+
+class HistoricoEstado(Base):
+    # Histórico de monitoramento já classificado pelo estado de seca (tabela materializada).
+    # É mantido pelo crud a cada nova leitura e reconstruído quando as metas (volume_meta) mudam.
+    __tablename__ = "historico_estado"
+    __table_args__ = (
+        UniqueConstraint("reservatorio_id", "data", name="uq_historico_estado_reservatorio_data"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    data = Column(Date, nullable=False)
+    volume_hm3 = Column(Float, nullable=True)
+    # Fração do volume (0-1), como usada na comparação com as metas
+    volume_percentual = Column(Float, nullable=True)
+    meta1v = Column(Float, nullable=True)
+    meta2v = Column(Float, nullable=True)
+    meta3v = Column(Float, nullable=True)
+    estado_calculado = Column(String, nullable=False)
+    # Primeira data do período contínuo no estado atual
+    inicio_estado = Column(Date, nullable=False)
+    # Última data registrada no estado anterior (nula se o estado nunca mudou)
+    data_estado_anterior = Column(Date, nullable=True)
+    reservatorio_id = Column(Integer, ForeignKey("reservatorio.id"), nullable=False)
+
+
+class PeriodoEstado(Base):
+    # Períodos contínuos num mesmo estado de seca (run-length do historico_estado), mantidos junto com ele.
+    # Permitem desenhar a linha do tempo dos estados sem baixar o histórico diário.
+    __tablename__ = "periodo_estado"
+    __table_args__ = (
+        UniqueConstraint("reservatorio_id", "inicio", name="uq_periodo_estado_reservatorio_inicio"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    estado = Column(String, nullable=False)
+    inicio = Column(Date, nullable=False)
+    # Última leitura do período (a leitura mais recente, se for o período em curso)
+    fim = Column(Date, nullable=False)
+    leituras = Column(Integer, nullable=False)
+    volume_min_hm3 = Column(Float, nullable=True)
+    volume_max_hm3 = Column(Float, nullable=True)
+    # Frações do volume (0-1), como em historico_estado
+    volume_percentual_min = Column(Float, nullable=True)
+    volume_percentual_max = Column(Float, nullable=True)
+    reservatorio_id = Column(Integer, ForeignKey("reservatorio.id"), nullable=False)
+
+
+class CacheGeracao(Base):
+    # Contador de versão dos dados de cada reservatório, compartilhado entre os workers.
+    # reservatorio_id = 0 guarda a geração global (qualquer alteração em qualquer reservatório).
+    __tablename__ = "cache_geracao"
+    reservatorio_id = Column(Integer, primary_key=True, autoincrement=False)
+    geracao = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime(timezone=True), nullable=True)
+
+
+class ExecucaoJob(Base):
+    # Fila e histórico das execuções de sincronização (agendadas ou solicitadas pela API)
+    __tablename__ = "execucao_job"
+    __table_args__ = (Index("ix_execucao_job_origem_criado", "origem", "criado_em"),)
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String, nullable=False)
+    origem = Column(String, nullable=False)
+    # Nulo quando a execução abrange todos os reservatórios
+    reservatorio_id = Column(Integer, ForeignKey("reservatorio.id"), nullable=True)
+    status = Column(String, nullable=False, index=True)
+    criado_em = Column(DateTime(timezone=True), nullable=False)
+    iniciado_em = Column(DateTime(timezone=True), nullable=True)
+    finalizado_em = Column(DateTime(timezone=True), nullable=True)
+    duracao_segundos = Column(Float, nullable=True)
+    registros_inseridos = Column(Integer, nullable=True)
+    mensagem = Column(Text, nullable=True)
+
+
+class SchemaMigracao(Base):
+    # Versões de migração já aplicadas ao banco (ver migracoes.py)
+    __tablename__ = "schema_migracoes"
+    versao = Column(Integer, primary_key=True, autoincrement=False)
+    descricao = Column(String, nullable=False)
+    aplicada_em = Column(DateTime(timezone=True), nullable=False)
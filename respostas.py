@@ -0,0 +1,78 @@
+# respostas.py
+# Classes de resposta e exportação em streaming do histórico.
+import csv
+import io
+from datetime import date
+from typing import TYPE_CHECKING, List, Literal, Optional
+
+import orjson
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import crud
+from database import sessao_leitura
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FormatoExportacao = Literal["ndjson", "csv"]
+# records: lista de objetos (uma chave por coluna em cada linha); columnar: um objeto com uma lista por coluna
+FormatoSerie = Literal["records", "columnar"]
+# geojson: FeatureCollection de pontos; columnar: um objeto com uma lista por campo (lat e lon inclusos)
+FormatoMapa = Literal["geojson", "columnar"]
+
+_TIPOS_MIDIA = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse serializada com orjson (mesma saída compacta em UTF-8, bem mais rápida em listas grandes)."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def formatar_serie(df: "pd.DataFrame", colunas: List[str], formato: FormatoSerie):
+    """Converte a série já renomeada no formato pedido; o colunar evita repetir os nomes das colunas a cada linha."""
+    if formato == "columnar":
+        return {c: df[c].tolist() for c in colunas} if not df.empty else {c: [] for c in colunas}
+    return df[colunas].to_dict('records') if not df.empty else []
+
+
+def resposta_serie(conteudo, proximo_cursor: Optional[str]) -> ORJSONResponse:
+    """
+    Resposta dos endpoints de série. Retornada diretamente para que a lista (já em tipos nativos)
+    seja serializada só pelo orjson, sem passar pelo jsonable_encoder do FastAPI.
+    """
+    cabecalhos = {"X-Next-Cursor": proximo_cursor} if proximo_cursor else None
+    return ORJSONResponse(conteudo, headers=cabecalhos)
+
+
+def _ndjson(linhas) -> bytes:
+    colunas = crud.EXPORTACAO_COLUNAS
+    return b"".join(orjson.dumps(dict(zip(colunas, linha))) + b"\n" for linha in linhas)
+
+
+def _csv(linhas) -> bytes:
+    saida = io.StringIO()
+    csv.writer(saida, lineterminator="\n").writerows(linhas)
+    return saida.getvalue().encode()
+
+
+async def _gerar_exportacao(formato: FormatoExportacao, reservatorio_ids: Optional[List[int]],
+                            inicio: Optional[date], fim: Optional[date]):
+    if formato == "csv":
+        yield (",".join(crud.EXPORTACAO_COLUNAS) + "\n").encode()
+    codificar = _csv if formato == "csv" else _ndjson
+    # Sessão própria (de leitura), aberta apenas enquanto o corpo da resposta é gerado
+    async with sessao_leitura() as db:
+        async for lote in crud.stream_history(db, reservatorio_ids, inicio, fim):
+            yield codificar(lote)
+
+
+def exportar_historico(formato: FormatoExportacao, nome_arquivo: str, reservatorio_ids: Optional[List[int]] = None,
+                       inicio: Optional[date] = None, fim: Optional[date] = None) -> StreamingResponse:
+    """Resposta em streaming (NDJSON ou CSV) com o histórico classificado, lote a lote a partir do banco."""
+    return StreamingResponse(
+        _gerar_exportacao(formato, reservatorio_ids, inicio, fim),
+        media_type=_TIPOS_MIDIA[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}.{formato}"'},
+    )
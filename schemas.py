@@ -1,8 +1,8 @@
 # schemas.py (VERSÃO MULTI-RESERVATÓRIO)
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import date
+from typing import Dict, List, Optional
+from datetime import date, datetime
 
 # --- Schema para a lista de seleção no frontend ---
 class ReservatorioSelecao(BaseModel):
@@ -10,6 +10,21 @@ class ReservatorioSelecao(BaseModel):
     nome: str
     class Config: from_attributes = True
 
+# --- Variantes redimensionadas de uma imagem (ver imagens.py) ---
+class VarianteImagem(BaseModel):
+    largura: int
+    altura: int
+    webp: str
+    jpeg: str
+
+class VariantesImagem(BaseModel):
+    src: str
+    srcset: str
+    srcset_webp: str
+    largura: int
+    altura: int
+    variantes: Dict[str, VarianteImagem]
+
 # --- Schema principal do Reservatório (antiga Identificacao) ---
 class Reservatorio(BaseModel):
     id: int
@@ -20,8 +35,32 @@ class Reservatorio(BaseModel):
     long: Optional[float] = None
     url_imagem: Optional[str] = None
     url_imagem_usos: Optional[str] = None
+    imagem: Optional[VariantesImagem] = None
+    imagem_usos: Optional[VariantesImagem] = None
     class Config: from_attributes = True
 
+# --- Situação atual de um reservatório no painel geral ---
+class ResumoReservatorio(BaseModel):
+    id: int
+    nome: str
+    volumeAtualHm3: Optional[float] = None
+    volumePercentual: Optional[float] = None
+    estadoAtualSeca: Optional[str] = None
+    dataUltimaMedicao: Optional[date] = None
+    diasDesdeUltimaMudanca: Optional[int] = None
+
+# --- Período contínuo num mesmo estado de seca (linha do tempo) ---
+class PeriodoEstado(BaseModel):
+    estado: str
+    inicio: date
+    fim: date
+    dias: int
+    leituras: int
+    volumeMinHm3: Optional[float] = None
+    volumeMaxHm3: Optional[float] = None
+    volumePercentualMin: Optional[float] = None
+    volumePercentualMax: Optional[float] = None
+
 # --- Outros schemas que já tínhamos ---
 class BalancoMensal(BaseModel):
     mes: Optional[str] = None
@@ -79,4 +118,28 @@ class ActionPlanFilterOptions(BaseModel):
     acoes: List[str]
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# --- Execuções de sincronização (fila do agendador) ---
+class ExecucaoJob(BaseModel):
+    id: int
+    tipo: str
+    origem: str
+    reservatorio_id: Optional[int] = None
+    status: str
+    criado_em: datetime
+    iniciado_em: Optional[datetime] = None
+    finalizado_em: Optional[datetime] = None
+    duracao_segundos: Optional[float] = None
+    registros_inseridos: Optional[int] = None
+    mensagem: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class AgendadorStatus(BaseModel):
+    habilitado: bool
+    lider: bool
+    intervalo_minutos: float
+    jobs_pendentes: int
+    ultimas_execucoes: List[ExecucaoJob]
@@ -0,0 +1,83 @@
+# series.py
+# Reamostragem e redução de pontos das séries históricas servidas pelos endpoints de histórico e gráfico.
+from typing import TYPE_CHECKING, Literal, Optional
+
+if TYPE_CHECKING:
+    # Importados dentro das funções: a aplicação só carrega NumPy e pandas quando uma série é reamostrada/reduzida
+    import numpy as np
+    import pandas as pd
+
+Resolucao = Literal["daily", "weekly", "monthly"]
+Agregacao = Literal["mean", "min", "max"]
+
+_REGRAS = {"weekly": "W-MON", "monthly": "MS"}
+_COLUNAS_VALOR = ['volume_hm3', 'volume_percentual']
+_COLUNAS_ULTIMO = ['meta1v', 'meta2v', 'meta3v', 'estado_calculado']
+
+
+def reamostrar(df: "pd.DataFrame", resolucao: Resolucao = "daily", agregacao: Agregacao = "mean") -> "pd.DataFrame":
+    """
+    Agrupa o histórico por semana (iniciando na segunda-feira) ou por mês.
+    Volumes são agregados por `agregacao`; metas e estado de seca ficam com o valor da última leitura do período.
+    A ordem (crescente ou decrescente) do DataFrame de entrada é preservada.
+    """
+    if resolucao == "daily" or df.empty:
+        return df
+    import pandas as pd
+
+    decrescente = len(df) > 1 and df['data'].iloc[0] > df['data'].iloc[-1]
+    indexado = df.assign(data=pd.to_datetime(df['data'])).set_index('data').sort_index()
+    regras = {c: agregacao for c in _COLUNAS_VALOR}
+    regras.update({c: 'last' for c in _COLUNAS_ULTIMO if c in indexado.columns})
+    agrupado = indexado.resample(_REGRAS[resolucao], label='left', closed='left').agg(regras)
+    agrupado = agrupado.dropna(subset=['volume_hm3']).reset_index()
+    agrupado['data'] = agrupado['data'].dt.date
+    return agrupado.iloc[::-1].reset_index(drop=True) if decrescente else agrupado
+
+
+def lttb_indices(x: "np.ndarray", y: "np.ndarray", n_pontos: int) -> "np.ndarray":
+    """Índices escolhidos pelo Largest-Triangle-Three-Buckets para representar a série com `n_pontos`."""
+    import numpy as np
+    total = len(x)
+    if n_pontos >= total or n_pontos < 3:
+        return np.arange(total)
+
+    indices = np.empty(n_pontos, dtype=np.int64)
+    indices[0], indices[-1] = 0, total - 1
+    limites = np.linspace(1, total - 1, n_pontos - 1).astype(np.int64)
+    anterior = 0
+    for i in range(n_pontos - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        proximo_inicio, proximo_fim = fim, limites[i + 2] if i + 2 < len(limites) else total
+        media_x = x[proximo_inicio:proximo_fim].mean()
+        media_y = y[proximo_inicio:proximo_fim].mean()
+        areas = np.abs(
+            (x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+
+def reduzir_pontos(df: "pd.DataFrame", max_pontos: Optional[int]) -> "pd.DataFrame":
+    """
+    Reduz o histórico a no máximo `max_pontos` linhas preservando a forma da curva de volume.
+    Leituras sem volume ficam de fora da redução: como zero, o LTTB as escolheria como quedas que não existem.
+    """
+    if not max_pontos or len(df) <= max_pontos:
+        return df
+    import numpy as np
+    import pandas as pd
+
+    x = pd.to_datetime(df['data']).to_numpy(dtype='datetime64[D]').astype(np.float64)
+    y = pd.to_numeric(df['volume_hm3'], errors='coerce').to_numpy(dtype=np.float64)
+    posicoes = np.flatnonzero(~np.isnan(y))
+    x, y = x[posicoes], y[posicoes]
+    decrescente = len(x) > 1 and x[0] > x[-1]
+    if decrescente:
+        x, y = x[::-1], y[::-1]
+    indices = lttb_indices(x, y, max_pontos)
+    if decrescente:
+        indices = (len(x) - 1 - indices)[::-1]
+    return df.iloc[posicoes[indices]].reset_index(drop=True)
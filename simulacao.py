@@ -0,0 +1,259 @@
+# simulacao.py
+# Projeção do volume do reservatório por Monte Carlo a partir do balanço hídrico mensal. Cada cenário sorteia
+# um fator multiplicativo da afluência média de cada mês (lognormal com persistência entre meses, para
+# representar sequências de meses secos e chuvosos); o volume evolui mês a mês com afluência, evaporação e a
+# demanda dos usos (vazão de escassez quando o reservatório está em SECA ou SECA SEVERA).
+# Todos os cenários avançam juntos em arrays NumPy (cenários x meses). A simulação roda num pool de processos
+# para não bloquear o loop asyncio do worker; este módulo só depende do NumPy para subir rápido nos filhos, e o
+# importa dentro das funções para que o worker da API só o carregue ao simular.
+import asyncio
+import calendar
+import hashlib
+import json
+import multiprocessing
+import os
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+SIMULACAO_PROCESSOS = int(os.getenv("SIMULACAO_PROCESSOS", "2"))
+
+ESTADOS = ["SECA SEVERA", "SECA", "ALERTA", "NORMAL"]
+METAS = ["meta1v", "meta2v", "meta3v"]
+MESES_ABREVIADOS = ["jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez"]
+# Coeficiente de variação e autocorrelação mensal do fator de afluência
+CV_AFLUENCIA = 1.0
+PERSISTENCIA = 0.6
+
+
+def _mes_indice(nome: Optional[str]) -> Optional[int]:
+    """'Jan', 'Março', 'MAR' -> índice do mês (0-11)."""
+    if not nome:
+        return None
+    abreviado = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode().strip().lower()[:3]
+    return MESES_ABREVIADOS.index(abreviado) if abreviado in MESES_ABREVIADOS else None
+
+
+def _vetor_mensal(linhas: list, atributo: str) -> list:
+    """Valores do balanço por mês do ano; sem o nome do mês reconhecível, vale a ordem das 12 linhas."""
+    valores = [0.0] * 12
+    for posicao, linha in enumerate(linhas):
+        mes = _mes_indice(linha.mes)
+        if mes is None and len(linhas) == 12:
+            mes = posicao
+        if mes is not None:
+            valores[mes] = float(getattr(linha, atributo) or 0)
+    return valores
+
+
+def montar_entradas(ultimo, balanco: list, usos: list, metas: Optional["np.ndarray"], cenarios: int, meses: int,
+                    semente: Optional[int] = None) -> dict:
+    """
+    Reúne num dicionário serializável tudo o que a simulação usa: volume e data da última leitura
+    classificada, capacidade (volume / fração), balanço mensal em m³/s, demandas dos usos (L/s -> m³/s)
+    e as metas do mês como fração da capacidade. Sem volume percentual (ou com volume zero) na última leitura a
+    capacidade fica None e não há como simular (ver simular).
+    """
+    import numpy as np
+    capacidade = (ultimo.volume_hm3 / ultimo.volume_percentual
+                  if ultimo.volume_hm3 and ultimo.volume_percentual else None)
+    if usos:
+        demanda_normal = [sum(u.vazao_normal or 0 for u in usos) / 1000] * 12
+        demanda_escassez = [sum(u.vazao_escassez or 0 for u in usos) / 1000] * 12
+    else:
+        # Sem usos cadastrados vale a demanda do balanço, sem redução na escassez
+        demanda_normal = demanda_escassez = _vetor_mensal(balanco, "demandas_m3s")
+    return {
+        "data_inicial": ultimo.data.isoformat(),
+        "volume_inicial_hm3": float(ultimo.volume_hm3 or 0),
+        "capacidade_hm3": capacidade,
+        "afluencia_m3s": _vetor_mensal(balanco, "afluencia_m3s"),
+        "evaporacao_m3s": _vetor_mensal(balanco, "evaporacao_m3s"),
+        "demanda_normal_m3s": demanda_normal,
+        "demanda_escassez_m3s": demanda_escassez,
+        "metas": [[None if np.isnan(m) else float(m) for m in linha] for linha in metas] if metas is not None
+        else [[None] * 3] * 12,
+        "cenarios": cenarios,
+        "meses": meses,
+        "semente": semente,
+    }
+
+
+def impressao_digital(entradas: dict) -> str:
+    """Hash das entradas: a mesma combinação de dados e parâmetros reaproveita o resultado em cache."""
+    return hashlib.sha256(json.dumps(entradas, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def _indice_estado(fracao: "np.ndarray", metas: "np.ndarray") -> "np.ndarray":
+    """Índice em ESTADOS de cada cenário; mesma regra de crud._classificar_historico (primeira meta abaixo vence)."""
+    import numpy as np
+    with np.errstate(invalid="ignore"):
+        abaixo = fracao[:, None] < metas[None, :]
+    return np.where(abaixo.any(axis=1), np.argmax(abaixo, axis=1), 3)
+
+
+def _passos(data_inicial: date, meses: int) -> tuple:
+    """Mês do ano, rótulo (AAAA-MM) e duração em dias de cada passo; o primeiro vai da leitura ao fim do mês."""
+    import numpy as np
+    mes_ano, rotulos, dias = [], [], []
+    inicio = data_inicial
+    for _ in range(meses):
+        ultimo_dia = calendar.monthrange(inicio.year, inicio.month)[1]
+        fim = date(inicio.year, inicio.month, ultimo_dia)
+        mes_ano.append(inicio.month - 1)
+        rotulos.append(f"{inicio.year:04d}-{inicio.month:02d}")
+        dias.append((fim - inicio).days + (0 if inicio == data_inicial else 1))
+        inicio = fim + timedelta(days=1)
+    return np.array(mes_ano), rotulos, np.array(dias, dtype=np.float64)
+
+
+def _fatores_afluencia(rng: "np.random.Generator", cenarios: int, meses: int) -> "np.ndarray":
+    """Fatores lognormais de média 1 (cenários x meses) com autocorrelação AR(1) no espaço logarítmico."""
+    import numpy as np
+    sigma = np.sqrt(np.log1p(CV_AFLUENCIA ** 2))
+    ruido = rng.standard_normal((cenarios, meses))
+    z = np.empty_like(ruido)
+    z[:, 0] = ruido[:, 0]
+    inovacao = np.sqrt(1 - PERSISTENCIA ** 2)
+    for t in range(1, meses):
+        z[:, t] = PERSISTENCIA * z[:, t - 1] + inovacao * ruido[:, t]
+    return np.exp(sigma * z - sigma ** 2 / 2)
+
+
+def simular(entradas: dict) -> dict:
+    """Executa os cenários e resume, por mês, a distribuição dos estados e do volume e o tempo até cada meta."""
+    import numpy as np
+
+    capacidade = entradas["capacidade_hm3"]
+    if not capacidade:
+        # Sem capacidade o volume não vira fração: todo cenário cairia em SECA SEVERA, com metas infinitas
+        raise ValueError("Capacidade do reservatório desconhecida.")
+    cenarios, meses = entradas["cenarios"], entradas["meses"]
+    semente = entradas["semente"] if entradas["semente"] is not None else int(impressao_digital(entradas)[:8], 16)
+    rng = np.random.default_rng(semente)
+    mes_ano, rotulos, dias = _passos(date.fromisoformat(entradas["data_inicial"]), meses)
+    segundos = dias * 86400
+
+    afluencia = np.array(entradas["afluencia_m3s"])[mes_ano]
+    evaporacao = np.array(entradas["evaporacao_m3s"])[mes_ano]
+    demanda_normal = np.array(entradas["demanda_normal_m3s"])[mes_ano]
+    demanda_escassez = np.array(entradas["demanda_escassez_m3s"])[mes_ano]
+    metas = np.array(entradas["metas"], dtype=np.float64)[mes_ano]  # meses x 3 (fração)
+    fatores = _fatores_afluencia(rng, cenarios, meses)
+
+    volume = np.full(cenarios, entradas["volume_inicial_hm3"])
+    volumes = np.empty((cenarios, meses))
+    estados = np.empty((cenarios, meses), dtype=np.int8)
+    # Dias até o volume ficar abaixo de cada meta (NaN: não ficou no horizonte)
+    dias_ate_meta = np.full((cenarios, 3), np.nan)
+    metas_iniciais = np.array(entradas["metas"], dtype=np.float64)[mes_ano[0]] * capacidade
+    with np.errstate(invalid="ignore"):
+        dias_ate_meta[volume[:, None] < metas_iniciais[None, :]] = 0.0
+    decorridos = 0.0
+
+    for t in range(meses):
+        em_escassez = _indice_estado(volume / capacidade, metas[t]) <= 1
+        demanda = np.where(em_escassez, demanda_escassez[t], demanda_normal[t])
+        saldo_hm3 = (afluencia[t] * fatores[:, t] - evaporacao[t] - demanda) * segundos[t] / 1e6
+        novo = np.clip(volume + saldo_hm3, 0, capacidade)
+
+        limites = metas[t] * capacidade  # hm³
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cruzou = np.isnan(dias_ate_meta) & (novo[:, None] < limites[None, :])
+            # Interpolação linear do instante em que o volume passou pela meta dentro do mês
+            fracao_mes = np.clip((volume[:, None] - limites[None, :]) / (volume - novo)[:, None], 0, 1)
+        dias_ate_meta = np.where(cruzou, decorridos + fracao_mes * dias[t], dias_ate_meta)
+
+        volumes[:, t] = novo
+        estados[:, t] = _indice_estado(novo / capacidade, metas[t])
+        volume = novo
+        decorridos += dias[t]
+
+    return _resumir(entradas, rotulos, volumes, estados, dias_ate_meta, capacidade)
+
+
+def _resumir(entradas, rotulos, volumes, estados, dias_ate_meta, capacidade) -> dict:
+    import numpy as np
+
+    cenarios = volumes.shape[0]
+    contagens = np.stack([(estados == i).sum(axis=0) for i in range(len(ESTADOS))]) / cenarios  # estados x meses
+    em_seca = np.logical_or.accumulate(estados <= 1, axis=1).mean(axis=0)
+    em_seca_severa = np.logical_or.accumulate(estados == 0, axis=1).mean(axis=0)
+    p10, p50, p90 = np.percentile(volumes, [10, 50, 90], axis=0)
+    percentual = 100 / capacidade
+
+    meses = []
+    for t, rotulo in enumerate(rotulos):
+        meses.append({
+            "mes": rotulo,
+            "probabilidades": {estado: round(float(contagens[i, t]), 4) for i, estado in enumerate(ESTADOS)},
+            "probabilidadeAcumuladaSeca": round(float(em_seca[t]), 4),
+            "probabilidadeAcumuladaSecaSevera": round(float(em_seca_severa[t]), 4),
+            "volumeHm3": {"p10": round(float(p10[t]), 3), "p50": round(float(p50[t]), 3),
+                          "p90": round(float(p90[t]), 3)},
+            "volumePercentual": {"p10": round(float(p10[t] * percentual), 2), "p50": round(float(p50[t] * percentual), 2),
+                                 "p90": round(float(p90[t] * percentual), 2)},
+        })
+
+    metas = []
+    for k, nome in enumerate(METAS):
+        atingiu = ~np.isnan(dias_ate_meta[:, k])
+        metas.append({
+            "meta": nome,
+            "probabilidade": round(float(atingiu.mean()), 4),
+            "diasEsperados": round(float(dias_ate_meta[atingiu, k].mean()), 1) if atingiu.any() else None,
+            "diasMediana": round(float(np.median(dias_ate_meta[atingiu, k])), 1) if atingiu.any() else None,
+        })
+
+    return {
+        "entradas": {
+            "dataInicial": entradas["data_inicial"],
+            "volumeInicialHm3": entradas["volume_inicial_hm3"],
+            "capacidadeHm3": round(capacidade, 3),
+            "afluenciaMediaM3s": round(float(np.mean(entradas["afluencia_m3s"])), 4),
+            "evaporacaoMediaM3s": round(float(np.mean(entradas["evaporacao_m3s"])), 4),
+            "demandaNormalM3s": round(entradas["demanda_normal_m3s"][0], 4),
+            "demandaEscassezM3s": round(entradas["demanda_escassez_m3s"][0], 4),
+            "cenarios": entradas["cenarios"],
+            "meses": entradas["meses"],
+        },
+        "meses": meses,
+        "metas": metas,
+    }
+
+
+# --- Pool de processos ---
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _pool() -> ProcessPoolExecutor:
+    # Criado no primeiro uso, já dentro do worker do gunicorn; "spawn" evita herdar as threads e o loop do pai
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=SIMULACAO_PROCESSOS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+async def executar(entradas: dict) -> dict:
+    """Roda `simular` no pool de processos; se um processo filho morreu, recria o pool e tenta de novo."""
+    global _executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_pool(), simular, entradas)
+    except BrokenProcessPool:
+        _executor = None
+        return await loop.run_in_executor(_pool(), simular, entradas)
+
+
+def encerrar() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
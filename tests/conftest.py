@@ -0,0 +1,50 @@
+# tests/conftest.py
+# Os testes rodam sobre um banco SQLite temporário populado com os dados sintéticos dos benchmarks
+# (benchmarks/sintetico.py). DATABASE_URL precisa estar definido antes da importação de database.py.
+#
+# Uso: python -m pytest -q
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import httpx
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+DIRETORIO_TESTES = tempfile.mkdtemp(prefix="dashboard-testes-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRETORIO_TESTES, 'testes.db')}"
+os.environ["AGENDADOR_HABILITADO"] = "0"
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+
+
+@pytest.fixture(scope="session")
+def rodar():
+    """Executa uma corrotina num único event loop para a sessão inteira (as conexões do pool ficam presas a ele)."""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    import database
+    for motor in database.todos_os_engines():
+        loop.run_until_complete(motor.dispose())
+    loop.close()
+    shutil.rmtree(DIRETORIO_TESTES, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def banco(rodar) -> list:
+    """Banco sintético com o esquema completo (migrações e histórico materializado). Retorna os ids criados."""
+    from benchmarks import sintetico
+    import migracoes
+
+    ids = rodar(sintetico.popular(reservatorios=3, anos=3, planos=60))
+    rodar(migracoes.preparar_banco())
+    return ids
+
+
+def cliente_api() -> httpx.AsyncClient:
+    """Cliente HTTP em processo, direto na aplicação (sem o lifespan: o esquema já vem preparado por `banco`)."""
+    from main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testes")
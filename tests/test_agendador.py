@@ -0,0 +1,34 @@
+# tests/test_agendador.py
+# Status do job de sincronização a partir dos resultados por reservatório de funceme.sincronizar_todos:
+# falha em todos é ERRO, em parte é PARCIAL; o job não pode aparecer como sucesso com a FUNCEME fora do ar.
+import pytest
+
+import agendador
+import funceme
+from database import AsyncSessionLocal
+
+
+async def _executar_job() -> tuple:
+    async with AsyncSessionLocal() as db:
+        job = await agendador.enfileirar(db, origem="testes")
+        await agendador.Agendador()._executar(db, job.id)
+        job = await agendador.get_job(db, job.id)
+        return job.status, job.mensagem
+
+
+@pytest.mark.parametrize("codigos_com_falha,status", [
+    (set(), agendador.SUCESSO),
+    ({"1001"}, agendador.PARCIAL),
+    ({"1001", "1002", "1003"}, agendador.ERRO),
+])
+def test_status_do_job_conforme_as_falhas(banco, rodar, monkeypatch, codigos_com_falha, status):
+    async def buscar_serie(client, codigo_funceme, inicio, fim):
+        if codigo_funceme in codigos_com_falha:
+            raise funceme.FuncemeError("Erro de conexão ao buscar dados da FUNCEME: HTTP 503")
+        return []
+
+    monkeypatch.setattr(funceme, "buscar_serie", buscar_serie)
+    obtido, mensagem = rodar(_executar_job())
+
+    assert obtido == status
+    assert mensagem.count("HTTP 503") == len(codigos_com_falha)
@@ -0,0 +1,52 @@
+# tests/test_em_paralelo.py
+# em_paralelo abre sessões extras do pool além da conexão que a requisição já segura. Com muitas requisições
+# ao mesmo tempo num pool pequeno, as extras não podem esgotar o pool: sem vaga, as consultas rodam em
+# sequência na sessão da requisição.
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import database
+
+REQUISICOES = 8
+CONSULTAS = 3
+
+
+def _consulta(requisicao: int, indice: int):
+    async def consultar(sessao: AsyncSession):
+        valor = (await sessao.execute(text("SELECT :valor"), {"valor": requisicao * 10 + indice})).scalar()
+        # Segura a conexão por um tempo, para que as requisições se sobreponham
+        await asyncio.sleep(0.02)
+        return valor
+    return consultar
+
+
+async def _requisicoes(fabrica: sessionmaker) -> list:
+    async def requisicao(numero: int) -> list:
+        async with fabrica() as db:
+            await db.connection()
+            return await database.em_paralelo(db, *(_consulta(numero, i) for i in range(CONSULTAS)))
+
+    return await asyncio.gather(*(requisicao(n) for n in range(REQUISICOES)))
+
+
+@pytest.mark.parametrize("tamanho,overflow", [(1, 0), (2, 0), (3, 2)])
+def test_requisicoes_concorrentes_num_pool_pequeno(banco, rodar, monkeypatch, tamanho, overflow):
+    monkeypatch.setattr(database, "DB_CONSULTAS_PARALELAS", True)
+    monkeypatch.setattr(database, "DB_POOL_SIZE", tamanho)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", overflow)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 3.0)
+    # Mesmo limite que o módulo calcula para o pool configurado
+    monkeypatch.setattr(database, "_vagas_paralelas", asyncio.Semaphore(max(tamanho + overflow - 1, 0)))
+    motor = database._criar_engine(database.async_db_url)
+    fabrica = sessionmaker(bind=motor, class_=AsyncSession, expire_on_commit=False)
+    try:
+        resultados = rodar(asyncio.wait_for(_requisicoes(fabrica), timeout=10))
+    finally:
+        rodar(motor.dispose())
+
+    # Nenhum PoolTimeoutError, e cada requisição recebe os resultados na ordem das consultas
+    assert resultados == [[n * 10 + i for i in range(CONSULTAS)] for n in range(REQUISICOES)]
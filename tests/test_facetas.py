@@ -0,0 +1,102 @@
+# tests/test_facetas.py
+# As contagens do índice de facetas (bincount sobre códigos inteiros) precisam bater com um GROUP BY no banco,
+# e o índice precisa ser refeito quando a geração do reservatório muda.
+from typing import Optional
+
+import pytest
+from sqlalchemy import delete, func, insert, select
+
+import cache
+import facetas
+import models
+from database import AsyncSessionLocal
+
+SELECOES = [
+    {},
+    {"estado": ["SECA"]},
+    {"estado": ["SECA", "ALERTA"], "situacao": ["Em andamento"]},
+    {"impacto": ["Impacto 1", "Impacto 3"], "problema": ["Problema 2", "Problema 5"], "situacao": ["Concluído"]},
+    {"estado": ["NORMAL"], "acao": ["Ação 0", "Ação 4", "Ação 8"]},
+    # Valor inexistente: seleção vazia; o valor existente escolhido continua listado com zero
+    {"estado": ["INEXISTENTE"], "problema": ["Problema 1"]},
+]
+
+
+def _filtros(reservatorio_id: int, selecao: dict, exceto: Optional[str] = None) -> list:
+    plano = models.PlanoAcao
+    condicoes = [plano.reservatorio_id == reservatorio_id]
+    for faceta, valores in selecao.items():
+        if faceta != exceto and valores:
+            condicoes.append(getattr(plano, facetas.FACETAS[faceta]).in_(valores))
+    return condicoes
+
+
+async def _contagens_sql(db, reservatorio_id: int, selecao: dict) -> dict:
+    plano = models.PlanoAcao
+    total = (await db.execute(select(func.count()).where(*_filtros(reservatorio_id, selecao)))).scalar()
+    ids = (await db.execute(
+        select(plano.id).where(*_filtros(reservatorio_id, selecao)).order_by(plano.id))).scalars().all()
+    por_faceta = {}
+    for faceta, coluna in facetas.FACETAS.items():
+        coluna = getattr(plano, coluna)
+        linhas = (await db.execute(
+            select(coluna, func.count())
+            .where(*_filtros(reservatorio_id, selecao, exceto=faceta), coluna.is_not(None), coluna != "")
+            .group_by(coluna)
+        )).all()
+        contagens = dict(linhas)
+        # Valores escolhidos que existem no reservatório aparecem mesmo sem planos na seleção
+        existentes = set((await db.execute(
+            select(coluna).where(plano.reservatorio_id == reservatorio_id).distinct())).scalars())
+        for valor in selecao.get(faceta) or ():
+            if valor in existentes:
+                contagens.setdefault(valor, 0)
+        por_faceta[faceta] = contagens
+    return {"total": total, "ids": ids, "facetas": por_faceta}
+
+
+def _contagens_indice(indice: facetas.IndiceFacetas, selecao: dict) -> dict:
+    contagem = indice.contar(selecao)
+    return {"total": contagem["total"], "ids": sorted(p.id for p in indice.filtrar(selecao)),
+            "facetas": {f: {v["valor"]: v["total"] for v in valores} for f, valores in contagem["facetas"].items()}}
+
+
+async def _comparar(reservatorio_id: int) -> list:
+    async with AsyncSessionLocal() as db:
+        indice = await facetas.obter_indice(db, reservatorio_id)
+        return [(_contagens_indice(indice, s), await _contagens_sql(db, reservatorio_id, s)) for s in SELECOES]
+
+
+@pytest.mark.parametrize("selecao", range(len(SELECOES)))
+def test_contagens_iguais_ao_group_by(banco, rodar, selecao):
+    indice, sql = rodar(_comparar(banco[0]))[selecao]
+    assert indice == sql
+
+
+async def _acrescentar_plano(reservatorio_id: int) -> tuple:
+    async with AsyncSessionLocal() as db:
+        antes = await facetas.obter_indice(db, reservatorio_id)
+        assert await facetas.obter_indice(db, reservatorio_id) is antes
+
+        await db.execute(insert(models.PlanoAcao).values(
+            reservatorio_id=reservatorio_id, estado_seca="SECA", problemas="Problema novo", situacao="Em andamento",
+            acoes="Ação nova"))
+        await cache.invalidar(db, reservatorio_id)
+        await db.commit()
+        depois = await facetas.obter_indice(db, reservatorio_id)
+        comparacoes = [(_contagens_indice(depois, s), await _contagens_sql(db, reservatorio_id, s)) for s in SELECOES]
+
+        await db.execute(delete(models.PlanoAcao).where(models.PlanoAcao.acoes == "Ação nova"))
+        await cache.invalidar(db, reservatorio_id)
+        await db.commit()
+    return antes, depois, comparacoes
+
+
+def test_indice_refeito_quando_a_geracao_muda(banco, rodar):
+    antes, depois, comparacoes = rodar(_acrescentar_plano(banco[1]))
+
+    assert depois is not antes
+    assert len(depois.planos) == len(antes.planos) + 1
+    assert "Problema novo" in depois.valores["problema"]
+    for indice, sql in comparacoes:
+        assert indice == sql
@@ -0,0 +1,163 @@
+# tests/test_funceme.py
+# Sincronização incremental com a FUNCEME contra um servidor simulado (httpx.MockTransport) no endereço de
+# FUNCEME_API_URL: busca só o delta, repete 429/5xx com backoff, não duplica leituras e estende o histórico.
+from datetime import date, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import delete, func, insert, select
+
+import cache
+import funceme
+import models
+from database import AsyncSessionLocal
+
+RESERVATORIO_ID = 950
+CODIGO_FUNCEME = "9950"
+URL_SIMULADA = "http://funceme.testes/rpc/v1/reservatorio-series"
+HOJE = date.today()
+ULTIMA_DATA = HOJE - timedelta(days=10)
+
+
+def _leitura(dia: date, percentual: float) -> dict:
+    return {"data": dia.isoformat(), "volume": percentual * 2, "volume_perc": percentual}
+
+
+class ServidorSimulado:
+    """Responde a série diária do reservatório; `falhas` são os status devolvidos antes da resposta válida."""
+
+    def __init__(self, falhas=()):
+        self.falhas = list(falhas)
+        self.requisicoes = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requisicoes.append(request)
+        if self.falhas:
+            return httpx.Response(self.falhas.pop(0))
+        inicio = date.fromisoformat(request.url.params["data_inicio"])
+        fim = date.fromisoformat(request.url.params["data_fim"])
+        # A FUNCEME pode repetir o último dia já guardado: ele é descartado antes do INSERT
+        dias = [inicio - timedelta(days=1)] + [inicio + timedelta(days=i) for i in range((fim - inicio).days + 1)]
+        return httpx.Response(200, json={"data": {"list": [_leitura(d, 15.0) for d in dias]}})
+
+
+@pytest.fixture
+def reservatorio(banco, rodar, monkeypatch):
+    """Reservatório com leituras até ULTIMA_DATA; removido (com tudo o que a sincronização gravou) ao final."""
+    monkeypatch.setattr(funceme, "FUNCEME_API_URL", URL_SIMULADA)
+    esperas = []
+
+    async def dormir(segundos):
+        esperas.append(segundos)
+
+    monkeypatch.setattr(funceme.asyncio, "sleep", dormir)
+
+    async def criar():
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(models.Reservatorio).values(
+                id=RESERVATORIO_ID, nome="Reservatório Teste FUNCEME", codigo_funceme=CODIGO_FUNCEME))
+            await db.execute(insert(models.VolumeMeta), [
+                {"mes_num": mes, "mes_nome": str(mes), "meta1v": 0.10, "meta2v": 0.20, "meta3v": 0.30,
+                 "reservatorio_id": RESERVATORIO_ID} for mes in range(1, 13)])
+            await db.execute(insert(models.Monitoramento), [
+                {"data": ULTIMA_DATA - timedelta(days=i), "volume_hm3": 120.0, "volume_percentual": 60.0,
+                 "reservatorio_id": RESERVATORIO_ID} for i in range(30)])
+            await db.commit()
+
+    async def remover():
+        async with AsyncSessionLocal() as db:
+            for tabela in (models.HistoricoEstado, models.PeriodoEstado, models.Monitoramento, models.VolumeMeta,
+                           models.CacheGeracao):
+                await db.execute(delete(tabela).where(tabela.reservatorio_id == RESERVATORIO_ID))
+            await db.execute(delete(models.Reservatorio).where(models.Reservatorio.id == RESERVATORIO_ID))
+            await db.commit()
+
+    rodar(criar())
+    yield esperas
+    rodar(remover())
+
+
+async def _sincronizar(servidor: ServidorSimulado) -> tuple:
+    async with AsyncSessionLocal() as db:
+        geracao = await cache.get_geracao(db, RESERVATORIO_ID)
+        reservatorio = await db.get(models.Reservatorio, RESERVATORIO_ID)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(servidor)) as cliente:
+            resultado = await funceme.sincronizar_reservatorio(db, cliente, reservatorio)
+        historico = models.HistoricoEstado
+        ultima_historico, total_historico = (await db.execute(
+            select(func.max(historico.data), func.count()).where(historico.reservatorio_id == RESERVATORIO_ID))).one()
+        return resultado, await cache.get_geracao(db, RESERVATORIO_ID) - geracao, ultima_historico, total_historico
+
+
+def test_busca_o_delta_e_estende_o_historico(rodar, reservatorio):
+    servidor = ServidorSimulado()
+    resultado, geracoes, ultima_historico, total_historico = rodar(_sincronizar(servidor))
+
+    assert len(servidor.requisicoes) == 1
+    parametros = servidor.requisicoes[0].url.params
+    assert str(servidor.requisicoes[0].url).startswith(URL_SIMULADA)
+    assert parametros["reservatorio_id"] == CODIGO_FUNCEME
+    assert parametros["data_inicio"] == (ULTIMA_DATA + timedelta(days=1)).isoformat()
+    assert parametros["data_fim"] == HOJE.isoformat()
+
+    dias_novos = (HOJE - ULTIMA_DATA).days
+    assert resultado["erro"] is False
+    assert resultado["novos_registros"] == dias_novos
+    assert geracoes == 1
+    assert ultima_historico == HOJE
+    assert total_historico == 30 + dias_novos
+
+
+@pytest.mark.parametrize("falhas", [[429], [503, 500]])
+def test_repete_429_e_5xx_com_backoff(rodar, reservatorio, falhas):
+    esperas = reservatorio
+    servidor = ServidorSimulado(falhas)
+    resultado, _, ultima_historico, _ = rodar(_sincronizar(servidor))
+
+    assert len(servidor.requisicoes) == len(falhas) + 1
+    assert len(esperas) == len(falhas)
+    # Backoff exponencial: FUNCEME_BACKOFF * 2^tentativa, mais um jitter menor que FUNCEME_BACKOFF
+    for tentativa, espera in enumerate(esperas):
+        base = funceme.FUNCEME_BACKOFF * 2 ** tentativa
+        assert base <= espera < base + funceme.FUNCEME_BACKOFF
+    assert resultado["novos_registros"] == (HOJE - ULTIMA_DATA).days
+    assert ultima_historico == HOJE
+
+
+def test_falhas_esgotadas_viram_erro(rodar, reservatorio):
+    servidor = ServidorSimulado([503] * funceme.FUNCEME_TENTATIVAS)
+    with pytest.raises(funceme.FuncemeError, match="HTTP 503"):
+        rodar(_sincronizar(servidor))
+    assert len(servidor.requisicoes) == funceme.FUNCEME_TENTATIVAS
+
+
+async def _reenviar_existentes() -> tuple:
+    async with AsyncSessionLocal() as db:
+        monitoramento = models.Monitoramento
+        contar = select(func.count()).where(monitoramento.reservatorio_id == RESERVATORIO_ID)
+        antes = (await db.execute(contar)).scalar()
+        inseridas = await funceme.inserir_leituras(db, [
+            {"data": ULTIMA_DATA - timedelta(days=i), "volume_hm3": 1.0, "volume_percentual": 0.5,
+             "reservatorio_id": RESERVATORIO_ID} for i in range(5)])
+        await db.commit()
+        volumes = set((await db.execute(
+            select(monitoramento.volume_hm3).where(monitoramento.reservatorio_id == RESERVATORIO_ID))).scalars())
+        return inseridas, antes, (await db.execute(contar)).scalar(), volumes
+
+
+def test_reenvio_de_leituras_existentes_nao_insere_nada(rodar, reservatorio):
+    inseridas, antes, depois, volumes = rodar(_reenviar_existentes())
+
+    assert inseridas == []
+    assert depois == antes
+    # ON CONFLICT DO NOTHING: as leituras guardadas não são sobrescritas
+    assert volumes == {120.0}
+
+
+def test_sincronizacao_repetida_nao_duplica(rodar, reservatorio):
+    rodar(_sincronizar(ServidorSimulado()))
+    resultado, geracoes, _, total_historico = rodar(_sincronizar(ServidorSimulado()))
+
+    assert resultado["novos_registros"] == 0
+    assert geracoes == 0
+    assert total_historico == 30 + (HOJE - ULTIMA_DATA).days
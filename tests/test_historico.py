@@ -0,0 +1,82 @@
+# tests/test_historico.py
+# A manutenção incremental do histórico classificado (update_history_status) precisa produzir exatamente
+# as mesmas linhas de historico_estado e periodo_estado que a reconstrução completa.
+from datetime import date, timedelta
+
+from sqlalchemy import insert, select
+
+import crud
+import models
+from database import AsyncSessionLocal
+
+RESERVATORIO_ID = 900
+# Fração do volume abaixo da qual vale cada meta. Em fevereiro as metas sobem: o mesmo volume muda de estado
+METAS = {1: (0.10, 0.20, 0.30), 2: (0.20, 0.30, 0.40)}
+
+
+def _leituras(inicio: date, dias: int, percentual: float, volume_hm3=None) -> list:
+    return [{"data": inicio + timedelta(days=i), "volume_percentual": percentual,
+             "volume_hm3": percentual if volume_hm3 is None else volume_hm3, "reservatorio_id": RESERVATORIO_ID}
+            for i in range(dias)]
+
+
+# Lotes acrescentados depois da carga inicial (janeiro: 1-20 em NORMAL e 21-24 em ALERTA)
+LOTES = [
+    # Continua o período em ALERTA, com um volume ausente
+    _leituras(date(2024, 1, 25), 3, 25.0) + [{"data": date(2024, 1, 28), "volume_percentual": 26.0,
+                                              "volume_hm3": None, "reservatorio_id": RESERVATORIO_ID}],
+    # Cruza a fronteira de estado: ALERTA -> SECA
+    _leituras(date(2024, 1, 29), 2, 15.0),
+    # Muda de mês com o mesmo volume: SECA em janeiro, SECA SEVERA com as metas de fevereiro
+    _leituras(date(2024, 1, 31), 4, 15.0),
+    # Uma leitura isolada que volta para NORMAL
+    _leituras(date(2024, 2, 10), 1, 90.0),
+]
+
+
+async def _tabelas(db) -> tuple:
+    historico, periodo = models.HistoricoEstado, models.PeriodoEstado
+    colunas_historico = [getattr(historico, c) for c in crud.HISTORICO_COLUNAS]
+    colunas_periodo = [getattr(periodo, c) for c in crud.PERIODO_COLUNAS]
+    linhas_historico = (await db.execute(
+        select(*colunas_historico).where(historico.reservatorio_id == RESERVATORIO_ID).order_by(historico.data)
+    )).all()
+    linhas_periodo = (await db.execute(
+        select(*colunas_periodo).where(periodo.reservatorio_id == RESERVATORIO_ID).order_by(periodo.inicio)
+    )).all()
+    return [tuple(l) for l in linhas_historico], [tuple(l) for l in linhas_periodo]
+
+
+async def _incremental_e_reconstrucao() -> tuple:
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(models.Reservatorio), [{"id": RESERVATORIO_ID, "nome": "Reservatório Teste Incremental"}])
+        await db.execute(insert(models.VolumeMeta), [
+            {"mes_num": mes, "mes_nome": str(mes), "meta1v": metas[0], "meta2v": metas[1], "meta3v": metas[2],
+             "reservatorio_id": RESERVATORIO_ID}
+            for mes in range(1, 13) for metas in [METAS.get(mes, METAS[1])]])
+        await db.execute(insert(models.Monitoramento),
+                         _leituras(date(2024, 1, 1), 20, 60.0) + _leituras(date(2024, 1, 21), 4, 25.0))
+        await crud.rebuild_history_status(db, RESERVATORIO_ID)
+
+        for lote in LOTES:
+            await db.execute(insert(models.Monitoramento), lote)
+            inseridas = await crud.update_history_status(db, RESERVATORIO_ID, desde=lote[0]["data"])
+            assert inseridas == len(lote)
+        incremental = await _tabelas(db)
+
+        await crud.rebuild_history_status(db, RESERVATORIO_ID)
+        completo = await _tabelas(db)
+        # Nada é gravado: o banco compartilhado pelos testes fica como estava
+        await db.rollback()
+    return incremental, completo
+
+
+def test_atualizacao_incremental_igual_a_reconstrucao(banco, rodar):
+    (historico, periodos), (historico_completo, periodos_completos) = rodar(_incremental_e_reconstrucao())
+
+    assert historico == historico_completo
+    assert periodos == periodos_completos
+    estados = [p[0] for p in periodos]
+    assert estados == ["NORMAL", "ALERTA", "SECA", "SECA SEVERA", "NORMAL"]
+    # O período em ALERTA recebeu as leituras dos lotes em vez de virar um período novo
+    assert periodos[1][1:4] == (date(2024, 1, 21), date(2024, 1, 28), 8)
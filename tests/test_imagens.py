@@ -0,0 +1,70 @@
+# tests/test_imagens.py
+# Quando uma imagem muda, as variantes ganham novos nomes e as antigas são removidas: o ETag, o Last-Modified
+# e o cache de respostas de /identification precisam mudar junto com o manifesto.
+import os
+
+import pytest
+from PIL import Image
+from sqlalchemy import update
+
+import cache
+import imagens
+import models
+from conftest import cliente_api
+from database import AsyncSessionLocal
+
+NOME_IMAGEM = "Açude Teste.png"
+
+
+@pytest.fixture
+def variantes(tmp_path, monkeypatch):
+    """Diretórios temporários de originais e variantes; retorna uma função que (re)gera a imagem de teste."""
+    origem, destino = tmp_path / "images", tmp_path / "variants"
+    origem.mkdir()
+    monkeypatch.setattr(imagens, "DIRETORIO_VARIANTES", str(destino))
+    monkeypatch.setattr(imagens, "_manifesto", None)
+
+    def gerar(cor: tuple, deslocamento_mtime_s: int = 0) -> None:
+        Image.new("RGB", (900, 600), cor).save(origem / NOME_IMAGEM)
+        imagens.gerar_variantes(str(origem), str(destino))
+        # Duas gerações dentro do mesmo tick do relógio do sistema de arquivos teriam o mesmo mtime
+        manifesto = destino / imagens.ARQUIVO_MANIFESTO
+        estado = os.stat(manifesto)
+        os.utime(manifesto, ns=(estado.st_atime_ns, estado.st_mtime_ns + deslocamento_mtime_s * 10 ** 9))
+
+    return gerar
+
+
+async def _com_imagem(reservatorio_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(models.Reservatorio).where(models.Reservatorio.id == reservatorio_id)
+                         .values(nome_imagem=NOME_IMAGEM))
+        await cache.invalidar(db, reservatorio_id)
+        await db.commit()
+
+
+async def _identificacao(reservatorio_id: int, cabecalhos: dict = None):
+    async with cliente_api() as cliente:
+        return await cliente.get(f"/api/reservatorios/{reservatorio_id}/identification", headers=cabecalhos or {})
+
+
+def test_imagem_nova_muda_etag_e_cache(banco, rodar, variantes):
+    reservatorio_id = banco[2]
+    rodar(_com_imagem(reservatorio_id))
+    variantes((200, 30, 30))
+    primeira = rodar(_identificacao(reservatorio_id))
+    assert primeira.status_code == 200
+    srcset = primeira.json()["imagem"]["srcset"]
+    assert rodar(_identificacao(reservatorio_id, {"If-None-Match": primeira.headers["ETag"]})).status_code == 304
+
+    variantes((30, 30, 200), deslocamento_mtime_s=5)
+    por_etag = rodar(_identificacao(reservatorio_id, {"If-None-Match": primeira.headers["ETag"]}))
+    por_data = rodar(_identificacao(reservatorio_id, {"If-Modified-Since": primeira.headers["Last-Modified"]}))
+
+    for resposta in (por_etag, por_data):
+        assert resposta.status_code == 200
+        # A resposta em cache (mesma geração do banco) não é reaproveitada com as URLs antigas
+        assert resposta.json()["imagem"]["srcset"] != srcset
+    assert por_etag.headers["ETag"] != primeira.headers["ETag"]
+    src = por_etag.json()["imagem"]["src"].rsplit("/", 1)[-1]
+    assert os.path.exists(os.path.join(imagens.DIRETORIO_VARIANTES, src))
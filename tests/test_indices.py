@@ -0,0 +1,36 @@
+# tests/test_indices.py
+# As consultas de leitura do crud precisam usar índices (ver migracoes.verificar_indices). No SQLite roda
+# sempre, sobre o banco de testes; no Postgres, com Seq Scan desligado no planejador, só quando
+# TESTES_POSTGRES_URL aponta para um banco descartável (as tabelas e migrações são criadas nele).
+import os
+import subprocess
+import sys
+
+import pytest
+
+import migracoes
+from conftest import RAIZ
+
+TESTES_POSTGRES_URL = os.getenv("TESTES_POSTGRES_URL")
+
+
+def test_consultas_do_crud_usam_indices_sqlite(banco, rodar):
+    assert rodar(migracoes.verificar_indices()) == []
+
+
+@pytest.mark.skipif(not TESTES_POSTGRES_URL, reason="TESTES_POSTGRES_URL não definido")
+def test_consultas_do_crud_sem_seq_scan_postgres():
+    # Processo separado: o engine de database.py é criado na importação a partir de DATABASE_URL
+    ambiente = dict(os.environ, DATABASE_URL=TESTES_POSTGRES_URL)
+    resultado = subprocess.run([sys.executable, "migracoes.py", "--verificar"], cwd=RAIZ, env=ambiente,
+                               capture_output=True, text=True, timeout=300)
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    assert "Seq Scan" not in resultado.stdout
+
+
+def test_varreduras_reconhece_os_planos():
+    sqlite = "SEARCH historico_estado USING INDEX uq_historico (reservatorio_id=?)\nSCAN plano_acao\nSCAN r"
+    assert migracoes._varreduras(sqlite, "sqlite") == ["plano_acao", "r"]
+    assert migracoes._varreduras("SCAN monitoramento USING COVERING INDEX ix_data", "sqlite") == []
+    postgres = "Nested Loop\n  ->  Seq Scan on plano_acao p\n  ->  Index Scan using ix on historico_estado"
+    assert migracoes._varreduras(postgres, "postgresql") == ["plano_acao"]
@@ -0,0 +1,57 @@
+# tests/test_mapa.py
+# Consultas do índice espacial do mapa comparadas com a força bruta (haversine para todos os pontos).
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import mapa
+
+
+def _indice(rng, total: int, lat: tuple, lon: tuple) -> mapa.IndiceEspacial:
+    linhas = [SimpleNamespace(id=i, lat=float(a), long=float(o))
+              for i, (a, o) in enumerate(zip(rng.uniform(*lat, total), rng.uniform(*lon, total)))]
+    return mapa.IndiceEspacial(linhas)
+
+
+# (latitudes, longitudes) dos reservatórios: o Ceará e uma faixa longa em latitude, onde a largura das
+# células em km muda bastante entre o ponto da consulta e a latitude máxima
+REGIOES = [((-8.0, -2.5), (-41.5, -37.0)), ((-60.0, 70.0), (-50.0, -30.0))]
+
+
+@pytest.mark.parametrize("regiao", REGIOES)
+@pytest.mark.parametrize("k", [1, 5, 40])
+def test_vizinhos_iguais_a_forca_bruta(regiao, k):
+    rng = np.random.default_rng(11)
+    indice = _indice(rng, 400, *regiao)
+    (lat_min, lat_max), (lon_min, lon_max) = regiao
+    # Consultas dentro e em volta da região, inclusive fora da grade
+    consultas = zip(rng.uniform(lat_min - 5, lat_max + 5, 100), rng.uniform(lon_min - 5, lon_max + 5, 100))
+    for lat, lon in consultas:
+        posicoes, distancias = indice.vizinhos(lat, lon, k)
+        todas = mapa._distancias_km(lat, lon, indice.lats, indice.lons)
+        esperadas = np.sort(todas)[:k]
+        assert len(posicoes) == k
+        np.testing.assert_allclose(distancias, esperadas, rtol=0, atol=1e-9)
+        np.testing.assert_allclose(todas[posicoes], distancias, rtol=0, atol=1e-9)
+
+
+def test_vizinho_a_leste_acima_da_latitude_dos_dados():
+    # Consulta ao norte de todos os reservatórios: o de leste (60° de longitude adiante) está mais perto que o
+    # do sul, mas fica em anéis mais distantes. Um limite calculado com a largura das células na latitude
+    # dos dados encerraria a busca antes de chegar a ele.
+    linhas = [SimpleNamespace(id=0, lat=43.9, long=0.25), SimpleNamespace(id=1, lat=60.0, long=60.25)]
+    posicoes, distancias = mapa.IndiceEspacial(linhas).vizinhos(70.25, 0.25, 1)
+    assert posicoes.tolist() == [1]
+    assert distancias[0] == pytest.approx(2879.9, abs=0.1)
+
+
+def test_bbox_igual_a_forca_bruta():
+    rng = np.random.default_rng(3)
+    indice = _indice(rng, 400, *REGIOES[0])
+    for _ in range(100):
+        min_lat, max_lat = np.sort(rng.uniform(-9, -1.5, 2))
+        min_lon, max_lon = np.sort(rng.uniform(-42.5, -36, 2))
+        dentro = ((indice.lats >= min_lat) & (indice.lats <= max_lat)
+                  & (indice.lons >= min_lon) & (indice.lons <= max_lon))
+        assert indice.bbox(min_lon, min_lat, max_lon, max_lat).tolist() == np.flatnonzero(dentro).tolist()
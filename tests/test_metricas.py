@@ -0,0 +1,35 @@
+# tests/test_metricas.py
+# Exposição em /metrics: respostas 304 do GET condicional contadas na rota do endpoint e contadores do
+# cache e do pool com TYPE counter.
+from conftest import cliente_api
+
+ROTA = "/api/reservatorios/{reservatorio_id}/identification"
+
+
+async def _nao_modificado_e_metricas(reservatorio_id: int) -> tuple:
+    async with cliente_api() as cliente:
+        primeira = await cliente.get(f"/api/reservatorios/{reservatorio_id}/identification")
+        segunda = await cliente.get(f"/api/reservatorios/{reservatorio_id}/identification",
+                                    headers={"If-None-Match": primeira.headers["ETag"]})
+        metricas = (await cliente.get("/metrics")).text
+    return segunda.status_code, metricas.splitlines()
+
+
+def test_304_contado_na_rota_do_endpoint(banco, rodar):
+    status, linhas = rodar(_nao_modificado_e_metricas(banco[0]))
+
+    assert status == 304
+    assert any(l.startswith(f'dashboard_http_requests_total{{rota="{ROTA}",metodo="GET",status="304"}}')
+               for l in linhas)
+    assert not any('rota="(sem rota)"' in l and 'status="304"' in l for l in linhas)
+
+
+def test_contadores_do_cache_e_do_pool(banco, rodar):
+    _, linhas = rodar(_nao_modificado_e_metricas(banco[0]))
+
+    for nome in ("dashboard_cache_hits_total", "dashboard_cache_misses_total", "dashboard_cache_evictions_total",
+                 "dashboard_db_pool_checkouts_total", "dashboard_db_pool_timeouts_total"):
+        assert f"# TYPE {nome} counter" in linhas
+        assert any(l.startswith(f"{nome} ") for l in linhas)
+    assert "# TYPE dashboard_cache_itens gauge" in linhas
+    assert not any(l.startswith("dashboard_cache_hits ") for l in linhas)
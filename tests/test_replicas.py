@@ -0,0 +1,128 @@
+# tests/test_replicas.py
+# Escolha da réplica de leitura: cópias SQLite do banco de testes fazem o papel das réplicas. Uma réplica em
+# dia é usada sem consultar a primária, uma atrasada cai para a primária e uma inacessível sai do rodízio.
+import os
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import event
+
+import cache
+import database
+from conftest import DIRETORIO_TESTES, cliente_api
+from database import AsyncSessionLocal, Replica
+
+
+def _copiar_banco(nome: str) -> str:
+    """Cópia consistente do banco de testes (inclui o que ainda está no WAL)."""
+    destino = os.path.join(DIRETORIO_TESTES, nome)
+    with sqlite3.connect(database.async_db_url.database) as origem, sqlite3.connect(destino) as copia:
+        origem.backup(copia)
+    return destino
+
+
+@pytest.fixture
+def replicas(banco, rodar, monkeypatch):
+    """Uma réplica em dia com a primária e uma cujo arquivo não pode ser aberto."""
+    monkeypatch.setattr(database, "DB_REPLICA_GERACAO_TTL_SEGUNDOS", 60.0)
+    monkeypatch.setitem(database._geracao_primaria, "geracao", None)
+    em_dia = Replica(0, f"sqlite:///{_copiar_banco('replica0.db')}")
+    morta = Replica(1, f"sqlite:///{os.path.join(DIRETORIO_TESTES, 'inexistente', 'replica1.db')}")
+    yield em_dia, morta
+    for replica in (em_dia, morta):
+        rodar(replica.engine.dispose())
+
+
+async def _abrir(candidatas: list, atualizada: bool = False):
+    sessao, replica = await database.abrir_sessao_leitura(candidatas, atualizada)
+    await sessao.close()
+    return replica
+
+
+def _checkouts_primaria(rodar, corrotina) -> tuple:
+    """Resultado da corrotina e quantas conexões ela pegou do pool da primária."""
+    checkouts = []
+
+    def registrar(*args):
+        checkouts.append(1)
+
+    event.listen(database.engine.sync_engine, "checkout", registrar)
+    try:
+        resultado = rodar(corrotina)
+    finally:
+        event.remove(database.engine.sync_engine, "checkout", registrar)
+    return resultado, len(checkouts)
+
+
+def test_replica_em_dia_sem_ida_a_primaria_por_requisicao(rodar, replicas):
+    em_dia, _ = replicas
+    assert rodar(_abrir([em_dia], atualizada=True)) is em_dia
+
+    # A geração da primária fica guardada no worker: as próximas leituras atualizadas não a consultam
+    for _ in range(5):
+        escolhida, checkouts = _checkouts_primaria(rodar, _abrir([em_dia], atualizada=True))
+        assert escolhida is em_dia
+        assert checkouts == 0
+    assert em_dia.leituras == 6
+
+
+async def _escrever_na_primaria(reservatorio_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await cache.invalidar(db, reservatorio_id)
+        await db.commit()
+
+
+def test_replica_atrasada_cai_para_a_primaria(banco, rodar, replicas):
+    em_dia, _ = replicas
+    assert rodar(_abrir([em_dia], atualizada=True)) is em_dia
+
+    # A escrita deste worker atualiza a geração guardada sem esperar o TTL; a cópia não a recebeu
+    rodar(_escrever_na_primaria(banco[0]))
+    leituras_primaria = database._leituras_primaria["leituras"]
+    assert rodar(_abrir([em_dia], atualizada=True)) is None
+    assert em_dia.atrasada_desde is not None
+
+    # Sem `atualizada` a réplica continua no rodízio enquanto o atraso estiver dentro do limite
+    assert rodar(_abrir([em_dia])) is em_dia
+    em_dia.atrasada_desde = time.monotonic() - database.DB_REPLICA_ATRASO_MAX_SEGUNDOS - 1
+    em_dia.verificada_em = time.monotonic()
+    assert rodar(_abrir([em_dia])) is None
+    assert database._leituras_primaria["leituras"] == leituras_primaria + 2
+
+
+def test_replica_inacessivel_sai_do_rodizio(rodar, replicas):
+    em_dia, morta = replicas
+    assert rodar(_abrir([morta, em_dia])) is em_dia
+    assert morta.falhas == 1
+    assert morta.fora_ate > time.monotonic()
+
+    # Durante a pausa a réplica nem é tentada
+    assert rodar(_abrir([morta])) is None
+    assert rodar(_abrir([morta, em_dia])) is em_dia
+    assert morta.falhas == 1
+
+
+async def _resumo(reservatorio_id: int, cabecalhos: dict = None):
+    async with cliente_api() as cliente:
+        return await cliente.get(f"/api/reservatorios/{reservatorio_id}/dashboard/summary", headers=cabecalhos or {})
+
+
+def test_get_condicional_do_resumo_nao_usa_replica_atrasada(banco, rodar, replicas, monkeypatch):
+    em_dia, _ = replicas
+    monkeypatch.setattr(database, "replicas", [em_dia])
+    reservatorio_id = banco[0]
+    anterior = rodar(_resumo(reservatorio_id))
+    assert anterior.status_code == 200
+    assert em_dia.leituras > 0
+
+    # Depois de uma sincronização na primária, a réplica (cópia) fica com a geração anterior: o ETag antigo
+    # não pode receber 304, e o novo ETag precisa ser o da primária, que é quem responde o corpo
+    rodar(_escrever_na_primaria(reservatorio_id))
+    leituras = em_dia.leituras
+    resposta = rodar(_resumo(reservatorio_id, {"If-None-Match": anterior.headers["ETag"]}))
+    assert resposta.status_code == 200
+    assert resposta.headers["ETag"] != anterior.headers["ETag"]
+    assert em_dia.leituras == leituras
+    monkeypatch.setattr(database, "replicas", [])
+    assert rodar(_resumo(reservatorio_id, {"If-None-Match": resposta.headers["ETag"]})).status_code == 304
@@ -0,0 +1,95 @@
+# tests/test_series.py
+# Paginação por cursor (X-Next-Cursor) dos endpoints de série e redução de pontos por LTTB.
+import numpy as np
+import pandas as pd
+import pytest
+
+import series
+from conftest import cliente_api
+
+
+async def _percorrer(caminho: str, limite: int) -> tuple:
+    """Segue o X-Next-Cursor até a última página; retorna as datas de cada página e as da série inteira."""
+    async with cliente_api() as cliente:
+        completa = (await cliente.get(caminho, params={"format": "columnar"})).json()["Data"]
+        paginas, cursor = [], None
+        while True:
+            parametros = {"format": "columnar", "limit": limite}
+            if cursor:
+                parametros["cursor"] = cursor
+            resposta = await cliente.get(caminho, params=parametros)
+            assert resposta.status_code == 200
+            paginas.append(resposta.json()["Data"])
+            cursor = resposta.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return paginas, completa
+            assert len(paginas) <= len(completa), "o cursor não avança"
+
+
+@pytest.mark.parametrize("rota", ["history", "chart/volume-data"])
+# 73 divide o total de leituras do banco sintético (3 anos): a última página cheia leva a uma página vazia
+@pytest.mark.parametrize("limite", [73, 100])
+def test_cursor_percorre_cada_linha_uma_vez(banco, rodar, rota, limite):
+    paginas, completa = rodar(_percorrer(f"/api/reservatorios/{banco[0]}/{rota}", limite))
+
+    percorridas = [data for pagina in paginas for data in pagina]
+    assert len(percorridas) == len(set(percorridas))
+    assert percorridas == completa
+    assert all(len(pagina) == limite for pagina in paginas[:-1])
+
+
+def _serie(total: int, semente: int = 7) -> tuple:
+    rng = np.random.default_rng(semente)
+    return np.arange(total, dtype=np.float64), np.cumsum(rng.normal(0, 1, total))
+
+
+@pytest.mark.parametrize("total,n_pontos", [(1000, 3), (1000, 100), (1000, 999), (17, 5)])
+def test_lttb_mantem_extremos_e_retorna_n_pontos(total, n_pontos):
+    x, y = _serie(total)
+    indices = series.lttb_indices(x, y, n_pontos)
+
+    assert len(indices) == n_pontos
+    assert indices[0] == 0 and indices[-1] == total - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+@pytest.mark.parametrize("n_pontos", [50, 51, 500])
+def test_lttb_devolve_a_serie_quando_n_nao_reduz(n_pontos):
+    x, y = _serie(50)
+    assert np.array_equal(series.lttb_indices(x, y, n_pontos), np.arange(50))
+
+    df = pd.DataFrame({"data": pd.date_range("2024-01-01", periods=50).date, "volume_hm3": y})
+    assert series.reduzir_pontos(df, n_pontos) is df
+
+
+def test_reduzir_pontos_em_ordem_decrescente():
+    x, y = _serie(400)
+    df = pd.DataFrame({"data": pd.date_range("2024-01-01", periods=400).date[::-1], "volume_hm3": y})
+    reduzido = series.reduzir_pontos(df, 40)
+
+    assert len(reduzido) == 40
+    assert reduzido["data"].iloc[0] == df["data"].iloc[0]
+    assert reduzido["data"].iloc[-1] == df["data"].iloc[-1]
+    assert reduzido["data"].is_monotonic_decreasing
+
+
+@pytest.mark.parametrize("decrescente", [False, True])
+def test_reduzir_pontos_ignora_leituras_sem_volume(decrescente):
+    _, y = _serie(400)
+    y = y - y.min() + 50  # volumes bem acima de zero
+    # Lacunas isoladas e um trecho inteiro sem leituras
+    y[[10, 57, 58, 200, 399]] = np.nan
+    y[120:160] = np.nan
+    df = pd.DataFrame({"data": pd.date_range("2024-01-01", periods=400).date, "volume_hm3": y})
+    if decrescente:
+        df = df.iloc[::-1].reset_index(drop=True)
+    reduzido = series.reduzir_pontos(df, 40)
+
+    assert len(reduzido) == 40
+    assert reduzido["volume_hm3"].notna().all()
+    assert reduzido["volume_hm3"].min() >= 50
+    # Extremos: a primeira e a última leitura com volume, na ordem da entrada
+    com_volume = df.dropna(subset=["volume_hm3"])
+    assert reduzido["data"].iloc[0] == com_volume["data"].iloc[0]
+    assert reduzido["data"].iloc[-1] == com_volume["data"].iloc[-1]
+    assert reduzido["data"].is_monotonic_decreasing if decrescente else reduzido["data"].is_monotonic_increasing
@@ -0,0 +1,70 @@
+# tests/test_simulacao.py
+# A simulação precisa da capacidade (volume / fração da última leitura). Sem ela o endpoint responde 422 em vez
+# de simular um reservatório infinito, com todo cenário em SECA SEVERA e metas atingidas em 0 dias.
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select, update
+
+import cache
+import models
+import simulacao
+from conftest import cliente_api
+from database import AsyncSessionLocal
+
+
+@pytest.fixture(scope="module", autouse=True)
+def pool_de_simulacao():
+    yield
+    simulacao.encerrar()
+
+
+async def _simular(reservatorio_id: int):
+    async with cliente_api() as cliente:
+        return await cliente.get(f"/api/reservatorios/{reservatorio_id}/water-balance/simulation",
+                                 params={"cenarios": 100, "meses": 3, "semente": 1})
+
+
+async def _definir_percentual_da_ultima_leitura(reservatorio_id: int, percentual) -> float:
+    """Troca o volume percentual da última leitura classificada; retorna o valor anterior."""
+    historico = models.HistoricoEstado
+    async with AsyncSessionLocal() as db:
+        ultima = (await db.execute(select(historico).where(historico.reservatorio_id == reservatorio_id)
+                                   .order_by(historico.data.desc()).limit(1))).scalars().one()
+        anterior = ultima.volume_percentual
+        await db.execute(update(historico).where(historico.id == ultima.id).values(volume_percentual=percentual))
+        await cache.invalidar(db, reservatorio_id)
+        await db.commit()
+    return anterior
+
+
+def test_simulacao_com_capacidade(banco, rodar):
+    resposta = rodar(_simular(banco[0]))
+
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    assert corpo["entradas"]["capacidadeHm3"] > 0
+    assert all(mes["volumePercentual"] is not None for mes in corpo["meses"])
+
+
+def test_simulacao_sem_capacidade_responde_422(banco, rodar):
+    reservatorio_id = banco[1]
+    anterior = rodar(_definir_percentual_da_ultima_leitura(reservatorio_id, None))
+    try:
+        resposta = rodar(_simular(reservatorio_id))
+    finally:
+        rodar(_definir_percentual_da_ultima_leitura(reservatorio_id, anterior))
+
+    assert resposta.status_code == 422
+    assert "Capacidade" in resposta.json()["detail"]
+
+
+def test_simular_recusa_capacidade_desconhecida():
+    ultimo = SimpleNamespace(volume_hm3=10.0, volume_percentual=None, data=date(2024, 1, 15))
+    balanco = [SimpleNamespace(mes="jan", afluencia_m3s=1.0, evaporacao_m3s=0.1, demandas_m3s=0.5)]
+    entradas = simulacao.montar_entradas(ultimo, balanco, [], None, cenarios=100, meses=3)
+
+    assert entradas["capacidade_hm3"] is None
+    with pytest.raises(ValueError, match="Capacidade"):
+        simulacao.simular(entradas)